@@ -0,0 +1,209 @@
+"""Benchmark ssdvgg_utils post-processing
+
+Compare ssdvgg_utils.postprocess and postprocess_batch with the former per
+layer decode and Python NMS loop, and check that the outputs are the same.
+The network outputs are read from .npz files, one per image, saved with
+``np.savez(path, *outputs)`` from the 12 arrays returned by
+PredictionClient.score_numpy_arrays, or generated with a fixed seed.
+
+    python3 benchmark_ssdvgg_utils.py [outputs.npz ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import ssdvgg_utils
+
+N_IMAGES = 64
+BATCH_SIZE = 8
+N_CLASSES = 21
+N_OBJECTS = 12
+SELECT_THRESHOLDS = [0.5, 0.4, 0.1, 0]
+LAYERS_SHAPE = [
+    [37, 37, 4],
+    [19, 19, 6],
+    [10, 10, 6],
+    [5, 5, 6],
+    [3, 3, 4],
+    [1, 1, 4]]
+
+
+def legacy_decode_layer_boxes(localizations, anchor_bboxes,
+                              prior_scaling=[0.1, 0.1, 0.2, 0.2]):
+    l_shape = localizations.shape
+    localizations = np.reshape(localizations,
+                               (-1, l_shape[-2], l_shape[-1]))
+    yref, xref, href, wref = anchor_bboxes
+    xref = np.reshape(xref, [-1, 1])
+    yref = np.reshape(yref, [-1, 1])
+
+    cx = localizations[:, :, 0] * wref * prior_scaling[0] + xref
+    cy = localizations[:, :, 1] * href * prior_scaling[1] + yref
+    w = wref * np.exp(localizations[:, :, 2] * prior_scaling[2])
+    h = href * np.exp(localizations[:, :, 3] * prior_scaling[3])
+    bboxes = np.zeros_like(localizations)
+    bboxes[:, :, 0] = cy - h / 2.
+    bboxes[:, :, 1] = cx - w / 2.
+    bboxes[:, :, 2] = cy + h / 2.
+    bboxes[:, :, 3] = cx + w / 2.
+    return np.reshape(bboxes, l_shape)
+
+
+def legacy_select_layer_boxes(predictions, localizations, anchors,
+                              select_threshold):
+    localizations = legacy_decode_layer_boxes(localizations, anchors)
+
+    p_shape = predictions.shape
+    batch_size = p_shape[0] if len(p_shape) == 5 else 1
+    predictions = np.reshape(predictions, (batch_size, -1, p_shape[-1]))
+    l_shape = localizations.shape
+    localizations = np.reshape(localizations, (batch_size, -1, l_shape[-1]))
+
+    if select_threshold is None or select_threshold == 0:
+        classes = np.argmax(predictions, axis=2)
+        scores = np.amax(predictions, axis=2)
+        mask = (classes > 0)
+        classes = classes[mask]
+        scores = scores[mask]
+        bboxes = localizations[mask]
+    else:
+        sub_predictions = predictions[:, :, 1:]
+        idxes = np.where(sub_predictions > select_threshold)
+        classes = idxes[-1]+1
+        scores = sub_predictions[idxes]
+        bboxes = localizations[idxes[:-1]]
+
+    return classes, scores, bboxes
+
+
+def legacy_select_bboxes(classes, scores, bboxes, nms_threshold=0.45):
+    keep_bboxes = np.ones(scores.shape, dtype=bool)
+    for i in range(scores.size-1):
+        if keep_bboxes[i]:
+            overlap = ssdvgg_utils.jaccard_bboxes(bboxes[i], bboxes[(i+1):])
+            keep_overlap = np.logical_or(
+                overlap < nms_threshold, classes[(i+1):] != classes[i])
+            keep_bboxes[(i+1):] = np.logical_and(keep_bboxes[(i+1):],
+                                                 keep_overlap)
+
+    idxes = np.where(keep_bboxes)
+    return classes[idxes], scores[idxes], bboxes[idxes]
+
+
+def legacy_postprocess(network_output, ssd_anchors, select_threshold):
+    """The former postprocess, for one image."""
+    rbbox_img = [0.0, 0.0, 1.0, 1.0]
+    l_classes = []
+    l_scores = []
+    l_bboxes = []
+    for i in range(6):
+        classes, scores, bboxes = legacy_select_layer_boxes(
+            ssdvgg_utils.softmax(network_output[i], axis=4),
+            network_output[6 + i], ssd_anchors[i], select_threshold)
+        l_classes.append(classes)
+        l_scores.append(scores)
+        l_bboxes.append(bboxes)
+
+    classes = np.concatenate(l_classes, 0)
+    scores = np.concatenate(l_scores, 0)
+    bboxes = np.concatenate(l_bboxes, 0)
+    bboxes = ssdvgg_utils.clip_bboxes(rbbox_img, bboxes)
+    classes, scores, bboxes = ssdvgg_utils.sort_bboxes(
+        classes, scores, bboxes, top_k=400)
+    classes, scores, bboxes = legacy_select_bboxes(
+        classes, scores, bboxes, nms_threshold=0.45)
+    bboxes = ssdvgg_utils.resize_boxes(rbbox_img, bboxes)
+    return classes, scores, bboxes
+
+
+def make_network_output(rng, batch_size):
+    """Mostly background, with objects seen by the anchors around them."""
+    predictions = []
+    localizations = []
+    centers = rng.uniform(0, 1, (batch_size, N_OBJECTS, 2))
+    labels = rng.randint(1, N_CLASSES, (batch_size, N_OBJECTS))
+    for height, width, n_anchors in LAYERS_SHAPE:
+        logits = rng.normal(0, 1, (batch_size, height, width, n_anchors,
+                                   N_CLASSES)).astype(np.float32)
+        logits[..., 0] += 4
+        y = (np.arange(height) + 0.5) / height
+        x = (np.arange(width) + 0.5) / width
+        for b in range(batch_size):
+            for (cy, cx), label in zip(centers[b], labels[b]):
+                near = ((np.abs(y - cy)[:, None] < 0.15)
+                        & (np.abs(x - cx)[None, :] < 0.15))
+                boost = rng.normal(6, 2, (near.sum(), n_anchors))
+                logits[b][near, :, label] += boost.astype(np.float32)
+        predictions.append(logits)
+        localizations.append(rng.normal(0, 0.2, (
+            batch_size, height, width, n_anchors, 4)).astype(np.float32))
+    return predictions + localizations
+
+
+def load_network_outputs(paths):
+    outputs = []
+    for path in paths:
+        recorded = np.load(path)
+        outputs.append([recorded[key] for key in sorted(
+            recorded.files, key=lambda k: int(k.split('_')[-1]))])
+    return outputs
+
+
+def split_images(network_output):
+    return [[out[b:b + 1] for out in network_output]
+            for b in range(network_output[0].shape[0])]
+
+
+def assert_same(result, expected):
+    for value, expected_value in zip(result, expected):
+        assert value.dtype == expected_value.dtype
+        assert np.array_equal(value, expected_value)
+
+
+def benchmark(name, n_images, run):
+    start = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - start
+    print("  {:<22}: {:8.2f} ms/image".format(name, elapsed * 1000 / n_images))
+    return results
+
+
+def main():
+    ssd_anchors = ssdvgg_utils.compute_anchors()
+    if len(sys.argv) > 1:
+        images = load_network_outputs(sys.argv[1:])
+        batches = []
+    else:
+        rng = np.random.RandomState(0)
+        batches = [make_network_output(rng, BATCH_SIZE)
+                   for _ in range(N_IMAGES // BATCH_SIZE)]
+        images = [image for batch in batches for image in split_images(batch)]
+
+    for select_threshold in SELECT_THRESHOLDS:
+        print("==== select_threshold {}, {} images ====".format(
+            select_threshold, len(images)))
+        expected = benchmark("former", len(images), lambda: [
+            legacy_postprocess(image, ssd_anchors, select_threshold)
+            for image in images])
+        print("  detections            : {:.1f}/image".format(
+            np.mean([len(classes) for classes, _, _ in expected])))
+        results = benchmark("postprocess", len(images), lambda: [
+            ssdvgg_utils.postprocess(image, select_threshold=select_threshold)
+            for image in images])
+        for result, expected_result in zip(results, expected):
+            assert_same(result, expected_result)
+        if batches:
+            results = benchmark(
+                "postprocess_batch({})".format(BATCH_SIZE), len(images),
+                lambda: [result for batch in batches
+                         for result in ssdvgg_utils.postprocess_batch(
+                             batch, select_threshold=select_threshold)])
+            for result, expected_result in zip(results, expected):
+                assert_same(result, expected_result)
+        print("  outputs               : identical")
+
+
+if __name__ == '__main__':
+    main()
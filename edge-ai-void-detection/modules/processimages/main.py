@@ -11,6 +11,7 @@ import threading
 import ssdvgg_utils
 from client import PredictionClient
 from blob import BlobUploader
+from telemetry import TelemetryAggregator
 import pprint
 import grpc
 import cv2
@@ -25,6 +26,7 @@ import requests
 import traceback
 import base64
 import json
+import math
 import uuid
 import importlib
 # from PIL import Image
@@ -39,6 +41,9 @@ from datetime import datetime
 # By default, messages do not expire.
 MESSAGE_TIMEOUT = 20000
 
+# telemetryWindowSeconds twin property is clamped to this
+MINIMUM_TELEMETRY_WINDOW_IN_SECONDS = 1
+
 # global counters
 RECEIVE_CALLBACKS = 0
 SEND_CALLBACKS = 0
@@ -70,6 +75,8 @@ blob_uploader = None
 data_destination = "redis"
 camera_id = ""
 twin_metadata_last_updated = "not initialized"
+# Recognitions are sent as one "recognition-batch;v1" message per window
+telemetry_aggregator = None
 
 # Don't allow too many unacknowledged messages to build up
 outstanding_sent_message_count = 0
@@ -145,6 +152,18 @@ def parse_module_twin(twin):
     if id is not None:
         camera_id = id
         print("Set camera_id to {}".format(camera_id))
+    window = get_twin_property(twin, "telemetryWindowSeconds")
+    if window is not None and telemetry_aggregator is not None:
+        try:
+            window = float(window)
+            if not math.isfinite(window):
+                raise ValueError(window)
+            telemetry_aggregator.window = max(
+                window, MINIMUM_TELEMETRY_WINDOW_IN_SECONDS)
+            print("Set telemetry window to {}".format(telemetry_aggregator.window))
+        except (TypeError, ValueError):
+            print("telemetryWindowSeconds must be a number, got {}, keeping {}".format(
+                window, telemetry_aggregator.window))
 
 # Ensure 3 digits of milliseconds: 2019-07-25T16:16:06.756Z
 def make_time_string(time=None):
@@ -189,7 +208,7 @@ def score_single_image(hub_manager, file_path):
             img = np.asarray(img, dtype=np.float32)
             img = np.expand_dims(img, axis=0)
             result = client.score_numpy_arrays({'brainwave_ssd_vgg_1_Version_0.1_input_1:0':img}, outputs=tensor_outputs)
-            classes, scores, bboxes = ssdvgg_utils.postprocess(result, select_threshold=0.4)
+            classes, scores, bboxes = ssdvgg_utils.postprocess(result, select_threshold=0.5)
             processed_results = {}
             processed_results["classes"] = classes.tolist()
             processed_results["scores"] = scores.tolist()
@@ -213,19 +232,12 @@ def score_single_image(hub_manager, file_path):
                     message["procMsec"] = (time.time() - start) * 1000.0
                     message["featureCount"] = len(classes.tolist())
                     send_iot_hub_message(hub_manager, message, "image-upload;v1")
-                # send a recognition message for each bounding box
-                for i in range(len(processed_results["classes"])):
-                    message = {}
-                    message["cameraId"] = camera_id
-                    message["time"] = camera_time
-                    message["cls"] = processed_results["classes"][i]
-                    message["score"] = processed_results["scores"][i]
-                    message["bbymin"] = processed_results["bboxes"][i][0]
-                    message["bbxmin"] = processed_results["bboxes"][i][1]
-                    message["bbymax"] = processed_results["bboxes"][i][2]
-                    message["bbxmax"] = processed_results["bboxes"][i][3]
-                    t2 = time.time()
-                    send_iot_hub_message(hub_manager, message, "recognition;v1")
+                # recognitions are batched per window
+                telemetry_aggregator.add(camera_id, camera_time, zip(
+                    processed_results["classes"],
+                    processed_results["scores"],
+                    processed_results["bboxes"]))
+                t2 = time.time()
             else:  # data_destination == "redis"
                 print("Sending data to redis")
                 messages = {}
@@ -280,10 +292,14 @@ class HubManager(object):
             outputQueueName, event, send_confirmation_callback, send_context)
 
 def main(protocol):
+    global telemetry_aggregator
     try:
         print ( "\nPython %s\n" % sys.version )
         print ( "IoT Hub Client for Python" )
 
+        # created first, the twin callback sets its window
+        telemetry_aggregator = TelemetryAggregator(
+            lambda message: send_iot_hub_message(hub_manager, message, "recognition-batch;v1"))
         hub_manager = HubManager(protocol)
 
         #print ( "Starting the IoT Hub Python sample using protocol %s..." % hub_manager.client_protocol )
@@ -113,74 +113,55 @@ def compute_anchors(img_shape=(300, 300)):
     return anchors
 
 
-def decode_layer_boxes(localizations,
-                       anchor_bboxes,
-                       prior_scaling=[0.1, 0.1, 0.2, 0.2]):
-    """Compute the relative bounding boxes from the layer features and
-    reference anchor bounding boxes.
+# img_shape => (anchors of compute_anchors, flat anchors)
+_anchors_cache = {}
 
-    Return:
-      numpy array Nx4: ymin, xmin, ymax, xmax
-    """
-    # Reshape for easier broadcasting.
-    l_shape = localizations.shape
-    localizations = np.reshape(localizations,
-                               (-1, l_shape[-2], l_shape[-1]))
-    yref, xref, href, wref = anchor_bboxes
-    xref = np.reshape(xref, [-1, 1])
-    yref = np.reshape(yref, [-1, 1])
-
-    # Compute center, height and width
-    cx = localizations[:, :, 0] * wref * prior_scaling[0] + xref
-    cy = localizations[:, :, 1] * href * prior_scaling[1] + yref
-    w = wref * np.exp(localizations[:, :, 2] * prior_scaling[2])
-    h = href * np.exp(localizations[:, :, 3] * prior_scaling[3])
-    # bboxes: ymin, xmin, xmax, ymax.
-    bboxes = np.zeros_like(localizations)
-    bboxes[:, :, 0] = cy - h / 2.
-    bboxes[:, :, 1] = cx - w / 2.
-    bboxes[:, :, 2] = cy + h / 2.
-    bboxes[:, :, 3] = cx + w / 2.
-    # Back to original shape.
-    bboxes = np.reshape(bboxes, l_shape)
-
-    return bboxes
 
-
-def select_layer_boxes(predictions, localizations, anchors,
-                       select_threshold, img_shape, num_classes):
-    """Extract classes, scores and bounding boxes from features in one layer.
+def flatten_anchors(anchors):
+    """
+    Flatten the anchors of all layers in the order of the network outputs.
 
     Return:
-      classes, scores, bboxes: Numpy arrays...
+      numpy array 4xN: y, x, h, w of each anchor box.
     """
+    flat = []
+    for y, x, h, w in anchors:
+        shape = y.shape[:-1] + h.shape
+        flat.append([np.broadcast_to(ref, shape).ravel()
+                     for ref in (y, x, h, w)])
+    return np.concatenate(flat, axis=1)
 
-    localizations = decode_layer_boxes(localizations, anchors)
 
-    # Reshape features to: Batches x N x N_labels | 4.
-    p_shape = predictions.shape
-    batch_size = p_shape[0] if len(p_shape) == 5 else 1
-    predictions = np.reshape(predictions, (batch_size, -1, p_shape[-1]))
-    l_shape = localizations.shape
-    localizations = np.reshape(localizations, (batch_size, -1, l_shape[-1]))
+def get_anchors(img_shape=(300, 300)):
+    """
+    Return the anchors of compute_anchors and their flattened version,
+    computed once per image shape.
+    """
+    img_shape = tuple(img_shape)
+    if img_shape not in _anchors_cache:
+        anchors = compute_anchors(img_shape)
+        _anchors_cache[img_shape] = (anchors, flatten_anchors(anchors))
+    return _anchors_cache[img_shape]
 
-    # Boxes selection: use threshold or score > no-label criteria.
-    if select_threshold is None or select_threshold == 0:
-        # Class prediction and scores: assign 0. to 0-class
-        classes = np.argmax(predictions, axis=2)
-        scores = np.amax(predictions, axis=2)
-        mask = (classes > 0)
-        classes = classes[mask]
-        scores = scores[mask]
-        bboxes = localizations[mask]
-    else:
-        sub_predictions = predictions[:, :, 1:]
-        idxes = np.where(sub_predictions > select_threshold)
-        classes = idxes[-1]+1
-        scores = sub_predictions[idxes]
-        bboxes = localizations[idxes[:-1]]
 
-    return classes, scores, bboxes
+def decode_boxes(localizations, anchors,
+                 prior_scaling=[0.1, 0.1, 0.2, 0.2]):
+    """Compute the relative bounding boxes from the features and the
+    flattened reference anchor bounding boxes.
+
+    Arguments:
+      localizations: numpy array ...xNx4;
+      anchors: numpy array 4xN, see flatten_anchors.
+    Return:
+      numpy array ...xNx4: ymin, xmin, ymax, xmax
+    """
+    yref, xref, href, wref = anchors
+    cx = localizations[..., 0] * wref * prior_scaling[0] + xref
+    cy = localizations[..., 1] * href * prior_scaling[1] + yref
+    w = wref * np.exp(localizations[..., 2] * prior_scaling[2])
+    h = href * np.exp(localizations[..., 3] * prior_scaling[3])
+    return np.stack([cy - h / 2., cx - w / 2., cy + h / 2., cx + w / 2.],
+                    axis=-1).astype(localizations.dtype, copy=False)
 
 
 def clip_bboxes(bbox_ref, bboxes):
@@ -239,17 +220,24 @@ def jaccard_bboxes(bboxes1, bboxes2):
 
 def select_bboxes(classes, scores, bboxes, nms_threshold=0.45):
     """Apply non-maximum selection to bounding boxes.
+
+    Boxes only suppress boxes of their class: the overlaps of the boxes of
+    each class are computed at once, and a box which is kept suppresses the
+    following ones it overlaps.
     """
-    keep_bboxes = np.ones(scores.shape, dtype=np.bool)
-    for i in range(scores.size-1):
-        if keep_bboxes[i]:
-            # Computer overlap with bboxes which are following.
-            overlap = jaccard_bboxes(bboxes[i], bboxes[(i+1):])
-            # Overlap threshold for keeping + checking part of the same class
-            keep_overlap = np.logical_or(
-                overlap < nms_threshold, classes[(i+1):] != classes[i])
-            keep_bboxes[(i+1):] = np.logical_and(keep_bboxes[(i+1):],
-                                                 keep_overlap)
+    keep_bboxes = np.zeros(scores.shape, dtype=bool)
+    for cls in np.unique(classes):
+        idxes = np.where(classes == cls)[0]
+        cls_bboxes = bboxes[idxes]
+        overlap = jaccard_bboxes(cls_bboxes[:, np.newaxis],
+                                 cls_bboxes[np.newaxis])
+        # Overlap threshold for suppressing the following boxes
+        suppress = np.triu(np.logical_not(overlap < nms_threshold), k=1)
+        keep = np.ones(idxes.shape, dtype=bool)
+        for i in range(idxes.size-1):
+            if keep[i]:
+                keep &= np.logical_not(suppress[i])
+        keep_bboxes[idxes] = keep
 
     idxes = np.where(keep_bboxes)
     return classes[idxes], scores[idxes], bboxes[idxes]
@@ -280,51 +268,118 @@ def softmax(x, axis):
     e_x = np.exp(x - np.expand_dims(np.max(x, axis=axis), axis))
     return e_x / np.expand_dims(np.sum(e_x, axis=axis), axis)
 
-def extract_detections(predictions, localizations, ssd_anchors,
-                       select_threshold=0.5, img_shape=(300, 300), num_classes=21):
-    """Extract classes, scores and bounding boxes from network output layers.
+def select_boxes(predictions, localizations, anchors, select_threshold):
+    """Extract classes, scores and bounding boxes from the features of all
+    the layers of one image.
 
+    Arguments:
+      predictions: numpy array NxN_labels, softmax scores;
+      localizations: numpy array Nx4;
+      anchors: numpy array 4xN, see flatten_anchors.
     Return:
       classes, scores, bboxes: Numpy arrays...
     """
-    l_classes = []
-    l_scores = []
-    l_bboxes = []
+    # Boxes selection: use threshold or score > no-label criteria.
+    if select_threshold is None or select_threshold == 0:
+        # Class prediction and scores: assign 0. to 0-class
+        classes = np.argmax(predictions, axis=1)
+        scores = np.amax(predictions, axis=1)
+        idxes = np.where(classes > 0)[0]
+        classes = classes[idxes]
+        scores = scores[idxes]
+    else:
+        sub_predictions = predictions[:, 1:]
+        idxes, classes = np.where(sub_predictions > select_threshold)
+        scores = sub_predictions[idxes, classes]
+        classes = classes+1
+
+    # Only the selected boxes are decoded
+    bboxes = decode_boxes(localizations[idxes], anchors[:, idxes])
+    return classes, scores, bboxes
+
+
+def extract_batch_detections(predictions, localizations, anchors,
+                             select_threshold=0.5, nms_threshold=0.45,
+                             top_k=400):
+    """Extract classes, scores and bounding boxes of each image from network
+    output layers.
+
+    Arguments:
+      predictions: list of numpy arrays BxHxWxAxN_labels, one by layer;
+      localizations: list of numpy arrays BxHxWxAx4, one by layer;
+      anchors: numpy array 4xN, see flatten_anchors.
+    Return:
+      list of classes, scores, bboxes: Numpy arrays..., one by image.
+    """
     rbbox_img = [0.0, 0.0, 1.0, 1.0]
+    batch_size = predictions[0].shape[0]
 
+    # All the layers at once: Batches x N x N_labels | 4.
+    predictions = np.concatenate(
+        [np.reshape(p, (batch_size, -1, p.shape[-1])) for p in predictions], 1)
+    localizations = np.concatenate(
+        [np.reshape(l, (batch_size, -1, l.shape[-1])) for l in localizations], 1)
 
-    for i in range(len(predictions)):
-        classes, scores, bboxes = select_layer_boxes(
-            softmax(predictions[i], axis=4), localizations[i], ssd_anchors[i],
-            select_threshold, img_shape, num_classes)
-        l_classes.append(classes)
-        l_scores.append(scores)
-        l_bboxes.append(bboxes)
+    detections = []
+    for b in range(batch_size):
+        classes, scores, bboxes = select_boxes(
+            softmax(predictions[b], axis=1), localizations[b], anchors,
+            select_threshold)
+        bboxes = clip_bboxes(rbbox_img, bboxes)
 
-    classes = np.concatenate(l_classes, 0)
-    scores = np.concatenate(l_scores, 0)
-    bboxes = np.concatenate(l_bboxes, 0)
+        classes, scores, bboxes = sort_bboxes(classes, scores, bboxes, top_k=top_k)
+        classes, scores, bboxes = select_bboxes(
+            classes, scores, bboxes, nms_threshold=nms_threshold)
+        bboxes = resize_boxes(rbbox_img, bboxes)
+        detections.append((classes, scores, bboxes))
 
-    bboxes = clip_bboxes(rbbox_img, bboxes)
+    return detections
 
-    classes, scores, bboxes = sort_bboxes(classes, scores, bboxes, top_k=400)
-    classes, scores, bboxes = select_bboxes(
-        classes, scores, bboxes, nms_threshold=0.45)
-    bboxes = resize_boxes(rbbox_img, bboxes)
 
-    return classes, scores, bboxes
+def extract_detections(predictions, localizations, ssd_anchors,
+                       select_threshold=0.5, img_shape=(300, 300), num_classes=21):
+    """Extract classes, scores and bounding boxes from network output layers
+    of one image.
 
-def postprocess(network_output, ssd_anchors = compute_anchors(), select_threshold=0.5, nms_threshold=.45):
-    predictions = []
-    localisations = []
+    Return:
+      classes, scores, bboxes: Numpy arrays...
+    """
+    return extract_batch_detections(
+        predictions, localizations, flatten_anchors(ssd_anchors),
+        select_threshold)[0]
+
+
+def postprocess_batch(network_output, ssd_anchors=None, select_threshold=0.5,
+                      nms_threshold=.45, img_shape=(300, 300)):
+    """Post-process the 12 network outputs of a batch of images.
+
+    Return:
+      list of classes, scores, bboxes: Numpy arrays..., one by image.
+    """
+    if ssd_anchors is None:
+        _, anchors = get_anchors(img_shape)
+    else:
+        anchors = flatten_anchors(ssd_anchors)
+    return extract_batch_detections(
+        network_output[0:6], network_output[6:12], anchors,
+        select_threshold=select_threshold, nms_threshold=nms_threshold)
+
+
+def postprocess(network_output, ssd_anchors=None, select_threshold=0.5,
+                nms_threshold=.45, img_shape=(300, 300)):
+    """Post-process the 12 network outputs of one image.
 
+    Return:
+      classes, scores, bboxes: Numpy arrays...
+    """
     has_batch_dim = (len(network_output[0].shape) == 5)
     if not has_batch_dim:
-        for out in network_output:
-            out = np.expand_dims(out, axis=0)
-            assert len(out.shape) == 5
+        network_output = [np.expand_dims(out, axis=0) for out in network_output]
+    if network_output[0].shape[0] != 1:
+        raise ValueError("postprocess takes one image, use postprocess_batch")
 
-    return extract_detections(network_output[0:6], network_output[6:12], ssd_anchors)
+    return postprocess_batch(network_output, ssd_anchors, select_threshold,
+                             nms_threshold, img_shape)[0]
 
 if __name__ == "__main__":
     print("Done!")
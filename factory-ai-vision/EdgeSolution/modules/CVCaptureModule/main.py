@@ -40,6 +40,15 @@ async def index():
     return {"number_of_streams": number_of_streams, "infos": infos}
 
 
+@app.get("/metrics")
+async def metrics():
+    """metrics.
+
+    Input / decoded / sent FPS and dropped frames of every stream
+    """
+    return {"metrics": [stream.get_metrics() for stream in stream_manager.get_streams()]}
+
+
 @app.get("/delete_stream/{stream_id}")
 async def delete_stream(stream_id):
     stream_manager.delete_stream(stream_id)
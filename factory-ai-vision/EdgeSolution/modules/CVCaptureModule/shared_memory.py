@@ -0,0 +1,87 @@
+import logging
+import mmap
+import os
+import struct
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SHM_FILE_PATH = "/dev/shm"
+
+# Each slot: [sequence number (uint64)][raw BGR frame]
+# Keep in sync with InferenceModule/shared_memory.py
+SLOT_HEADER = struct.Struct("<Q")
+
+
+class SharedMemoryFrameRing:
+    """Ring of fixed-size frame slots in /dev/shm.
+
+    The writer fills slot `seq % num_slots` and publishes a small
+    descriptor, the reader maps the slot without copying. A slot stays
+    valid until the ring wraps around, the reader compares the header with
+    the descriptor sequence number to detect overwritten slots. A ring
+    recreated with the same name gets a new generation, so the reader
+    maps the new file.
+    """
+
+    def __init__(self, name, slot_size, num_slots=4):
+        self.name = name
+        self.num_slots = num_slots
+        self.slot_size = SLOT_HEADER.size + slot_size
+        self.size = self.slot_size * self.num_slots
+        self.full_path = os.path.join(SHM_FILE_PATH, self.name)
+        self.seq = 0
+        self.generation = uuid.uuid4().hex
+
+        self._fd = os.open(self.full_path, os.O_CREAT | os.O_RDWR)
+        os.ftruncate(self._fd, self.size)
+        self._shm = mmap.mmap(
+            self._fd, self.size, mmap.MAP_SHARED, mmap.PROT_WRITE | mmap.PROT_READ
+        )
+        logger.info(
+            "Shared memory frame ring: %s, %s slots of %s bytes",
+            self.full_path,
+            self.num_slots,
+            self.slot_size,
+        )
+
+    def fits(self, img):
+        return SLOT_HEADER.size + img.nbytes <= self.slot_size
+
+    def write_frame(self, img):
+        """Copy a frame into the next slot.
+
+        Returns:
+            descriptor (dict) of the written frame
+        """
+        self.seq += 1
+        slot = self.seq % self.num_slots
+        slot_offset = slot * self.slot_size
+        offset = slot_offset + SLOT_HEADER.size
+
+        # invalidate the slot while it is being written
+        SLOT_HEADER.pack_into(self._shm, slot_offset, 0)
+        frame = np.ndarray(img.shape, dtype=img.dtype, buffer=self._shm, offset=offset)
+        np.copyto(frame, img)
+        SLOT_HEADER.pack_into(self._shm, slot_offset, self.seq)
+
+        return {
+            "shm_name": self.name,
+            "shm_size": self.size,
+            "shm_generation": self.generation,
+            "slot": slot,
+            "seq": self.seq,
+            "offset": offset,
+            "length": img.nbytes,
+            "shape": list(img.shape),
+        }
+
+    def close(self):
+        try:
+            self._shm.close()
+            os.close(self._fd)
+            os.remove(self.full_path)
+        except OSError:
+            logger.warning("Failed to remove shared memory %s", self.full_path)
@@ -9,12 +9,21 @@ import cv2
 import numpy as np
 import requests
 
+from shared_memory import SharedMemoryFrameRing
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 IMG_WIDTH = 960
 IMG_HEIGHT = 540
 
+# Frame transport to InferenceModule: http, zmq or shm
+CV_TRANSPORT = os.environ.get("CV_TRANSPORT", "http")
+SHM_NUM_SLOTS = int(os.environ.get("SHM_NUM_SLOTS", "4"))
+# grab: grab every frame, decode only the ones to send; read: read every frame
+CAPTURE_MODE = os.environ.get("CAPTURE_MODE", "grab")
+METRICS_WINDOW = 5  # seconds
+
 
 class Stream:
     def __init__(self, cam_id, cam_source, fps, endpoint, sender):
@@ -41,9 +50,23 @@ class Stream:
         self.last_update = None
         self.last_send = None
 
+        # capture metrics
+        self.grabbed_num = 0
+        self.decoded_num = 0
+        self.sent_num = 0
+        self.input_fps = 0
+        self.decoded_fps = 0
+        self.sent_fps = 0
+        self._metrics_window = (time.time(), 0, 0, 0)
+
         self.zmq_sender = sender
-        self.start_http()
-        # self.start_zmq()
+        self.frame_ring = None
+        if CV_TRANSPORT == "shm":
+            self.start_shm()
+        elif CV_TRANSPORT == "zmq":
+            self.start_zmq()
+        else:
+            self.start_http()
 
     def start_http(self):
         def _new_streaming(self):
@@ -63,6 +86,9 @@ class Stream:
                 cnt += 1
                 is_ok, img = self.cam.read()
                 if is_ok:
+                    self.grabbed_num += 1
+                    self.decoded_num += 1
+                    self.update_capture_metrics()
 
                     width = IMG_WIDTH
                     ratio = IMG_WIDTH / img.shape[1]
@@ -108,9 +134,13 @@ class Stream:
                 data = self.last_img.tobytes()
                 res = requests.post(endpoint, data=data)
                 self.last_send = self.last_update
+                self.sent_num += 1
                 time.sleep(1 / self.fps)
 
-        threading.Thread(target=_new_streaming, args=(self,), daemon=True).start()
+        if CAPTURE_MODE == "grab":
+            threading.Thread(target=self.run_grab_capture, daemon=True).start()
+        else:
+            threading.Thread(target=_new_streaming, args=(self,), daemon=True).start()
         threading.Thread(target=run_send, args=(self,), daemon=True).start()
 
     def start_zmq(self):
@@ -124,6 +154,9 @@ class Stream:
             while self.cam_is_alive:
                 is_ok, img = self.cam.read()
                 if is_ok:
+                    self.grabbed_num += 1
+                    self.decoded_num += 1
+                    self.update_capture_metrics()
 
                     width = IMG_WIDTH
                     ratio = IMG_WIDTH / img.shape[1]
@@ -169,11 +202,172 @@ class Stream:
                     ]
                 )
                 self.last_send = self.last_update
+                self.sent_num += 1
+                time.sleep(1 / self.fps)
+
+        if CAPTURE_MODE == "grab":
+            threading.Thread(target=self.run_grab_capture, daemon=True).start()
+        else:
+            threading.Thread(target=run_capture, args=(self,), daemon=True).start()
+        threading.Thread(target=run_send, args=(self,), daemon=True).start()
+
+    def start_shm(self):
+        """start_shm.
+
+        Capture like start_zmq, but write raw frames into a shared memory
+        ring and only publish the slot descriptor through zmq.
+        """
+
+        def run_capture(self):
+
+            if self.cam_source == "0":
+                self.cam = cv2.VideoCapture(0)
+            else:
+                self.cam = cv2.VideoCapture(self.cam_source)
+            while self.cam_is_alive:
+                is_ok, img = self.cam.read()
+                if is_ok:
+                    self.grabbed_num += 1
+                    self.decoded_num += 1
+                    self.update_capture_metrics()
+
+                    width = IMG_WIDTH
+                    ratio = IMG_WIDTH / img.shape[1]
+                    height = int(img.shape[0] * ratio + 0.000001)
+
+                    img = cv2.resize(img, (width, height))
+                    self.last_img = img
+                    self.last_update = time.time()
+
+                    time.sleep(1 / self.fps)
+                else:
+                    time.sleep(1)
+                    self.restart_cam()
+            logger.warning("Stream {} finished".format(self.cam_id))
+
+        def run_send(self):
+            cnt = 0
+            while self.cam_is_alive:
+                if self.last_img is None:
+                    logger.warning("stream {} img not ready".format(self.cam_id))
+                    time.sleep(1)
+                    continue
+                if self.last_send == self.last_update:
+                    time.sleep(1 / self.fps)
+                    continue
+                cnt += 1
+                img = self.last_img
+                last_update = self.last_update
+                if self.frame_ring is None or not self.frame_ring.fits(img):
+                    if self.frame_ring:
+                        self.frame_ring.close()
+                    self.frame_ring = SharedMemoryFrameRing(
+                        "cvcapture_" + self.cam_id, img.nbytes, SHM_NUM_SLOTS
+                    )
+                descriptor = self.frame_ring.write_frame(img)
+                descriptor["stream_id"] = self.cam_id
+                descriptor["timestamp"] = last_update
+                if cnt % 30 == 1:
+                    logger.warning(
+                        "send shm descriptor through channel {}, count = {}".format(
+                            bytes(self.cam_id, "utf-8"), cnt
+                        )
+                    )
+                self.zmq_sender.send_multipart(
+                    [bytes(self.cam_id, "utf-8"), json.dumps(descriptor).encode("utf-8")]
+                )
+                self.last_send = last_update
+                self.sent_num += 1
                 time.sleep(1 / self.fps)
 
-        threading.Thread(target=run_capture, args=(self,), daemon=True).start()
+            if self.frame_ring:
+                self.frame_ring.close()
+
+        if CAPTURE_MODE == "grab":
+            threading.Thread(target=self.run_grab_capture, daemon=True).start()
+        else:
+            threading.Thread(target=run_capture, args=(self,), daemon=True).start()
         threading.Thread(target=run_send, args=(self,), daemon=True).start()
 
+    def run_grab_capture(self):
+        """run_grab_capture.
+
+        Grab every frame so the capture buffer never falls behind (RTSP),
+        but only decode and resize a frame when 1 / fps has elapsed since
+        the last decoded one. The sender always picks the latest frame.
+        """
+
+        if self.cam_source == "0":
+            self.cam = cv2.VideoCapture(0)
+        else:
+            self.cam = cv2.VideoCapture(self.cam_source)
+
+        source_fps = 0
+        if self.cam.isOpened():
+            source_fps = self.cam.get(cv2.CAP_PROP_FPS)
+        # video files are not paced by the source, play them at their fps
+        is_file = os.path.isfile(self.cam_source)
+        if is_file and source_fps <= 0:
+            source_fps = self.fps
+
+        next_decode = 0
+        while self.cam_is_alive:
+            start = time.time()
+            is_ok = self.cam.grab()
+            if not is_ok:
+                time.sleep(1)
+                self.restart_cam()
+                continue
+            self.grabbed_num += 1
+
+            if start >= next_decode:
+                is_ok, img = self.cam.retrieve()
+                if is_ok:
+                    width = IMG_WIDTH
+                    ratio = IMG_WIDTH / img.shape[1]
+                    height = int(img.shape[0] * ratio + 0.000001)
+
+                    img = cv2.resize(img, (width, height))
+                    self.last_img = img
+                    self.last_update = start
+                    self.decoded_num += 1
+                    next_decode = max(start, next_decode + 1 / self.fps)
+
+            self.update_capture_metrics()
+            if is_file:
+                time.sleep(max(0, 1 / source_fps - (time.time() - start)))
+
+        logger.warning("Stream {} finished".format(self.cam_id))
+        self.cam.release()
+
+    def update_capture_metrics(self):
+        now = time.time()
+        start, grabbed, decoded, sent = self._metrics_window
+        if now - start < METRICS_WINDOW:
+            return
+        elapsed = now - start
+        self.input_fps = (self.grabbed_num - grabbed) / elapsed
+        self.decoded_fps = (self.decoded_num - decoded) / elapsed
+        self.sent_fps = (self.sent_num - sent) / elapsed
+        self._metrics_window = (now, self.grabbed_num, self.decoded_num, self.sent_num)
+
+    def get_metrics(self):
+        return {
+            "cam_id": self.cam_id,
+            "capture_mode": CAPTURE_MODE,
+            "fps": self.fps,
+            "input_fps": self.input_fps,
+            "decoded_fps": self.decoded_fps,
+            "sent_fps": self.sent_fps,
+            "grabbed_frames": self.grabbed_num,
+            "decoded_frames": self.decoded_num,
+            "sent_frames": self.sent_num,
+            # grabbed but never decoded
+            "dropped_frames": self.grabbed_num - self.decoded_num,
+            # decoded but replaced by a newer frame before being sent
+            "overwritten_frames": max(0, self.decoded_num - self.sent_num),
+        }
+
     def restart_cam(self):
 
         logger.warning("Restarting Cam {}".format(self.cam_id))
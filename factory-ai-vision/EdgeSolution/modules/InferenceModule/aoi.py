@@ -0,0 +1,112 @@
+"""AOI
+
+Area of interest geometry, compiled once per aoi_info so filtering the
+boxes of a frame doesn't rebuild shapely polygons.
+"""
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from shapely.prepared import prep
+
+# shapely >= 2.0 has vectorized predicates
+IS_VECTORIZED = hasattr(shapely, "box") and hasattr(shapely, "intersects")
+
+
+class AOI:
+    """Compiled AOI areas.
+
+    Args:
+        aoi_info: list of {"type": "BBox" | "Polygon", "label": ...}, as
+            sent by the WebModule
+    """
+
+    def __init__(self, aoi_info):
+        self.aoi_info = aoi_info
+
+        bboxes = []
+        self.polygons = []
+        self.prepared_polygons = []
+        polygon_bounds = []
+        for aoi_area in aoi_info or []:
+            label = aoi_area["label"]
+            if aoi_area["type"] == "BBox":
+                bboxes.append([label["x1"], label["y1"], label["x2"], label["y2"]])
+            elif aoi_area["type"] == "Polygon":
+                aoi_shape = Polygon([[point["x"], point["y"]] for point in label])
+                # invalid polygons never matched
+                if not aoi_shape.is_valid:
+                    continue
+                if IS_VECTORIZED:
+                    shapely.prepare(aoi_shape)
+                else:
+                    self.prepared_polygons.append(prep(aoi_shape))
+                self.polygons.append(aoi_shape)
+                polygon_bounds.append(aoi_shape.bounds)
+
+        self.bboxes = np.array(bboxes, dtype=float).reshape(-1, 4)
+        self.polygon_bounds = np.array(polygon_bounds, dtype=float).reshape(-1, 4)
+
+    def filter(self, boxes):
+        """Whether each box is inside the AOI.
+
+        Args:
+            boxes: (N x 4) of (x1, y1, x2, y2)
+
+        Returns:
+            (N,) bool array
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        inside = np.zeros(len(boxes), dtype=bool)
+        if len(boxes) == 0:
+            return inside
+
+        x1, y1, x2, y2 = (boxes[:, i : i + 1] for i in range(4))
+
+        # BBox: a vertical edge and a horizontal edge within the area,
+        # same rule as the former is_inside_aoi
+        if len(self.bboxes):
+            l_x1, l_y1, l_x2, l_y2 = (self.bboxes[:, i] for i in range(4))
+            in_x = ((l_x1 <= x1) & (x1 <= l_x2)) | ((l_x1 <= x2) & (x2 <= l_x2))
+            in_y = ((l_y1 <= y1) & (y1 <= l_y2)) | ((l_y1 <= y2) & (y2 <= l_y2))
+            inside |= np.any(in_x & in_y, axis=1)
+
+        if len(self.polygons):
+            # boxes outside the bounds of every polygon can't intersect
+            p_x1, p_y1, p_x2, p_y2 = (self.polygon_bounds[:, i] for i in range(4))
+            candidates = (
+                (np.minimum(x1, x2) <= p_x2)
+                & (np.maximum(x1, x2) >= p_x1)
+                & (np.minimum(y1, y2) <= p_y2)
+                & (np.maximum(y1, y2) >= p_y1)
+            )
+            candidates &= ~inside[:, np.newaxis]
+
+            for j in range(len(self.polygons)):
+                (rows,) = np.nonzero(candidates[:, j])
+                if len(rows) == 0:
+                    continue
+                b = boxes[rows]
+                if IS_VECTORIZED:
+                    corners = [b[:, [0, 1]], b[:, [2, 1]], b[:, [2, 3]], b[:, [0, 3]]]
+                    obj_shapes = shapely.polygons(np.stack(corners, axis=1))
+                    hits = shapely.intersects(self.polygons[j], obj_shapes)
+                else:
+                    hits = np.array(
+                        [
+                            self.prepared_polygons[j].intersects(_box_polygon(*box))
+                            for box in b
+                        ],
+                        dtype=bool,
+                    )
+                inside[rows[hits]] = True
+                candidates[rows[hits]] = False
+
+        return inside
+
+    def is_inside(self, x1, y1, x2, y2):
+        return bool(self.filter([[x1, y1, x2, y2]])[0])
+
+
+def _box_polygon(x1, y1, x2, y2):
+    return Polygon([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
@@ -49,3 +49,29 @@ class PartDetectionModeEnum(str, Enum):
 class UploadModelBody(BaseModel):
     model_uri: str = None
     model_dir: str = None
+
+
+class RetrainParametersModel(BaseModel):
+    is_retrain: bool
+    confidence_min: int
+    confidence_max: int
+    max_images: int
+
+
+class IotHubParametersModel(BaseModel):
+    is_send: bool
+    threshold: int
+    fpm: int
+
+
+class ConfigurationModel(BaseModel):
+    """Whole configuration of the module, sections left out are kept."""
+
+    part_detection_id: int = None
+    part_detection_mode: PartDetectionModeEnum = None
+    model: UploadModelBody = None
+    parts: PartsModel = None
+    retrain_parameters: RetrainParametersModel = None
+    iothub_parameters: IotHubParametersModel = None
+    cameras: CamerasModel = None
+    prob_threshold: int = None
@@ -0,0 +1,139 @@
+"""Batch Scheduler
+
+Gather frames submitted by several streams into one batched model call.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+METRICS_HISTORY_SIZE = 100
+
+
+class BatchRequest:
+    """A single frame waiting to be scored."""
+
+    def __init__(self, image):
+        self.image = image
+        self.enqueue_time = time.time()
+        self.future = Future()
+
+
+class BatchScheduler:
+    """Dynamic batching scheduler.
+
+    Frames submitted from different stream threads are queued and scored
+    together by `run_batch`, bounded by `max_batch_size` frames and
+    `max_wait_ms` milliseconds after the oldest frame was queued. Each frame
+    reports its share of the batch inference time.
+
+    Args:
+        run_batch (callable): run_batch(images) -> (list of results, inf_time)
+        max_batch_size (int): max number of frames per model call
+        max_wait_ms (float): max time the oldest frame waits for a batch
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0, float(max_wait_ms))
+
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.worker = None
+
+        self.total_batches = 0
+        self.total_frames = 0
+        self.last_batch_size = 0
+        self.max_queue_wait_ms = 0
+        self.batch_sizes = deque(maxlen=METRICS_HISTORY_SIZE)
+        self.queue_waits_ms = deque(maxlen=METRICS_HISTORY_SIZE)
+
+    def submit(self, image):
+        """Queue an image and block until its batch has been scored.
+
+        Returns:
+            (result, inf_time) for this image.
+        """
+        request = BatchRequest(image)
+        with self.cond:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+            self.queue.append(request)
+            self.cond.notify()
+        return request.future.result()
+
+    def _collect(self):
+        with self.cond:
+            while not self.queue:
+                self.cond.wait()
+            deadline = self.queue[0].enqueue_time + self.max_wait_ms / 1000
+            while len(self.queue) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch_size = min(len(self.queue), self.max_batch_size)
+            return [self.queue.popleft() for _ in range(batch_size)]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.time()
+            try:
+                results, inf_time = self.run_batch([r.image for r in batch])
+            except Exception as e:
+                logger.exception("Batch of %s frames failed", len(batch))
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            self._update_metrics(batch, start)
+            frame_inf_time = inf_time / len(batch)
+            for request, result in zip(batch, results):
+                request.future.set_result((result, frame_inf_time))
+
+    def _update_metrics(self, batch, start):
+        with self.cond:
+            self.total_batches += 1
+            self.total_frames += len(batch)
+            self.last_batch_size = len(batch)
+            self.batch_sizes.append(len(batch))
+            for request in batch:
+                wait_ms = (start - request.enqueue_time) * 1000
+                self.queue_waits_ms.append(wait_ms)
+                self.max_queue_wait_ms = max(self.max_queue_wait_ms, wait_ms)
+
+    def reset_metrics(self):
+        with self.cond:
+            self.total_batches = 0
+            self.total_frames = 0
+            self.last_batch_size = 0
+            self.max_queue_wait_ms = 0
+            self.batch_sizes.clear()
+            self.queue_waits_ms.clear()
+
+    def get_metrics(self):
+        with self.cond:
+            batch_sizes = list(self.batch_sizes)
+            queue_waits_ms = list(self.queue_waits_ms)
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queue_length": len(self.queue),
+                "total_batches": self.total_batches,
+                "total_frames": self.total_frames,
+                "last_batch_size": self.last_batch_size,
+                "average_batch_size": (
+                    sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0
+                ),
+                "average_queue_wait_ms": (
+                    sum(queue_waits_ms) / len(queue_waits_ms) if queue_waits_ms else 0
+                ),
+                "max_queue_wait_ms": self.max_queue_wait_ms,
+            }
@@ -0,0 +1,197 @@
+"""Benchmark NMS
+
+Compare the vectorized box decoding / NMS in object_detection_utils.py with
+the former per-pick implementation, on random YOLO outputs shaped like the
+bundled default_model and scenario_models.
+
+    python benchmark_nms.py
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from object_detection_utils import extract_bb, non_maximum_suppression
+
+DEFAULT_ANCHORS = np.array(
+    [[0.573, 0.677], [1.87, 2.06], [3.34, 5.47], [7.88, 3.53], [9.77, 9.17]]
+)
+MODEL_DIRS = [
+    "default_model",
+    "scenario_models/1",
+    "scenario_models/2",
+    "scenario_models/3",
+]
+GRID_SIZE = 13
+N_FRAMES = 200
+PROB_THRESHOLD = 0.10
+MAX_DETECTIONS = 20
+
+
+def legacy_logistic(x):
+    return np.where(x > 0, 1 / (1 + np.exp(-x)), np.exp(x) / (1 + np.exp(x)))
+
+
+def legacy_extract_bb(prediction_output, anchors, num_labels):
+    num_anchor = anchors.shape[0]
+    height, width, channels = prediction_output.shape
+    num_class = int(channels / num_anchor) - 5
+    assert num_class == num_labels
+
+    outputs = prediction_output.reshape((height, width, num_anchor, -1))
+
+    x = (
+        legacy_logistic(outputs[..., 0]) + np.arange(width)[np.newaxis, :, np.newaxis]
+    ) / width
+    y = (
+        legacy_logistic(outputs[..., 1]) + np.arange(height)[:, np.newaxis, np.newaxis]
+    ) / height
+    w = np.exp(outputs[..., 2]) * anchors[:, 0][np.newaxis, np.newaxis, :] / width
+    h = np.exp(outputs[..., 3]) * anchors[:, 1][np.newaxis, np.newaxis, :] / height
+
+    x = x - w / 2
+    y = y - h / 2
+    boxes = np.stack((x, y, w, h), axis=-1).reshape(-1, 4)
+
+    objectness = legacy_logistic(outputs[..., 4])
+
+    class_probs = outputs[..., 5:]
+    class_probs = np.exp(class_probs - np.amax(class_probs, axis=3)[..., np.newaxis])
+    class_probs = (
+        class_probs
+        / np.sum(class_probs, axis=3)[..., np.newaxis]
+        * objectness[..., np.newaxis]
+    )
+    class_probs = class_probs.reshape(-1, num_class)
+    return boxes, class_probs
+
+
+def legacy_non_maximum_suppression(
+    boxes, class_probs, max_detections, prob_threshold, iou_threshold
+):
+    max_detections = min(max_detections, len(boxes))
+    max_probs = np.amax(class_probs, axis=1)
+    max_classes = np.argmax(class_probs, axis=1)
+
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    selected_boxes = []
+    selected_classes = []
+    selected_probs = []
+
+    while len(selected_boxes) < max_detections:
+        i = np.argmax(max_probs)
+        if max_probs[i] < prob_threshold:
+            break
+
+        selected_boxes.append(boxes[i])
+        selected_classes.append(max_classes[i])
+        selected_probs.append(max_probs[i])
+
+        box = boxes[i]
+        other_indices = np.concatenate((np.arange(i), np.arange(i + 1, len(boxes))))
+        other_boxes = boxes[other_indices]
+
+        x1 = np.maximum(box[0], other_boxes[:, 0])
+        y1 = np.maximum(box[1], other_boxes[:, 1])
+        x2 = np.minimum(box[0] + box[2], other_boxes[:, 0] + other_boxes[:, 2])
+        y2 = np.minimum(box[1] + box[3], other_boxes[:, 1] + other_boxes[:, 3])
+        w = np.maximum(0, x2 - x1)
+        h = np.maximum(0, y2 - y1)
+
+        overlap_area = w * h
+        iou = overlap_area / (areas[i] + areas[other_indices] - overlap_area)
+
+        overlapping_indices = other_indices[np.where(iou > iou_threshold)[0]]
+        overlapping_indices = np.append(overlapping_indices, i)
+
+        class_probs[overlapping_indices, max_classes[i]] = 0
+        max_probs[overlapping_indices] = np.amax(
+            class_probs[overlapping_indices], axis=1
+        )
+        max_classes[overlapping_indices] = np.argmax(
+            class_probs[overlapping_indices], axis=1
+        )
+
+    return selected_boxes, selected_classes, selected_probs
+
+
+def legacy_postprocess(output, anchors, num_labels, iou_threshold):
+    boxes, class_probs = legacy_extract_bb(output, anchors, num_labels)
+    max_probs = np.amax(class_probs, axis=1)
+    (index,) = np.where(max_probs > PROB_THRESHOLD)
+    index = index[(-max_probs[index]).argsort()]
+    return legacy_non_maximum_suppression(
+        boxes[index], class_probs[index], MAX_DETECTIONS, PROB_THRESHOLD, iou_threshold
+    )
+
+
+def postprocess(output, anchors, num_labels, iou_threshold):
+    boxes, class_probs = extract_bb(output, anchors, num_labels, PROB_THRESHOLD)
+    max_probs = np.amax(class_probs, axis=1)
+    (index,) = np.where(max_probs > PROB_THRESHOLD)
+    index = index[(-max_probs[index]).argsort()]
+    return non_maximum_suppression(
+        boxes[index], class_probs[index], MAX_DETECTIONS, PROB_THRESHOLD, iou_threshold
+    )
+
+
+def load_model_info(model_dir):
+    with open(os.path.join(model_dir, "cvexport.manifest")) as f:
+        manifest = json.load(f)
+    with open(os.path.join(model_dir, "labels.txt")) as f:
+        labels = [l.strip() for l in f.readlines() if l.strip()]
+    anchors = np.array(manifest.get("Anchors", DEFAULT_ANCHORS))
+    iou_threshold = manifest.get("IouThreshold", 0.45)
+    return labels, anchors, iou_threshold
+
+
+def random_outputs(num_labels, num_anchor, n_frames, seed=0):
+    rng = np.random.RandomState(seed)
+    channels = num_anchor * (num_labels + 5)
+    outputs = rng.normal(0, 2, (n_frames, GRID_SIZE, GRID_SIZE, channels))
+    # most anchors see background, some are confident like in a busy scene
+    objectness = outputs[..., 4 :: num_labels + 5]
+    objectness += rng.normal(-3, 2, objectness.shape)
+    return outputs.astype(np.float32)
+
+
+def is_identical(a, b):
+    if len(a[0]) != len(b[0]):
+        return False
+    return (
+        all(np.array_equal(x, y) for x, y in zip(a[0], b[0]))
+        and list(a[1]) == list(b[1])
+        and list(a[2]) == list(b[2])
+    )
+
+
+def benchmark(model_dir):
+    labels, anchors, iou_threshold = load_model_info(model_dir)
+    outputs = random_outputs(len(labels), anchors.shape[0], N_FRAMES)
+
+    t0 = time.time()
+    legacy_results = [
+        legacy_postprocess(o, anchors, len(labels), iou_threshold) for o in outputs
+    ]
+    t1 = time.time()
+    results = [postprocess(o, anchors, len(labels), iou_threshold) for o in outputs]
+    t2 = time.time()
+
+    identical = all(is_identical(a, b) for a, b in zip(legacy_results, results))
+    n_detections = sum(len(r[0]) for r in results)
+    print("---- {} ({} labels) ----".format(model_dir, len(labels)))
+    print("  identical  :", identical)
+    print("  detections :", n_detections / N_FRAMES, "per frame")
+    print("  legacy     :", (t1 - t0) / N_FRAMES * 1000, "ms per frame")
+    print("  vectorized :", (t2 - t1) / N_FRAMES * 1000, "ms per frame")
+    return identical
+
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    all_identical = all([benchmark(model_dir) for model_dir in MODEL_DIRS])
+    if not all_identical:
+        raise SystemExit("Vectorized results differ from the legacy implementation")
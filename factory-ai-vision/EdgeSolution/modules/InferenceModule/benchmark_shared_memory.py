@@ -0,0 +1,145 @@
+"""Benchmark SharedMemoryManager
+
+Stress the ring allocator behind GetEmptySlot / DeleteSlot with the
+allocation pattern of a high-FPS LVA shared memory stream: increasing
+sequence numbers, frames released a few frames later, mostly in order.
+Compare it with the former sort-and-scan allocator.
+
+    python benchmark_shared_memory.py
+"""
+
+import os
+import random
+import time
+from collections import deque
+
+from shared_memory import SharedMemoryManager
+
+SHM_SIZE = 1024 * 1024 * 10  # Bytes (10MB), LVA default
+FRAME_SIZES = [416 * 416 * 3, 960 * 540 * 3 // 4, 640 * 480 * 3 // 4]
+N_FRAMES = 20000
+IN_FLIGHT = [2, 4, 8]
+OUT_OF_ORDER_RATE = 0.1
+
+
+class LegacySharedMemoryManager(SharedMemoryManager):
+    """The former allocator, re-sorting and scanning _memSlots."""
+
+    def GetEmptySlot(self, seqNo, sizeNeeded):
+        address = None
+
+        if sizeNeeded < 1:
+            return address
+
+        if len(self._memSlots) < 1:
+            if self._shmFileSize >= sizeNeeded:
+                self._memSlots[seqNo] = (0, sizeNeeded - 1)
+                address = (0, sizeNeeded - 1)
+            else:
+                address = None
+        else:
+            self._memSlots = {
+                k: v
+                for k, v in sorted(self._memSlots.items(), key=lambda item: item[1])
+            }
+
+            prevSlotEnd = 0
+            for k, v in self._memSlots.items():
+                if (v[0] - prevSlotEnd - 1) >= sizeNeeded:
+                    address = (prevSlotEnd + 1, prevSlotEnd + sizeNeeded)
+                    self._memSlots[seqNo] = (address[0], address[1])
+                    break
+                else:
+                    prevSlotEnd = v[1]
+
+            if address is None:
+                if (self._shmFileSize - prevSlotEnd + 1) >= sizeNeeded:
+                    address = (prevSlotEnd + 1, prevSlotEnd + sizeNeeded)
+                    self._memSlots[seqNo] = (address[0], address[1])
+
+        return address
+
+    def DeleteSlot(self, seqNo):
+        try:
+            del self._memSlots[seqNo]
+            return True
+        except KeyError:
+            return False
+
+
+def replay(manager, frame_size, in_flight, seed=0):
+    """Allocate N_FRAMES frames, keeping up to in_flight frames alive.
+
+    Returns:
+        (seconds, number of failed allocations, max fragmentation)
+    """
+    rng = random.Random(seed)
+    live = deque()
+    failed = 0
+    max_fragmentation = 0
+    seq_no = rng.randint(1, 1000)
+
+    elapsed = 0
+    for _ in range(N_FRAMES):
+        seq_no += 1
+        start = time.perf_counter()
+        if manager.GetEmptySlot(seq_no, frame_size) is None:
+            failed += 1
+        else:
+            live.append(seq_no)
+
+        while len(live) > in_flight:
+            # the inference side sometimes acks frames out of order
+            if len(live) > 1 and rng.random() < OUT_OF_ORDER_RATE:
+                manager.DeleteSlot(live[1])
+                del live[1]
+            else:
+                manager.DeleteSlot(live.popleft())
+        elapsed += time.perf_counter() - start
+
+        if hasattr(manager, "GetStatistics"):
+            max_fragmentation = max(
+                max_fragmentation, manager.GetStatistics()["fragmentation"]
+            )
+
+    while live:
+        manager.DeleteSlot(live.popleft())
+    return elapsed, failed, max_fragmentation
+
+
+def benchmark():
+    name = "benchmark_shared_memory_{}".format(os.getpid())
+    flags = os.O_RDWR | os.O_CREAT
+    try:
+        for frame_size in FRAME_SIZES:
+            for in_flight in IN_FLIGHT:
+                legacy = LegacySharedMemoryManager(flags, name, SHM_SIZE)
+                ring = SharedMemoryManager(flags, name, SHM_SIZE)
+
+                legacy_time, legacy_failed, _ = replay(legacy, frame_size, in_flight)
+                ring_time, ring_failed, fragmentation = replay(
+                    ring, frame_size, in_flight
+                )
+
+                print(
+                    "---- frame {} bytes, {} in flight ----".format(
+                        frame_size, in_flight
+                    )
+                )
+                print(
+                    "  legacy : {:.2f} us per frame, {} failed".format(
+                        legacy_time / N_FRAMES * 1e6, legacy_failed
+                    )
+                )
+                print(
+                    "  ring   : {:.2f} us per frame, {} failed, max fragmentation {:.2f}".format(
+                        ring_time / N_FRAMES * 1e6, ring_failed, fragmentation
+                    )
+                )
+                print("  stats  :", ring.GetStatistics())
+    finally:
+        os.remove(os.path.join("/dev/shm", name))
+
+
+if __name__ == "__main__":
+    benchmark()
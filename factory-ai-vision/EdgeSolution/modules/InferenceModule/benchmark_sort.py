@@ -0,0 +1,73 @@
+"""Benchmark Sort
+
+Compare VectorizedSort with Sort on synthetic scenes of moving boxes
+(10, 100 and 1000 tracks), and check that IDs and boxes are identical.
+
+    python benchmark_sort.py
+"""
+
+import time
+
+import numpy as np
+
+import sort
+
+N_TRACKS = [10, 100, 1000]
+N_FRAMES = 50
+MISS_RATE = 0.1
+
+
+def random_scene(n_objs, n_frames, seed=0):
+    """Detections (x1, y1, x2, y2, score) of n_objs moving boxes per frame."""
+    rng = np.random.RandomState(seed)
+    # spread the boxes so that the scene stays realistic with many tracks
+    extent = 100 * np.sqrt(n_objs) + 500
+    pos = rng.uniform(0, extent, (n_objs, 2))
+    size = rng.uniform(20, 80, (n_objs, 2))
+    vel = rng.normal(0, 3, (n_objs, 2))
+
+    frames = []
+    for _ in range(n_frames):
+        pos += vel
+        boxes = np.concatenate([pos, pos + size], axis=1)
+        boxes += rng.normal(0, 1.5, boxes.shape)
+        scores = rng.uniform(0.3, 1, (n_objs, 1))
+        dets = np.concatenate([boxes, scores], axis=1)
+        dets = dets[rng.rand(n_objs) > MISS_RATE]
+        rng.shuffle(dets)
+        frames.append(dets)
+    return frames
+
+
+def run(tracker_class, frames):
+    sort.KalmanBoxTracker.count = 0
+    tracker = tracker_class(max_age=1, min_hits=3, iou_threshold=0.3)
+    results = []
+    start = time.perf_counter()
+    for dets in frames:
+        results.append(tracker.update(dets))
+    return time.perf_counter() - start, results
+
+
+def benchmark(n_tracks):
+    frames = random_scene(n_tracks, N_FRAMES)
+
+    legacy_time, legacy_results = run(sort.Sort, frames)
+    vectorized_time, vectorized_results = run(sort.VectorizedSort, frames)
+
+    identical = all(
+        np.array_equal(a, b) for a, b in zip(legacy_results, vectorized_results)
+    )
+    print("---- {} tracks ----".format(n_tracks))
+    print("  identical  :", identical)
+    print("  sort       : {:.3f} ms per frame".format(legacy_time / N_FRAMES * 1000))
+    print(
+        "  vectorized : {:.3f} ms per frame".format(vectorized_time / N_FRAMES * 1000)
+    )
+    return identical
+
+
+if __name__ == "__main__":
+    all_identical = all([benchmark(n_tracks) for n_tracks in N_TRACKS])
+    if not all_identical:
+        raise SystemExit("VectorizedSort results differ from Sort")
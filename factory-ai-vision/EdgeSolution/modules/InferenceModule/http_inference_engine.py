@@ -22,11 +22,11 @@ class HttpInferenceEngine:
             return []
 
         try:
-            stream.predict(img)
-            predictions = stream.last_prediction
+            predictions = stream.predict(img, sync=True)
             #logger.info("Predictions %s", predictions)
         except:
             logger.error("Unexpected error: %s", sys.exc_info())
+            predictions = []
 
         results = []
         for prediction in predictions:
@@ -315,8 +315,7 @@ class InferenceEngine(extension_pb2_grpc.MediaGraphExtensionServicer):
             else:
                 try:
                     # s2 = time.time()
-                    stream.predict(cvImage)
-                    predictions = stream.last_prediction
+                    predictions = stream.predict(cvImage, sync=True)
                     # e2 = time.time() - s2
                     # logging.info('Inference time: {0}'.format(e2))
                     # total_time.append(e2)
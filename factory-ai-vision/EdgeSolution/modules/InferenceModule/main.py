@@ -14,8 +14,8 @@ import requests
 import zmq
 from azure.iot.device import IoTHubModuleClient
 from flask import Flask, Response, request
-from shapely.geometry import Polygon
 
+from aoi import AOI
 from object_detection import ObjectDetection
 from onnxruntime_predict import ONNXRuntimeObjectDetection
 from scenarios import DangerZone, DefeatDetection, Detection, PartCounter
@@ -122,30 +122,8 @@ def draw_aoi(img, aoi_info):
 
 
 def is_inside_aoi(x1, y1, x2, y2, aoi_info):
-
-    obj_shape = Polygon([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
-
-    for aoi_area in aoi_info:
-        aoi_type = aoi_area["type"]
-        label = aoi_area["label"]
-
-        if aoi_area["type"] == "BBox":
-            if (
-                (label["x1"] <= x1 <= label["x2"]) or (label["x1"] <= x2 <= label["x2"])
-            ) and (
-                (label["y1"] <= y1 <= label["y2"]) or (label["y1"] <= y2 <= label["y2"])
-            ):
-                return True
-
-        elif aoi_area["type"] == "Polygon":
-            points = []
-            for point in label:
-                points.append([point["x"], point["y"]])
-            aoi_shape = Polygon(points)
-            if aoi_shape.is_valid and aoi_shape.intersects(obj_shape):
-                return True
-
-    return False
+    """Prefer a compiled AOI(aoi_info) when checking several boxes."""
+    return AOI(aoi_info).is_inside(x1, y1, x2, y2)
 
 
 def parse_bbox(prediction, width, height):
@@ -244,6 +222,7 @@ class ONNXRuntimeModelDeploy(ObjectDetection):
 
         self.has_aoi = False
         self.aoi_info = None
+        self.aoi = None
         # Part that we want to detect
         self.parts = []
 
@@ -298,6 +277,7 @@ class ONNXRuntimeModelDeploy(ObjectDetection):
         self.cam_source = cam_source
         self.has_aoi = has_aoi
         self.aoi_info = aoi_info
+        self.aoi = AOI(aoi_info) if has_aoi else None
         cam = cv2.VideoCapture(normalize_rtsp(cam_source))
 
         # Protected by Mutex
@@ -752,7 +732,7 @@ def video_feed():
 
                     if prediction["probability"] > onnx.threshold:
                         if onnx.has_aoi:
-                            if not is_inside_aoi(x1, y1, x2, y2, onnx.aoi_info):
+                            if not onnx.aoi.is_inside(x1, y1, x2, y2):
                                 continue
 
                         # img = cv2.rectangle(
@@ -811,7 +791,7 @@ def gen():
             if prediction["probability"] > onnx.threshold:
                 (x1, y1), (x2, y2) = parse_bbox(prediction, width, height)
                 if onnx.has_aoi:
-                    if not is_inside_aoi(x1, y1, x2, y2, onnx.aoi_info):
+                    if not onnx.aoi.is_inside(x1, y1, x2, y2):
                         continue
 
                 img = cv2.rectangle(img, (x1, y1), (x2, y2), (255, 255, 255), 2)
@@ -848,7 +828,7 @@ def post_run():
                     y1 = min(max(y1, 0), height - 1)
                     y2 = min(max(y2, 0), height - 1)
                     if onnx.has_aoi:
-                        if not is_inside_aoi(x1, y1, x2, y2, onnx.aoi_info):
+                        if not onnx.aoi.is_inside(x1, y1, x2, y2):
                             continue
 
                     predictions_to_send.append(prediction)
@@ -880,7 +860,7 @@ def post_run():
 
             (x1, y1), (x2, y2) = parse_bbox(prediction, width, height)
             if onnx.has_aoi:
-                if not is_inside_aoi(x1, y1, x2, y2, onnx.aoi_info):
+                if not onnx.aoi.is_inside(x1, y1, x2, y2):
                     continue
 
             if detection != DETECTION_TYPE_SUCCESS:
@@ -1031,7 +1011,7 @@ def gen_edge():
         if prediction["probability"] > onnx.threshold:
             (x1, y1), (x2, y2) = parse_bbox(prediction, width, height)
             if onnx.has_aoi:
-                if not is_inside_aoi(x1, y1, x2, y2, onnx.aoi_info):
+                if not onnx.aoi.is_inside(x1, y1, x2, y2):
                     continue
 
             img = cv2.rectangle(img, (x1, y1), (x2, y2), (255, 255, 255), 2)
@@ -14,6 +14,7 @@ import onnxruntime
 import requests
 from shapely.geometry import Polygon
 
+from batch_scheduler import BatchScheduler
 from exception_handler import PrintGetExceptionDetails
 from object_detection import ObjectDetection
 from onnxruntime_predict import ONNXRuntimeObjectDetection
@@ -27,6 +28,10 @@ CPU_MAX_FRAME_RATE = 10
 
 LVA_MODE = os.environ.get("LVA_MODE", "grpc")
 
+# Cross-stream batching, opt-in: set BATCH_MAX_SIZE > 1 for multi-camera setups
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "1"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "10"))
+
 logger = logging.getLogger(__name__)
 
 
@@ -62,6 +67,12 @@ class ONNXRuntimeModelDeploy(ObjectDetection):
             self.max_total_frame_rate = CPU_MAX_FRAME_RATE
         self.update_frame_rate_by_number_of_streams(1)
 
+        self.batch_scheduler = BatchScheduler(
+            self.ScoreBatch,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+        )
+
     def set_is_scenario(self, is_scenario):
         self.is_scenario = is_scenario
 
@@ -184,8 +195,27 @@ class ONNXRuntimeModelDeploy(ObjectDetection):
 
     def Score(self, image):
 
+        if self.batch_scheduler.max_batch_size > 1:
+            return self.batch_scheduler.submit(image)
+
         self.lock.acquire()
         predictions, inf_time = self.model.predict_image(image)
         self.lock.release()
 
         return predictions, inf_time
+
+    def ScoreBatch(self, images):
+        """ScoreBatch.
+
+        Run a single model call for frames gathered from several streams.
+        """
+        self.lock.acquire()
+        try:
+            predictions_list, inf_time = self.model.predict_images(images)
+        finally:
+            self.lock.release()
+
+        return predictions_list, inf_time
+
+    def get_batch_metrics(self):
+        return self.batch_scheduler.get_metrics()
@@ -9,6 +9,8 @@ import onnxruntime
 import time
 import logging
 
+from object_detection_utils import extract_bb, logistic, non_maximum_suppression
+
 
 class ObjectDetection(object):
     """Class for Custom Vision's exported object detection model
@@ -28,6 +30,7 @@ class ObjectDetection(object):
         self.labels = labels
         self.prob_threshold = prob_threshold
         self.max_detections = max_detections
+        self.class_agnostic_nms = False
 
         if "IouThreshold" in data:
             self.iou_threshold = data["IouThreshold"]
@@ -96,114 +99,24 @@ class ObjectDetection(object):
 
         print("\n Started Inference...")
         self.input_name = self.session.get_inputs()[0].name
+        # Batch dimension is either symbolic or a fixed size
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.is_batchable = not (isinstance(batch_dim, int) and batch_dim == 1)
         if self.render == 0:
             print("Press Ctl+C to exit...")
 
     def _logistic(self, x):
-        return np.where(x > 0, 1 / (1 + np.exp(-x)), np.exp(x) / (1 + np.exp(x)))
+        return logistic(x)
 
     def _non_maximum_suppression(self, boxes, class_probs, max_detections):
         """Remove overlapping bouding boxes
         """
-        assert len(boxes) == len(class_probs)
+        return non_maximum_suppression(boxes, class_probs, max_detections,
+                                       self.prob_threshold, self.iou_threshold,
+                                       class_agnostic=self.class_agnostic_nms)
 
-        max_detections = min(max_detections, len(boxes))
-        max_probs = np.amax(class_probs, axis=1)
-        max_classes = np.argmax(class_probs, axis=1)
-
-        areas = boxes[:, 2] * boxes[:, 3]
-
-        selected_boxes = []
-        selected_classes = []
-        selected_probs = []
-
-        while len(selected_boxes) < max_detections:
-            # Select the prediction with the highest probability.
-            i = np.argmax(max_probs)
-            if max_probs[i] < self.prob_threshold:
-                break
-
-            # Save the selected prediction
-            selected_boxes.append(boxes[i])
-            selected_classes.append(max_classes[i])
-            selected_probs.append(max_probs[i])
-
-            box = boxes[i]
-            other_indices = np.concatenate(
-                (np.arange(i), np.arange(i + 1, len(boxes))))
-            other_boxes = boxes[other_indices]
-
-            # Get overlap between the 'box' and 'other_boxes'
-            x1 = np.maximum(box[0], other_boxes[:, 0])
-            y1 = np.maximum(box[1], other_boxes[:, 1])
-            x2 = np.minimum(box[0] + box[2],
-                            other_boxes[:, 0] + other_boxes[:, 2])
-            y2 = np.minimum(box[1] + box[3],
-                            other_boxes[:, 1] + other_boxes[:, 3])
-            w = np.maximum(0, x2 - x1)
-            h = np.maximum(0, y2 - y1)
-
-            # Calculate Intersection Over Union (IOU)
-            overlap_area = w * h
-            iou = overlap_area / \
-                (areas[i] + areas[other_indices] - overlap_area)
-
-            # Find the overlapping predictions
-            overlapping_indices = other_indices[np.where(
-                iou > self.iou_threshold)[0]]
-            overlapping_indices = np.append(overlapping_indices, i)
-
-            # Set the probability of overlapping predictions to zero, and udpate max_probs and max_classes.
-            class_probs[overlapping_indices, max_classes[i]] = 0
-            max_probs[overlapping_indices] = np.amax(
-                class_probs[overlapping_indices], axis=1)
-            max_classes[overlapping_indices] = np.argmax(
-                class_probs[overlapping_indices], axis=1)
-
-        assert len(selected_boxes) == len(selected_classes) and len(
-            selected_boxes) == len(selected_probs)
-        return selected_boxes, selected_classes, selected_probs
-
-    def _extract_bb(self, prediction_output, anchors):
-        assert len(prediction_output.shape) == 3
-        num_anchor = anchors.shape[0]
-        height, width, channels = prediction_output.shape
-        assert channels % num_anchor == 0
-
-        num_class = int(channels / num_anchor) - 5
-        assert num_class == len(self.labels)
-
-        outputs = prediction_output.reshape((height, width, num_anchor, -1))
-
-        # Extract bouding box information
-        x = (self._logistic(outputs[..., 0]) +
-             np.arange(width)[np.newaxis, :, np.newaxis]) / width
-        y = (self._logistic(
-            outputs[..., 1]) + np.arange(height)[:, np.newaxis, np.newaxis]) / height
-        w = np.exp(outputs[..., 2]) * anchors[:,
-                                              0][np.newaxis, np.newaxis, :] / width
-        h = np.exp(outputs[..., 3]) * anchors[:,
-                                              1][np.newaxis, np.newaxis, :] / height
-
-        # (x,y) in the network outputs is the center of the bounding box. Convert them to top-left.
-        x = x - w / 2
-        y = y - h / 2
-        boxes = np.stack((x, y, w, h), axis=-1).reshape(-1, 4)
-
-        # Get confidence for the bounding boxes.
-        objectness = self._logistic(outputs[..., 4])
-
-        # Get class probabilities for the bounding boxes.
-        class_probs = outputs[..., 5:]
-        class_probs = np.exp(
-            class_probs - np.amax(class_probs, axis=3)[..., np.newaxis])
-        class_probs = class_probs / \
-            np.sum(class_probs, axis=3)[...,
-                                        np.newaxis] * objectness[..., np.newaxis]
-        class_probs = class_probs.reshape(-1, num_class)
-
-        assert len(boxes) == len(class_probs)
-        return (boxes, class_probs)
+    def _extract_bb(self, prediction_output, anchors, prob_threshold=None):
+        return extract_bb(prediction_output, anchors, len(self.labels), prob_threshold)
 
     def predict_image(self, image):
         logging.info('predict_image')
@@ -213,6 +126,16 @@ class ObjectDetection(object):
         return self.postprocess(prediction_outputs), infer_time
         # return boxes, scores, indices
 
+    def predict_images(self, images):
+        """Batched version of predict_image
+
+        Returns:
+            (list of predictions for each image, inference time of the batch)
+        """
+        inputs = [self.preprocess(image) for image in images]
+        prediction_outputs, infer_time = self.predict_batch(inputs)
+        return [self.postprocess(o) for o in prediction_outputs], infer_time
+
     def preprocess(self, image):
         logging.info('pre')
         if self.input_format == "RGB":
@@ -248,6 +171,29 @@ class ObjectDetection(object):
         return np.squeeze(outputs).transpose((1, 2, 0)), inference_time
         # return boxes, scores, indices
 
+    def predict_batch(self, preprocessed_inputs_list):
+        """Evaluate the model on several preprocessed inputs in one session run
+
+        Falls back to one run per input if the model has a fixed batch size.
+        """
+        if not self.is_batchable or len(preprocessed_inputs_list) == 1:
+            start = time.time()
+            outputs = [self.predict(inputs)[0] for inputs in preprocessed_inputs_list]
+            return outputs, time.time() - start
+
+        inputs = np.array(preprocessed_inputs_list, dtype=np.float32)[
+            :, :, :, (2, 1, 0)]  # RGB -> BGR
+        inputs = np.ascontiguousarray(np.rollaxis(inputs, 3, 1))
+        start = time.time()
+        try:
+            outputs = self.session.run(None, {self.input_name: inputs})
+        except Exception:
+            logging.warning('Batched inference failed, fallback to batch size 1')
+            self.is_batchable = False
+            return self.predict_batch(preprocessed_inputs_list)
+        inference_time = time.time() - start
+        return [output.transpose((1, 2, 0)) for output in outputs[0]], inference_time
+
     def postprocess(self, prediction_outputs):
         """ Extract bounding boxes from the model outputs.
 
@@ -258,7 +204,8 @@ class ObjectDetection(object):
             List of Prediction objects.
         """
         logging.info('post')
-        boxes, class_probs = self._extract_bb(prediction_outputs, self.anchors)
+        boxes, class_probs = self._extract_bb(prediction_outputs, self.anchors,
+                                              self.prob_threshold)
 
         # Remove bounding boxes whose confidence is lower than the threshold.
         max_probs = np.amax(class_probs, axis=1)
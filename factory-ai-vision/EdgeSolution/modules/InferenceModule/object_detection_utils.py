@@ -0,0 +1,171 @@
+"""Object Detection Utils
+
+Vectorized YOLO box decoding and non-maximum suppression shared by
+object_detection.py and object_detection2.py.
+"""
+
+import numpy as np
+
+
+def logistic(x):
+    return np.where(x > 0, 1 / (1 + np.exp(-x)), np.exp(x) / (1 + np.exp(x)))
+
+
+def extract_bb(prediction_output, anchors, num_labels, prob_threshold=None):
+    """Decode bounding boxes from a YOLO output (H x W x C).
+
+    Args:
+        prediction_output: Output from the object detection model. (H x W x C)
+        anchors: anchor sizes, (num_anchor x 2)
+        num_labels (int): number of labels of the model
+        prob_threshold (float): if set, skip boxes whose objectness is not
+            above the threshold. Their class probabilities can't be either,
+            since class_prob = softmax * objectness.
+
+    Returns:
+        (boxes, class_probs), boxes in (left, top, width, height)
+    """
+    assert len(prediction_output.shape) == 3
+    num_anchor = anchors.shape[0]
+    height, width, channels = prediction_output.shape
+    assert channels % num_anchor == 0
+
+    num_class = int(channels / num_anchor) - 5
+    assert num_class == num_labels
+
+    outputs = prediction_output.reshape((height * width * num_anchor, -1))
+    grid_x = np.tile(np.repeat(np.arange(width), num_anchor), height)
+    grid_y = np.repeat(np.arange(height), width * num_anchor)
+    anchor_w = np.tile(anchors[:, 0], height * width)
+    anchor_h = np.tile(anchors[:, 1], height * width)
+
+    # Get confidence for the bounding boxes.
+    objectness = logistic(outputs[:, 4])
+
+    if prob_threshold is not None:
+        (rows,) = np.where(objectness > prob_threshold)
+        outputs = outputs[rows]
+        objectness = objectness[rows]
+        grid_x, grid_y = grid_x[rows], grid_y[rows]
+        anchor_w, anchor_h = anchor_w[rows], anchor_h[rows]
+
+    # Extract bouding box information
+    x = (logistic(outputs[:, 0]) + grid_x) / width
+    y = (logistic(outputs[:, 1]) + grid_y) / height
+    w = np.exp(outputs[:, 2]) * anchor_w / width
+    h = np.exp(outputs[:, 3]) * anchor_h / height
+
+    # (x,y) in the network outputs is the center of the bounding box. Convert them to top-left.
+    x = x - w / 2
+    y = y - h / 2
+    boxes = np.stack((x, y, w, h), axis=-1)
+
+    # Get class probabilities for the bounding boxes.
+    class_probs = outputs[:, 5:]
+    class_probs = np.exp(class_probs - np.amax(class_probs, axis=1)[:, np.newaxis])
+    class_probs = (
+        class_probs
+        / np.sum(class_probs, axis=1)[:, np.newaxis]
+        * objectness[:, np.newaxis]
+    )
+
+    assert len(boxes) == len(class_probs)
+    return (boxes, class_probs)
+
+
+def iou(box, boxes, areas=None):
+    """Intersection Over Union between box and each of boxes, (left, top, width, height)."""
+    if areas is None:
+        areas = boxes[:, 2] * boxes[:, 3]
+    area = box[2] * box[3]
+
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[0] + box[2], boxes[:, 0] + boxes[:, 2])
+    y2 = np.minimum(box[1] + box[3], boxes[:, 1] + boxes[:, 3])
+    w = np.maximum(0, x2 - x1)
+    h = np.maximum(0, y2 - y1)
+
+    overlap_area = w * h
+    return overlap_area / (area + areas - overlap_area)
+
+
+def non_maximum_suppression(
+    boxes,
+    class_probs,
+    max_detections,
+    prob_threshold,
+    iou_threshold,
+    class_agnostic=False,
+):
+    """Remove overlapping bouding boxes
+
+    Sorted greedy suppression, vectorized for each pick. Every (box, class)
+    pair above prob_threshold is a candidate, processed by descending
+    probability (ties by box then class index); a selected candidate
+    suppresses the same class of every box overlapping it, including its
+    own box. This is what the former per-pick loop computed.
+
+    Args:
+        boxes: (N x 4), sorted by descending max class probability
+        class_probs: (N x num_class)
+        max_detections (int): the max number of output results, also
+            bounded by N.
+        prob_threshold (float): min class probability of a result
+        iou_threshold (float): overlap above which a box is suppressed
+        class_agnostic (bool): keep only the best class of each box and
+            suppress overlapping boxes regardless of their class.
+
+    Returns:
+        (selected_boxes, selected_classes, selected_probs)
+    """
+    assert len(boxes) == len(class_probs)
+
+    max_detections = min(max_detections, len(boxes))
+    if max_detections == 0:
+        return [], [], []
+
+    if class_agnostic:
+        rows = np.arange(len(boxes))
+        classes = np.argmax(class_probs, axis=1)
+        probs = class_probs[rows, classes]
+        keep = probs >= prob_threshold
+        rows, classes, probs = rows[keep], classes[keep], probs[keep]
+    else:
+        rows, classes = np.nonzero(class_probs >= prob_threshold)
+        probs = class_probs[rows, classes]
+
+    order = np.lexsort((classes, rows, -probs))
+    rows, classes, probs = rows[order], classes[order], probs[order]
+
+    # Overlaps of a selected box with every box. Computed once per box,
+    # a box can be selected again for another class.
+    areas = boxes[:, 2] * boxes[:, 3]
+    overlapping = {}
+
+    alive = np.ones(len(rows), dtype=bool)
+    selected = []
+    k = 0
+    while k < len(rows) and len(selected) < max_detections:
+        selected.append(k)
+        row = rows[k]
+        if row not in overlapping:
+            overlapping[row] = iou(boxes[row], boxes, areas) > iou_threshold
+            overlapping[row][row] = True
+        suppressed = overlapping[row][rows]
+        if not class_agnostic:
+            suppressed &= classes == classes[k]
+        alive &= ~suppressed
+
+        # next candidate still alive
+        remaining = np.flatnonzero(alive[k + 1 :])
+        if len(remaining) == 0:
+            break
+        k = k + 1 + remaining[0]
+
+    selected = np.array(selected, dtype=int)
+    return (
+        list(boxes[rows[selected]]),
+        list(classes[selected]),
+        list(probs[selected]),
+    )
@@ -28,6 +28,8 @@ class ONNXRuntimeObjectDetection(ObjectDetection):
             self.session = onnxruntime.InferenceSession(temp)
         self.input_name = self.session.get_inputs()[0].name
         self.is_fp16 = self.session.get_inputs()[0].type == 'tensor(float16)'
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.is_batchable = not (isinstance(batch_dim, int) and batch_dim == 1)
 
     def predict(self, preprocessed_image):
         inputs = np.array(preprocessed_image, dtype=np.float32)[np.newaxis,:,:,(2,1,0)] # RGB -> BGR
@@ -39,6 +41,24 @@ class ONNXRuntimeObjectDetection(ObjectDetection):
         outputs = self.session.run(None, {self.input_name: inputs})
         return np.squeeze(outputs).transpose((1,2,0)).astype(np.float32)
 
+    def predict_batch(self, preprocessed_images):
+        if not self.is_batchable or len(preprocessed_images) == 1:
+            return [self.predict(image) for image in preprocessed_images]
+
+        inputs = np.array([np.array(image, dtype=np.float32) for image in preprocessed_images])[:,:,:,(2,1,0)] # RGB -> BGR
+        inputs = np.ascontiguousarray(np.rollaxis(inputs, 3, 1))
+
+        if self.is_fp16:
+            inputs = inputs.astype(np.float16)
+
+        try:
+            outputs = self.session.run(None, {self.input_name: inputs})
+        except Exception:
+            print('[WARNING] Batched inference failed, fallback to batch size 1', flush=True)
+            self.is_batchable = False
+            return self.predict_batch(preprocessed_images)
+        return [output.transpose((1,2,0)).astype(np.float32) for output in outputs[0]]
+
 #def main(image_filename):
 #    # Load labels
 #    with open(LABELS_FILENAME, 'r') as f:
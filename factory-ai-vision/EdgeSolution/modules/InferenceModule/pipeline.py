@@ -0,0 +1,120 @@
+"""Pipeline
+
+Staged frame processing with bounded queues between the stages.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStage:
+    """A stage running `func` on its own worker thread.
+
+    The result of `func` is handed to `next_stage`. Returning None drops
+    the item.
+    """
+
+    def __init__(self, name, func, next_stage=None, queue_size=2):
+        self.name = name
+        self.func = func
+        self.next_stage = next_stage
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queue_size = queue_size
+
+        self.is_alive = True
+        self.processed = 0
+        self.dropped = 0
+        self.average_latency = 0
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def put(self, item):
+        """Put an item and block while the stage is busy (backpressure)."""
+        while self.is_alive:
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def put_nowait(self, item):
+        """Put an item and drop the oldest one if the queue is full."""
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def stop(self):
+        self.is_alive = False
+        self.put_nowait(None)
+
+    def _run(self):
+        while self.is_alive:
+            item = self.queue.get()
+            if item is None:
+                continue
+
+            start = time.time()
+            try:
+                result = self.func(item)
+            except Exception:
+                logger.exception("Pipeline stage %s failed", self.name)
+                continue
+
+            # moving avg, same as Stream.average_inference_time
+            latency_ms = (time.time() - start) * 1000
+            self.average_latency = 1 / 16 * latency_ms + 15 / 16 * self.average_latency
+            self.processed += 1
+
+            if self.next_stage and result is not None:
+                self.next_stage.put(result)
+
+    def get_metrics(self):
+        return {
+            "name": self.name,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue_size,
+            "average_latency": self.average_latency,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+
+
+class Pipeline:
+    """Chain of PipelineStage.
+
+    Only the entry of the pipeline drops frames (oldest first), so the
+    caller never blocks. Inner stages apply backpressure to each other.
+
+    Args:
+        stages: list of (name, func)
+        queue_size (int): queue size between two stages
+    """
+
+    def __init__(self, stages, queue_size=2):
+        self.stages = []
+        next_stage = None
+        for name, func in reversed(stages):
+            next_stage = PipelineStage(name, func, next_stage, queue_size)
+            self.stages.insert(0, next_stage)
+
+    def put(self, item):
+        self.stages[0].put_nowait(item)
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def get_metrics(self):
+        return [stage.get_metrics() for stage in self.stages]
@@ -22,7 +22,9 @@ from fastapi.responses import StreamingResponse
 
 import extension_pb2_grpc
 from api.models import (
+    CameraModel,
     CamerasModel,
+    ConfigurationModel,
     PartDetectionModeEnum,
     PartsModel,
     StreamModel,
@@ -35,7 +37,9 @@ from inference_engine import InferenceEngine
 from invoke import gm
 from logging_conf import logging_config
 from model_wrapper import ONNXRuntimeModelDeploy
+from shared_memory import FrameRingReader
 from stream_manager import StreamManager
+from streams import side_channel
 from utility import is_edge
 
 # sys.path.insert(0, '../lib')
@@ -56,12 +60,18 @@ IMG_HEIGHT = 540
 
 LVA_MODE = os.environ.get("LVA_MODE", "grpc")
 IS_OPENCV = os.environ.get("IS_OPENCV", "false")
+# Frame transport from CVCaptureModule: http, zmq or shm
+CV_TRANSPORT = os.environ.get("CV_TRANSPORT", "http")
 
 # Main thread
 
 onnx = ONNXRuntimeModelDeploy()
 stream_manager = StreamManager(onnx)
 
+# Sections of the last configuration applied by /apply_configuration
+applied_configuration = {}
+configuration_mutex = threading.Lock()
+
 app = FastAPI(
     title="InferenceModule", description="Factory AI InferenceModule.", version="0.0.1",
 )
@@ -104,27 +114,25 @@ async def predict(camera_id: str, request: Request):
     return "", 204
 
 
-@app.get("/metrics")
-def metrics(cam_id: str):
-    """metrics."""
+def get_stream_metrics(stream):
+    """Metrics of one stream, zeros if the stream doesn't exist."""
     inference_num = 0
     unidentified_num = 0
     total = 0
     success_rate = 0
     average_inference_time = 0
     last_prediction_count = {}
-    is_gpu = onnx.is_gpu
     scenario_metrics = []
+    pipeline_metrics = []
 
-    stream = stream_manager.get_stream_by_id_danger(cam_id)
     if stream:
-        last_prediction_count = {}
         inference_num = stream.detection_success_num
         unidentified_num = stream.detection_unidentified_num
         total = stream.detection_total
         average_inference_time = stream.average_inference_time
         last_prediction_count = stream.last_prediction_count
         scenario_metrics = stream.get_scenario_metrics()
+        pipeline_metrics = stream.get_pipeline_metrics()
         if total == 0:
             success_rate = 0
         else:
@@ -133,13 +141,61 @@ def metrics(cam_id: str):
         "success_rate": success_rate,
         "inference_num": inference_num,
         "unidentified_num": unidentified_num,
-        "is_gpu": is_gpu,
         "average_inference_time": average_inference_time,
         "last_prediction_count": last_prediction_count,
         "scenario_metrics": scenario_metrics,
+        "pipeline_metrics": pipeline_metrics,
+    }
+
+
+@app.get("/metrics")
+def metrics(cam_id: str):
+    """metrics."""
+    stream = stream_manager.get_stream_by_id_danger(cam_id)
+    return {
+        **get_stream_metrics(stream),
+        "is_gpu": onnx.is_gpu,
+        "batch_metrics": onnx.get_batch_metrics(),
+        "side_channel_metrics": side_channel.get_metrics(),
+    }
+
+
+@app.get("/metrics_all")
+def metrics_all(cam_ids: str = None):
+    """metrics_all.
+
+    Metrics of every stream in one call.
+
+    Args:
+        cam_ids: comma separated cam_ids, all streams if not given
+    """
+    if cam_ids is None:
+        streams = {
+            str(stream.cam_id): stream for stream in stream_manager.get_streams()
+        }
+    else:
+        streams = {
+            cam_id: stream_manager.get_stream_by_id_danger(cam_id)
+            for cam_id in cam_ids.split(",")
+            if cam_id
+        }
+    return {
+        "cameras": {
+            cam_id: get_stream_metrics(stream) for cam_id, stream in streams.items()
+        },
+        "is_gpu": onnx.is_gpu,
+        "batch_metrics": onnx.get_batch_metrics(),
+        "side_channel_metrics": side_channel.get_metrics(),
     }
 
 
+def forget_applied_configuration(*names):
+    """Sections updated by their own endpoint are applied again by
+    /apply_configuration."""
+    for name in names:
+        applied_configuration.pop(name, None)
+
+
 @app.get("/update_part_detection_id")
 def update_part_detection_id(part_detection_id: int):
     """update_part_detection_id."""
@@ -151,6 +207,7 @@ def update_retrain_parameters(
     is_retrain: bool, confidence_min: int, confidence_max: int, max_images: int
 ):
     """update_retrain_parameters."""
+    forget_applied_configuration("retrain_parameters")
 
     # FIXME currently set all streams
     # cam_id = request.args.get('cam_id')
@@ -175,6 +232,7 @@ def update_retrain_parameters(
 @app.post("/update_model")
 def update_model(request_body: UploadModelBody):
     """update_model."""
+    forget_applied_configuration("part_detection_mode", "model")
 
     if not request_body.model_uri and not request_body.model_dir:
         return "missing model_uri or model_dir", 400
@@ -219,6 +277,46 @@ def update_model(request_body: UploadModelBody):
         return "ok"
 
 
+def update_stream_cam(cam: CameraModel, frame_rate: int, lva_mode: str):
+    """update_stream_cam.
+
+    Update the stream of a camera, the stream must exist.
+    """
+    cam_type = cam.type
+    cam_source = cam.source
+    cam_id = cam.id
+    # TODO: IF onnx.part_detection_mode == "PC" (PartCounting), use lines to count
+    line_info = cam.lines
+    zone_info = cam.zones
+
+    if cam.aoi:
+        aoi = json.loads(cam.aoi)
+        has_aoi = aoi["useAOI"]
+        aoi_info = aoi["AOIs"]
+        logger.info("aoi information")
+    else:
+        has_aoi = False
+        aoi_info = None
+
+    logger.info("Updating camera %s", cam_id)
+    stream = stream_manager.get_stream_by_id(cam_id)
+    # s.update_cam(cam_type, cam_source, cam_id, has_aoi, aoi_info, cam_lines)
+    # FIXME has_aoi
+    stream.update_cam(
+        cam_type,
+        cam_source,
+        frame_rate,
+        lva_mode,
+        cam_id,
+        has_aoi,
+        aoi_info,
+        onnx.detection_mode,
+        line_info,
+        zone_info,
+    )
+    stream.send_video_to_cloud = cam.send_video_to_cloud
+
+
 @app.post("/update_cams")
 def update_cams(request_body: CamerasModel):
     """update_cams.
@@ -226,6 +324,7 @@ def update_cams(request_body: CamerasModel):
     Update multiple cameras at once.
     Cameras not in List should not inferecence.
     """
+    forget_applied_configuration("cameras")
     logger.info(request_body)
     frame_rate = request_body.fps
     stream_manager.update_streams([cam.id for cam in request_body.cameras])
@@ -244,39 +343,7 @@ def update_cams(request_body: CamerasModel):
         lva_mode = onnx.lva_mode
 
     for cam in request_body.cameras:
-        cam_type = cam.type
-        cam_source = cam.source
-        cam_id = cam.id
-        # TODO: IF onnx.part_detection_mode == "PC" (PartCounting), use lines to count
-        line_info = cam.lines
-        zone_info = cam.zones
-
-        if cam.aoi:
-            aoi = json.loads(cam.aoi)
-            has_aoi = aoi["useAOI"]
-            aoi_info = aoi["AOIs"]
-            logger.info("aoi information")
-        else:
-            has_aoi = False
-            aoi_info = None
-
-        logger.info("Updating camera %s", cam_id)
-        stream = stream_manager.get_stream_by_id(cam_id)
-        # s.update_cam(cam_type, cam_source, cam_id, has_aoi, aoi_info, cam_lines)
-        # FIXME has_aoi
-        stream.update_cam(
-            cam_type,
-            cam_source,
-            frame_rate,
-            lva_mode,
-            cam_id,
-            has_aoi,
-            aoi_info,
-            onnx.detection_mode,
-            line_info,
-            zone_info,
-        )
-        stream.send_video_to_cloud = cam.send_video_to_cloud
+        update_stream_cam(cam, frame_rate, lva_mode)
 
     logger.info("Streams %s", stream_manager.streams)
     return "ok"
@@ -285,6 +352,7 @@ def update_cams(request_body: CamerasModel):
 @app.get("/update_part_detection_mode")
 def update_part_detection_mode(part_detection_mode: PartDetectionModeEnum):
     """update_part_detection_mode."""
+    forget_applied_configuration("part_detection_mode")
 
     onnx.set_detection_mode(part_detection_mode.value)
     return "ok"
@@ -293,6 +361,7 @@ def update_part_detection_mode(part_detection_mode: PartDetectionModeEnum):
 @app.post("/update_parts")
 def update_parts(parts: PartsModel):
     """update_parts."""
+    forget_applied_configuration("parts")
     try:
         logger.info("Updating parts...")
         part_names = [part.name for part in parts.parts]
@@ -312,6 +381,7 @@ def update_parts(parts: PartsModel):
 @app.get("/update_iothub_parameters")
 def update_iothub_parameters(is_send: bool, threshold: int, fpm: int):
     """update_iothub_parameters."""
+    forget_applied_configuration("iothub_parameters")
 
     threshold = threshold * 0.01
 
@@ -359,6 +429,7 @@ def get_scenario():
 @app.get("/update_prob_threshold")
 def update_prob_threshold(prob_threshold: int):
     """update_prob_threshold."""
+    forget_applied_configuration("prob_threshold")
 
     logger.info("Updating prob_threshold to")
     logger.info("  prob_threshold: %s", prob_threshold)
@@ -375,6 +446,135 @@ def update_prob_threshold(prob_threshold: int):
     return "ok"
 
 
+def update_stream_parameters(streams, name, value):
+    """update_stream_parameters.
+
+    Update a retrain_parameters, iothub_parameters or prob_threshold
+    configuration section of streams.
+    """
+    for stream in streams:
+        if name == "retrain_parameters":
+            stream.update_retrain_parameters(
+                value.is_retrain,
+                value.confidence_min * 0.01,
+                value.confidence_max * 0.01,
+                value.max_images,
+            )
+        elif name == "iothub_parameters":
+            stream.update_iothub_parameters(
+                value.is_send, value.threshold * 0.01, value.fpm
+            )
+        elif name == "prob_threshold":
+            stream.threshold = value * 0.01
+
+
+def apply_cameras(cameras: CamerasModel, previous: CamerasModel, force: bool):
+    """apply_cameras.
+
+    Add and remove streams, then update the cameras that changed since the
+    previous configuration, or all of them if force. Metrics of the other
+    streams are kept.
+
+    Returns:
+        list: ids of the streams added
+    """
+    stream_ids = [cam.id for cam in cameras.cameras]
+    origin_stream_ids = {stream.cam_id for stream in stream_manager.get_streams()}
+    stream_manager.update_streams(stream_ids, reset_metrics=False)
+    onnx.set_frame_rate(cameras.fps)
+    onnx.set_lva_mode(cameras.lva_mode)
+
+    previous_cams = {}
+    if (
+        not force
+        and previous is not None
+        and (previous.fps, previous.lva_mode) == (cameras.fps, cameras.lva_mode)
+    ):
+        previous_cams = {cam.id: cam for cam in previous.cameras}
+    for cam in cameras.cameras:
+        if cam.id in origin_stream_ids and previous_cams.get(cam.id) == cam:
+            logger.info("Camera %s unchanged", cam.id)
+            continue
+        update_stream_cam(cam, cameras.fps, cameras.lva_mode)
+
+    logger.info("Streams %s", stream_manager.streams)
+    return [
+        stream_id for stream_id in stream_ids if stream_id not in origin_stream_ids
+    ]
+
+
+@app.post("/apply_configuration")
+def apply_configuration(request_body: ConfigurationModel):
+    """apply_configuration.
+
+    Apply the whole configuration in one request. Each section is compared
+    with the last applied configuration and only the changed ones are
+    updated: unchanged cameras keep their LVA graph, scenario and metrics.
+    """
+    with configuration_mutex:
+        state = dict(applied_configuration)
+        desired = {name: value for name, value in request_body if value is not None}
+        changed = {name for name, value in desired.items() if state.get(name) != value}
+        # update_model forces the detection mode, both are applied together
+        if changed & {"part_detection_mode", "model"}:
+            changed |= {"part_detection_mode", "model"} & set(desired)
+        logger.info("Applying configuration sections %s", sorted(changed))
+
+        applied = []
+
+        def _applied(name):
+            state[name] = desired[name]
+            applied.append(name)
+
+        try:
+            if "part_detection_id" in changed:
+                update_part_detection_id(desired["part_detection_id"])
+                _applied("part_detection_id")
+            if "part_detection_mode" in changed:
+                update_part_detection_mode(desired["part_detection_mode"])
+                _applied("part_detection_mode")
+            if "model" in changed:
+                result = update_model(desired["model"])
+                if isinstance(result, tuple) and result[1] == 400:
+                    logger.warning("Model not updated: %s", result[0])
+                else:
+                    _applied("model")
+            if "parts" in changed:
+                update_parts(desired["parts"])
+                _applied("parts")
+
+            new_stream_ids = []
+            if "cameras" in desired and (
+                "cameras" in changed or "part_detection_mode" in changed
+            ):
+                # Scenarios depend on the detection mode
+                new_stream_ids = apply_cameras(
+                    desired["cameras"],
+                    state.get("cameras"),
+                    force="part_detection_mode" in changed,
+                )
+                _applied("cameras")
+
+            streams = stream_manager.get_streams()
+            new_streams = [s for s in streams if s.cam_id in new_stream_ids]
+            for name in ("retrain_parameters", "iothub_parameters", "prob_threshold"):
+                if name not in desired:
+                    continue
+                if name in changed:
+                    update_stream_parameters(streams, name, desired[name])
+                    if name == "prob_threshold":
+                        for stream in streams:
+                            stream.reset_metrics()
+                    _applied(name)
+                elif new_streams:
+                    update_stream_parameters(new_streams, name, desired[name])
+        finally:
+            applied_configuration.clear()
+            applied_configuration.update(state)
+
+    return {"applied": applied}
+
+
 @app.get("/get_recommended_fps")
 def get_recommended_fps(number_of_cameras: int):
     """get_recommended_fps.
@@ -404,6 +604,7 @@ def get_recommended_total_fps():
 @app.get("/update_lva_mode")
 def update_lva_mode(lva_mode: str):
     """update_lva_mode."""
+    forget_applied_configuration("cameras")
     logger.info("Updating lva_mode...")
 
     for s in stream_manager.get_streams():
@@ -525,7 +726,7 @@ def benchmark():
         t0_t = time.time()
         img = cv2.imread("img.png")
         for i in range(n_images):
-            s.predict(img)
+            s.predict(img, sync=True)
         t1_t = time.time()
         print("---- Thread", threading.current_thread(), "----", flush=True)
         print("Processing", n_images, "images in", t1_t - t0_t, "seconds", flush=True)
@@ -588,8 +789,7 @@ def opencv_zmq():
                 nparr = np.frombuffer(buf[1], np.uint8)
                 img = nparr.reshape(-1, 960, 3)
                 # img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                stream.predict(img)
-                predictions = stream.last_prediction
+                predictions = stream.predict(img, sync=True)
                 logger.info("Predictions %s", predictions)
             except:
                 logger.error("Unexpected error: %s", sys.exc_info())
@@ -599,6 +799,43 @@ def opencv_zmq():
     # threading.Thread(target=run).start()
 
 
+def opencv_shm_zmq():
+    """opencv_shm_zmq.
+
+    Receive frame descriptors from CVCaptureModule and copy the frames out
+    of its shared memory ring.
+    """
+    context = zmq.Context()
+    receiver = context.socket(zmq.SUB)
+    receiver.setsockopt(zmq.SUBSCRIBE, bytes("", "utf-8"))
+    receiver.connect(cvcapture_url())
+    frame_ring_reader = FrameRingReader()
+
+    def run():
+        while True:
+            buf = receiver.recv_multipart()
+            stream = stream_manager.get_stream_by_id(buf[0].decode("utf-8"))
+            if not stream:
+                logger.info("Stream not ready yet.")
+                continue
+            try:
+                descriptor = json.loads(buf[1])
+                img = frame_ring_reader.read_frame(descriptor)
+                if img is None:
+                    logger.warning(
+                        "Stream %s dropped frame %s, slot overwritten",
+                        descriptor["stream_id"],
+                        descriptor["seq"],
+                    )
+                    continue
+                stream.predict(img)
+            except:
+                logger.error("Unexpected error: %s", sys.exc_info())
+        receiver.close()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 def main():
     """main.
 
@@ -635,6 +872,10 @@ def main():
         else:
             logger.info("opencv server")
             # opencv_zmq()
+            if CV_TRANSPORT == "shm":
+                opencv_shm_zmq()
+            elif CV_TRANSPORT == "zmq":
+                opencv_zmq()
         uvicorn.run(app, host="0.0.0.0", port=5000)
         # server.wait_for_termination()
 
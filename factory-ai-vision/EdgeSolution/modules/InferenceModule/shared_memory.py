@@ -2,8 +2,15 @@ import tempfile
 import mmap
 import os
 import logging
+import struct
+from collections import deque
+import numpy as np
 from exception_handler import PrintGetExceptionDetails
 
+# Frame ring slot written by CVCaptureModule: [sequence number (uint64)][raw BGR frame]
+# Keep in sync with CVCaptureModule/shared_memory.py
+SLOT_HEADER = struct.Struct('<Q')
+
 # ***********************************************************************************
 # Shared memory management 
 #
@@ -35,6 +42,15 @@ class SharedMemoryManager:
             # self._mem_slots[sequenceNo] = [Begin, End]        (closed interval)
             self._memSlots = dict()
 
+            # Ring allocator: live blocks are contiguous from the oldest block
+            # (tail) to _ringHead, possibly wrapping around the end of the file.
+            # _slotOrder keeps sequence numbers in allocation order, blocks
+            # released out of order are reclaimed once they reach the tail.
+            self._slotOrder = deque()
+            self._releasedSlots = set()
+            self._ringHead = 0
+            self._usedBytes = 0
+
             logging.info('Shared memory name: {0}'.format(self._shmFileFullPath))
         except:
             PrintGetExceptionDetails()
@@ -54,51 +70,100 @@ class SharedMemoryManager:
             PrintGetExceptionDetails()
             raise
 
+    # Zero-copy view of a raw frame stored at memorySlotOffset
+    def ReadFrame(self, memorySlotOffset, shape, dtype=np.uint8):
+        try:
+            length = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            return np.frombuffer(self.ReadBytes(memorySlotOffset, length), dtype=dtype).reshape(shape)
+        except:
+            PrintGetExceptionDetails()
+            raise
+
+    # Sequence number in the header of a frame ring slot, 0 while it is being written
+    def ReadSequenceNumber(self, memorySlotOffset):
+        return SLOT_HEADER.unpack_from(self._shm, memorySlotOffset - SLOT_HEADER.size)[0]
+
     # Returns None if no availability
     # Returns closed interval [Begin, End] address with available slot
     def GetEmptySlot(self, seqNo, sizeNeeded):
         address = None
 
-        if sizeNeeded < 1:
+        if sizeNeeded < 1 or seqNo in self._memSlots:
             return address
 
-        # Empty memory
-        if len(self._memSlots) < 1:
-            if self._shmFileSize >= sizeNeeded:
-                self._memSlots[seqNo] = (0, sizeNeeded - 1)
-                address = (0, sizeNeeded - 1)
-            else:
-                address = None
+        if len(self._slotOrder) < 1:
+            # Empty memory
+            begin = 0 if self._shmFileSize >= sizeNeeded else None
         else:
-            self._memSlots = {k: v for k, v in sorted(
-                self._memSlots.items(), key=lambda item: item[1])}
-
-            # find an available memory gap = sizeNeeded
-            prevSlotEnd = 0
-            for k, v in self._memSlots.items():
-                if (v[0] - prevSlotEnd - 1) >= sizeNeeded:
-                    address = (prevSlotEnd + 1, prevSlotEnd + sizeNeeded)
-                    self._memSlots[seqNo] = (address[0], address[1])
-                    break
+            tail = self._memSlots[self._slotOrder[0]][0]
+            if self._ringHead > tail:
+                # free: [head, size) then [0, tail)
+                if self._shmFileSize - self._ringHead >= sizeNeeded:
+                    begin = self._ringHead
+                elif tail >= sizeNeeded:
+                    begin = 0
                 else:
-                    prevSlotEnd = v[1]
+                    begin = None
+            else:
+                # wrapped, free: [head, tail)
+                begin = self._ringHead if tail - self._ringHead >= sizeNeeded else None
 
-            # no gap in between, check last possible gap
-            if address is None:
-                if (self._shmFileSize - prevSlotEnd + 1) >= sizeNeeded:
-                    address = (prevSlotEnd + 1, prevSlotEnd + sizeNeeded)
-                    self._memSlots[seqNo] = (address[0], address[1])
+        if begin is not None:
+            address = (begin, begin + sizeNeeded - 1)
+            self._memSlots[seqNo] = address
+            self._slotOrder.append(seqNo)
+            self._ringHead = begin + sizeNeeded
+            self._usedBytes += sizeNeeded
 
         # interval [Begin, End]
         return address
 
     def DeleteSlot(self, seqNo):
-        try:
-            del self._memSlots[seqNo]
-            return True
-        except KeyError:
+        if seqNo not in self._memSlots or seqNo in self._releasedSlots:
             return False
 
+        begin, end = self._memSlots[seqNo]
+        self._usedBytes -= end - begin + 1
+        self._releasedSlots.add(seqNo)
+
+        # Reclaim released blocks from the tail (FIFO is the common case)
+        while self._slotOrder and self._slotOrder[0] in self._releasedSlots:
+            oldest = self._slotOrder.popleft()
+            self._releasedSlots.discard(oldest)
+            del self._memSlots[oldest]
+
+        if len(self._slotOrder) < 1:
+            self._ringHead = 0
+
+        return True
+
+    def GetStatistics(self):
+        """Occupancy and fragmentation of the ring allocator.
+
+        occupied_bytes is the span from the oldest live block to the ring
+        head, it includes blocks released out of order and the unused end of
+        the file skipped when wrapping. fragmentation is the share of that
+        span which is not in use.
+        """
+        if len(self._slotOrder) < 1:
+            occupiedBytes = 0
+        else:
+            tail = self._memSlots[self._slotOrder[0]][0]
+            if self._ringHead > tail:
+                occupiedBytes = self._ringHead - tail
+            else:
+                occupiedBytes = self._shmFileSize - tail + self._ringHead
+
+        return {
+            'size': self._shmFileSize,
+            'used_bytes': self._usedBytes,
+            'occupied_bytes': occupiedBytes,
+            'occupancy': self._usedBytes / self._shmFileSize,
+            'fragmentation': 1 - self._usedBytes / occupiedBytes if occupiedBytes else 0,
+            'live_slots': len(self._slotOrder) - len(self._releasedSlots),
+            'pending_release_slots': len(self._releasedSlots),
+        }
+
     def __del__(self):
         try:
             if self._shmFlags is None:
@@ -109,3 +174,42 @@ class SharedMemoryManager:
             PrintGetExceptionDetails()
             raise
 
+
+class FrameRingReader:
+    """Copy frames out of the CVCaptureModule frame rings.
+
+    A ring is mapped on its first descriptor and mapped again when
+    CVCaptureModule recreates it, the descriptor then has another
+    generation or size.
+    """
+
+    def __init__(self):
+        # shm_name => ((shm_generation, shm_size), SharedMemoryManager)
+        self._rings = {}
+
+    def _get_manager(self, descriptor):
+        name = descriptor["shm_name"]
+        key = (descriptor.get("shm_generation"), descriptor["shm_size"])
+        ring = self._rings.get(name)
+        if ring is None or ring[0] != key:
+            ring = (key, SharedMemoryManager(name=name, size=descriptor["shm_size"]))
+            self._rings[name] = ring
+        return ring[1]
+
+    def read_frame(self, descriptor):
+        """Copy the frame of a descriptor.
+
+        Returns:
+            the frame, None if its slot was overwritten
+        """
+        shm_manager = self._get_manager(descriptor)
+        offset = descriptor["offset"]
+        # seqlock: the slot must hold the frame before and after the copy,
+        # CVCaptureModule may overwrite it meanwhile
+        if shm_manager.ReadSequenceNumber(offset) != descriptor["seq"]:
+            return None
+        img = shm_manager.ReadFrame(offset, descriptor["shape"]).copy()
+        if shm_manager.ReadSequenceNumber(offset) != descriptor["seq"]:
+            return None
+        return img
+
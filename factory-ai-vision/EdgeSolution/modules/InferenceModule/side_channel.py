@@ -0,0 +1,128 @@
+"""Side Channel
+
+Background dispatcher for side effects of the inference loop (retrain
+image uploads, IoT Hub messages, LVA signals), so a slow WebModule or
+IoT Hub never stalls a camera.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+def is_retriable(error):
+    """Whether a failed job may succeed if retried."""
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    if isinstance(error, requests.RequestException):
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+    return True
+
+
+class SideChannelDispatcher:
+    """Run jobs on a worker thread with a bounded, drop-oldest queue.
+
+    A job that raises is retried with exponential backoff, then dropped.
+    HTTP errors other than 5xx (raise_for_status) are not retried, nor are
+    requests errors other than connection errors and timeouts. Jobs doing
+    HTTP should use `session`, a keep-alive session shared by every stream.
+
+    Args:
+        queue_size (int): max number of pending jobs
+        max_retries (int): retries after the first attempt
+        backoff (float): seconds before the first retry, doubled each retry
+    """
+
+    def __init__(self, queue_size=32, max_retries=3, backoff=0.5):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.mutex = threading.Lock()
+        self.counters = {}
+
+        self.is_alive = True
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, name, func, *args):
+        """Queue func(*args), never blocks.
+
+        The oldest pending job is dropped if the queue is full.
+        """
+        self._count(name, "submitted")
+        while True:
+            try:
+                self.queue.put_nowait((name, func, args))
+                return
+            except queue.Full:
+                try:
+                    dropped_name, _, _ = self.queue.get_nowait()
+                    self._count(dropped_name, "dropped")
+                except queue.Empty:
+                    pass
+
+    def stop(self):
+        self.is_alive = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _count(self, name, key):
+        with self.mutex:
+            if name not in self.counters:
+                self.counters[name] = {
+                    "submitted": 0,
+                    "sent": 0,
+                    "retried": 0,
+                    "failed": 0,
+                    "dropped": 0,
+                }
+            self.counters[name][key] += 1
+
+    def _run(self):
+        while self.is_alive:
+            item = self.queue.get()
+            if item is None:
+                continue
+
+            name, func, args = item
+            for attempt in range(self.max_retries + 1):
+                try:
+                    func(*args)
+                    self._count(name, "sent")
+                    break
+                except Exception as e:
+                    if (
+                        attempt == self.max_retries
+                        or not self.is_alive
+                        or not is_retriable(e)
+                    ):
+                        logger.warning("Side channel %s failed: %s", name, e)
+                        self._count(name, "failed")
+                        break
+                    self._count(name, "retried")
+                    time.sleep(self.backoff * 2 ** attempt)
+
+    def get_metrics(self):
+        with self.mutex:
+            counters = {k: dict(v) for k, v in self.counters.items()}
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue_size,
+            "counters": counters,
+        }
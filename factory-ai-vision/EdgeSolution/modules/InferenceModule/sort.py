@@ -171,27 +171,15 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
   else:
     matched_indices = np.empty(shape=(0,2))
 
-  unmatched_detections = []
-  for d, det in enumerate(detections):
-    if(d not in matched_indices[:,0]):
-      unmatched_detections.append(d)
-  unmatched_trackers = []
-  for t, trk in enumerate(trackers):
-    if(t not in matched_indices[:,1]):
-      unmatched_trackers.append(t)
+  unmatched_detections = list(np.flatnonzero(~np.isin(np.arange(len(detections)), matched_indices[:,0])))
+  unmatched_trackers = list(np.flatnonzero(~np.isin(np.arange(len(trackers)), matched_indices[:,1])))
 
   #filter out matched with low IOU
-  matches = []
-  for m in matched_indices:
-    if(iou_matrix[m[0], m[1]]<iou_threshold):
-      unmatched_detections.append(m[0])
-      unmatched_trackers.append(m[1])
-    else:
-      matches.append(m.reshape(1,2))
-  if(len(matches)==0):
-    matches = np.empty((0,2),dtype=int)
-  else:
-    matches = np.concatenate(matches,axis=0)
+  matched_indices = matched_indices.astype(int)
+  low_iou = iou_matrix[matched_indices[:,0], matched_indices[:,1]] < iou_threshold
+  unmatched_detections.extend(matched_indices[low_iou,0])
+  unmatched_trackers.extend(matched_indices[low_iou,1])
+  matches = matched_indices[~low_iou].reshape(-1,2)
 
   return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
 
@@ -252,6 +240,175 @@ class Sort(object):
       return np.concatenate(ret)
     return np.empty((0,5))
 
+
+def convert_bboxes_to_z(bboxes):
+  """
+  Vectorized convert_bbox_to_z, (N x 4) -> (N x 4 x 1)
+  """
+  w = bboxes[:, 2] - bboxes[:, 0]
+  h = bboxes[:, 3] - bboxes[:, 1]
+  x = bboxes[:, 0] + w/2.
+  y = bboxes[:, 1] + h/2.
+  s = w * h    #scale is just area
+  r = w / h
+  return np.stack((x, y, s, r), axis=1)[..., np.newaxis]
+
+
+def convert_xs_to_bboxes(xs):
+  """
+  Vectorized convert_x_to_bbox, (N x 7 x 1) -> (N x 4)
+  """
+  w = np.sqrt(xs[:, 2, 0] * xs[:, 3, 0])
+  h = xs[:, 2, 0] / w
+  return np.stack((xs[:, 0, 0]-w/2., xs[:, 1, 0]-h/2., xs[:, 0, 0]+w/2., xs[:, 1, 0]+h/2.), axis=1)
+
+
+# Same constant velocity model as KalmanBoxTracker
+KF_R = np.eye(4)
+KF_R[2:,2:] *= 10.
+KF_P = np.eye(7)
+KF_P[4:,4:] *= 1000.
+KF_P *= 10.
+KF_Q = np.eye(7)
+KF_Q[-1,-1] *= 0.01
+KF_Q[4:,4:] *= 0.01
+
+
+class VectorizedSort(object):
+  """
+  Sort keeping every track in stacked arrays (structure of arrays).
+
+  Predict and update run for all tracks in batched matrix operations. F and H
+  only select / add state entries, so they are applied by indexing, which
+  gives the same floating point results as the matrix products of
+  KalmanFilter. IDs are drawn from KalmanBoxTracker.count and the output is
+  the same as Sort.
+  """
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+    self.max_age = max_age
+    self.min_hits = min_hits
+    self.iou_threshold = iou_threshold
+    self.frame_count = 0
+
+    self.x = np.zeros((0, 7, 1))
+    self.P = np.zeros((0, 7, 7))
+    self.ids = np.zeros(0, dtype=int)
+    self.time_since_update = np.zeros(0, dtype=int)
+    self.hits = np.zeros(0, dtype=int)
+    self.hit_streak = np.zeros(0, dtype=int)
+    self.age = np.zeros(0, dtype=int)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def _keep(self, keep):
+    self.x = self.x[keep]
+    self.P = self.P[keep]
+    self.ids = self.ids[keep]
+    self.time_since_update = self.time_since_update[keep]
+    self.hits = self.hits[keep]
+    self.hit_streak = self.hit_streak[keep]
+    self.age = self.age[keep]
+
+  def _predict(self):
+    """
+    Advances every track, returns the predicted bboxes (N x 4).
+    """
+    x, P = self.x, self.P
+    x[(x[:, 6, 0] + x[:, 2, 0]) <= 0, 6] *= 0.0
+
+    # x = Fx
+    x = x.copy()
+    x[:, :3] += self.x[:, 4:]
+    # P = FPF' + Q
+    FP = P.copy()
+    FP[:, :3, :] += P[:, 4:, :]
+    P = FP.copy()
+    P[:, :, :3] += FP[:, :, 4:]
+    P += KF_Q
+    self.x, self.P = x, P
+
+    self.age += 1
+    self.hit_streak[self.time_since_update > 0] = 0
+    self.time_since_update += 1
+    return convert_xs_to_bboxes(self.x)
+
+  def _update(self, idx, bboxes):
+    """
+    Updates the tracks idx with observed bboxes.
+    """
+    x, P = self.x[idx], self.P[idx]
+    z = convert_bboxes_to_z(bboxes)
+
+    # y = z - Hx
+    y = z - x[:, :4]
+    # PH'
+    PHT = np.ascontiguousarray(P[:, :, :4])
+    # S = HPH' + R
+    S = PHT[:, :4, :] + KF_R
+    SI = np.linalg.inv(S)
+    K = np.matmul(PHT, SI)
+    x = x + np.matmul(K, y)
+
+    # P = (I-KH)P(I-KH)' + KRK'
+    KH = np.zeros_like(P)
+    KH[:, :, :4] = K
+    I_KH = np.eye(7) - KH
+    P = np.matmul(np.matmul(I_KH, P), I_KH.transpose(0, 2, 1)) + np.matmul(np.matmul(K, KF_R), K.transpose(0, 2, 1))
+
+    self.x[idx], self.P[idx] = x, P
+    self.time_since_update[idx] = 0
+    self.hits[idx] += 1
+    self.hit_streak[idx] += 1
+
+  def _create(self, bboxes):
+    n = len(bboxes)
+    x = np.zeros((n, 7, 1))
+    x[:, :4] = convert_bboxes_to_z(bboxes)
+    ids = np.arange(KalmanBoxTracker.count, KalmanBoxTracker.count + n)
+    KalmanBoxTracker.count += n
+
+    self.x = np.concatenate((self.x, x))
+    self.P = np.concatenate((self.P, np.repeat(KF_P[np.newaxis], n, axis=0)))
+    self.ids = np.concatenate((self.ids, ids))
+    self.time_since_update = np.concatenate((self.time_since_update, np.zeros(n, dtype=int)))
+    self.hits = np.concatenate((self.hits, np.zeros(n, dtype=int)))
+    self.hit_streak = np.concatenate((self.hit_streak, np.zeros(n, dtype=int)))
+    self.age = np.concatenate((self.age, np.zeros(n, dtype=int)))
+
+  def update(self, dets=np.empty((0, 5))):
+    """
+    Same as Sort.update
+    """
+    self.frame_count += 1
+    # get predicted locations from existing trackers.
+    trks = self._predict()
+    valid = ~np.any(np.isnan(trks), axis=1)
+    if not np.all(valid):
+      self._keep(valid)
+      trks = trks[valid]
+    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold)
+
+    # update matched trackers with assigned detections
+    if len(matched) > 0:
+      self._update(matched[:, 1], dets[matched[:, 0], :4])
+
+    # create and initialise new trackers for unmatched detections
+    if len(unmatched_dets) > 0:
+      self._create(dets[unmatched_dets.astype(int), :4])
+
+    # Sort walks its trackers backwards
+    reverse = np.arange(len(self) - 1, -1, -1)
+    selected = (self.time_since_update[reverse] < 1) & ((self.hit_streak[reverse] >= self.min_hits) | (self.frame_count <= self.min_hits))
+    selected = reverse[selected]
+    ret = np.concatenate((convert_xs_to_bboxes(self.x[selected]), (self.ids[selected] + 1)[:, np.newaxis]), axis=1)
+
+    # remove dead tracklet
+    self._keep(self.time_since_update <= self.max_age)
+    if(len(ret)>0):
+      return ret
+    return np.empty((0,5))
+
 def parse_args():
     """Parse input arguments."""
     parser = argparse.ArgumentParser(description='SORT demo')
@@ -53,11 +53,12 @@ class StreamManager(object):
         streams = list(self.streams.values())
         return streams
 
-    def update_streams(self, stream_ids):
+    def update_streams(self, stream_ids, reset_metrics=True):
         self.mutex.acquire()
 
-        for stream in self.streams.values():
-            stream.reset_metrics()
+        if reset_metrics:
+            for stream in self.streams.values():
+                stream.reset_metrics()
 
         origin_stream_ids = list([stream_id for stream_id in self.streams])
 
@@ -10,16 +10,18 @@ import cv2
 import numpy as np
 import requests
 from azure.iot.device import IoTHubModuleClient, Message
-from shapely.geometry import Polygon
 
+from aoi import AOI
 from api.models import StreamModel
 from exception_handler import PrintGetExceptionDetails
 from invoke import gm
 from object_detection import ObjectDetection
 from onnxruntime_predict import ONNXRuntimeObjectDetection
+from pipeline import Pipeline
 
 # from tracker import Tracker
 from scenarios import DangerZone, DefeatDetection, Detection, PartCounter
+from side_channel import SideChannelDispatcher
 from utility import draw_label, get_file_zip, is_edge, normalize_rtsp
 
 DETECTION_TYPE_NOTHING = "nothing"
@@ -32,6 +34,13 @@ UPLOAD_INTERVAL = 5
 
 LVA_MODE = os.environ.get("LVA_MODE", "grpc")
 IS_OPENCV = os.environ.get("IS_OPENCV", "false")
+IS_PIPELINE = os.environ.get("IS_PIPELINE", "false")
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "2"))
+# Preview (/video_feed, ZMQ) encoding, the analysis path is not affected
+PREVIEW_JPEG_QUALITY = int(os.environ.get("PREVIEW_JPEG_QUALITY", "95"))
+PREVIEW_SCALE = float(os.environ.get("PREVIEW_SCALE", "1.0"))
+SIDE_CHANNEL_QUEUE_SIZE = int(os.environ.get("SIDE_CHANNEL_QUEUE_SIZE", "32"))
+SIDE_CHANNEL_MAX_RETRIES = int(os.environ.get("SIDE_CHANNEL_MAX_RETRIES", "3"))
 
 DISPLAY_KEEP_ALIVE_THRESHOLD = 10  # seconds
 
@@ -42,6 +51,11 @@ except:
 
 logger = logging.getLogger(__name__)
 
+# Retrain uploads, IoT Hub messages and LVA signals of every stream
+side_channel = SideChannelDispatcher(
+    queue_size=SIDE_CHANNEL_QUEUE_SIZE, max_retries=SIDE_CHANNEL_MAX_RETRIES
+)
+
 
 class Stream:
     def __init__(
@@ -79,6 +93,11 @@ class Stream:
         self.last_recv_img = None
         # self.last_edge_img = None
         self.last_drawn_img = None
+        # JPEG of last_drawn_img shared by every preview consumer
+        self.jpg_mutex = threading.Lock()
+        self.last_jpg = None
+        self.last_jpg_update = None
+        self.jpg_encode_num = 0
         self.last_prediction = []
         self.last_prediction_count = {}
 
@@ -99,6 +118,7 @@ class Stream:
 
         self.has_aoi = False
         self.aoi_info = None
+        self.aoi = None
         # Part that we want to detect
         self.parts = []
 
@@ -128,6 +148,19 @@ class Stream:
         # self.start_zmq()
         self.is_benchmark = False
 
+        # decode/preprocess -> infer -> postprocess -> draw on their own workers
+        self.pipeline = None
+        if IS_PIPELINE == "true":
+            self.pipeline = Pipeline(
+                [
+                    ("preprocess", self.preprocess_frame),
+                    ("infer", self.infer_frame),
+                    ("postprocess", self.postprocess_frame),
+                    ("draw", self.draw_frame),
+                ],
+                queue_size=PIPELINE_QUEUE_SIZE,
+            )
+
     def set_is_benchmark(self, is_benchmark):
         self.is_benchmark = is_benchmark
 
@@ -171,10 +204,7 @@ class Stream:
                 # self.mutex.acquire()
                 # FIXME may find a better way to deal with encoding
                 self.zmq_sender.send_multipart(
-                    [
-                        bytes(self.cam_id, "utf-8"),
-                        cv2.imencode(".jpg", self.last_drawn_img)[1].tobytes(),
-                    ]
+                    [bytes(self.cam_id, "utf-8"), self.get_jpg()]
                 )
                 self.last_send = self.last_update
                 # self.mutex.release()
@@ -239,6 +269,7 @@ class Stream:
 
         self.has_aoi = has_aoi
         self.aoi_info = aoi_info
+        self.aoi = AOI(aoi_info) if has_aoi else None
 
         detection_mode = self.model.get_detection_mode()
         if detection_mode == "PC":
@@ -412,6 +443,8 @@ class Stream:
         # self.mutex.acquire()
         self.cam_is_alive = False
         # self.mutex.release()
+        if self.pipeline:
+            self.pipeline.stop()
 
         if IS_OPENCV == "true":
             logger.info("get CVModule")
@@ -422,7 +455,31 @@ class Stream:
             gm.invoke_graph_instance_deactivate(self.cam_id)
         logger.info("Deactivate stream {}".format(self.cam_id))
 
-    def predict(self, image):
+    def predict(self, image, sync=False):
+        """predict.
+
+        Args:
+            image: frame
+            sync (bool): process the frame on the calling thread even in
+                pipeline mode, for callers answering with its predictions
+
+        Returns:
+            the predictions of the frame, None when it is queued to the
+            pipeline
+        """
+
+        if self.pipeline and not sync:
+            # Return immediately, last_prediction holds the latest result
+            self.pipeline.put(image)
+            return None
+
+        frame = self.preprocess_frame(image)
+        frame = self.infer_frame(frame)
+        frame = self.postprocess_frame(frame)
+        self.draw_frame(frame)
+        return frame["predictions"]
+
+    def preprocess_frame(self, image):
 
         width = self.IMG_WIDTH
         ratio = self.IMG_WIDTH / image.shape[1]
@@ -434,23 +491,36 @@ class Stream:
 
         image = cv2.resize(image, (width, height))
 
+        return {"image": image, "width": width, "height": height}
+
+    def infer_frame(self, frame):
+
         # prediction
         # self.mutex.acquire()
-        predictions, inf_time = self.model.Score(image)
+        predictions, inf_time = self.model.Score(frame["image"])
         # print('predictions', predictions, flush=True)
         # self.mutex.release()
 
+        frame["predictions"] = predictions
+        frame["inf_time"] = inf_time
+        return frame
+
+    def postprocess_frame(self, frame):
+
+        image = frame["image"]
+        width = frame["width"]
+        height = frame["height"]
+        predictions = frame["predictions"]
+        inf_time = frame["inf_time"]
+
         # check whether it's the tag we want
         predictions = list(p for p in predictions if p["tagName"] in self.model.parts)
 
         # check whether it's inside aoi (if has)
-        if self.has_aoi:
-            _predictions = []
-            for p in predictions:
-                (x1, y1), (x2, y2) = parse_bbox(p, width, height)
-                if is_inside_aoi(x1, y1, x2, y2, self.aoi_info):
-                    _predictions.append(p)
-            predictions = _predictions
+        if self.has_aoi and self.aoi and len(predictions) > 0:
+            boxes = [sum(parse_bbox(p, width, height), ()) for p in predictions]
+            inside = self.aoi.filter(boxes)
+            predictions = list(p for p, i in zip(predictions, inside) if i)
 
         # update detection status before filter out by threshold
         self.update_detection_status(predictions)
@@ -492,24 +562,37 @@ class Stream:
         if self.scenario:
             self.scenario.update(_detections)
 
-        self.draw_img()
+        # update avg inference time (moving avg)
+        inf_time_ms = inf_time * 1000
+        self.average_inference_time = (
+            1 / 16 * inf_time_ms + 15 / 16 * self.average_inference_time
+        )
+
+        frame["predictions"] = predictions
+        return frame
+
+    def draw_frame(self, frame):
+
+        drawn_img = self.draw_img(frame["image"], frame["predictions"])
         if self.send_video_to_cloud:
             self.precess_send_signal_to_lva()
 
         if self.scenario:
             # print('drawing...', flush=True)
             # print(self.scenario, flush=True)
-            self.last_drawn_img = self.scenario.draw_counter(self.last_drawn_img)
+            drawn_img = self.scenario.draw_counter(drawn_img)
             # FIXME close this
-            # self.scenario.draw_constraint(self.last_drawn_img)
+            # self.scenario.draw_constraint(drawn_img)
             if self.get_mode() == "DD":
-                self.scenario.draw_objs(self.last_drawn_img)
+                self.scenario.draw_objs(drawn_img)
 
-        # update avg inference time (moving avg)
-        inf_time_ms = inf_time * 1000
-        self.average_inference_time = (
-            1 / 16 * inf_time_ms + 15 / 16 * self.average_inference_time
-        )
+        self.last_drawn_img = drawn_img
+        self.last_update = time.time()
+
+    def get_pipeline_metrics(self):
+        if self.pipeline:
+            return self.pipeline.get_metrics()
+        return []
 
     def process_retrain_image(self, predictions, img):
         for prediction in predictions:
@@ -529,10 +612,16 @@ class Stream:
                     height, width = img.shape[0], img.shape[1]
                     (x1, y1), (x2, y2) = parse_bbox(prediction, width, height)
                     labels = json.dumps([{"x1": x1, "x2": x2, "y1": y1, "y2": y2}])
-                    jpg = cv2.imencode(".jpg", img)[1].tobytes()
 
-                    send_retrain_image_to_webmodule(
-                        jpg, tag, labels, confidence, self.cam_id
+                    # img is not modified afterwards, encode it on the worker
+                    side_channel.submit(
+                        "retrain_image",
+                        send_retrain_image_to_webmodule,
+                        EncodedImage(img),
+                        tag,
+                        labels,
+                        confidence,
+                        self.cam_id,
                     )
 
                     self.last_upload_time = time.time()
@@ -544,7 +633,7 @@ class Stream:
                 p for p in predictions if p["probability"] >= self.threshold
             )
             if len(predictions) > 0:
-                send_message_to_iothub(predictions)
+                side_channel.submit("iothub", send_message_to_iothub, predictions)
                 self.iothub_last_send_time = time.time()
 
     def precess_send_signal_to_lva(self):
@@ -554,16 +643,19 @@ class Stream:
                 if p["probability"] >= self.threshold:
                     to_send = True
             if to_send:
-                send_message_to_lva(self.cam_id)
+                side_channel.submit("lva", send_message_to_lva, self.cam_id)
                 self.lva_last_send_time = time.time()
                 self.lva_interval = 60
 
-    def draw_img(self):
+    def draw_img(self, img=None, predictions=None):
 
-        img = self.last_img.copy()
+        if img is None:
+            img = self.last_img
+        if predictions is None:
+            predictions = self.last_prediction
+        img = img.copy()
 
         height, width = img.shape[0], img.shape[1]
-        predictions = self.last_prediction
 
         if self.has_aoi:
             draw_aoi(img, self.aoi_info)
@@ -575,8 +667,7 @@ class Stream:
                     cv2.rectangle(img, (x1, max(y1, 15)), (x2, y2), (255, 255, 255), 1)
                     draw_confidence_level(img, prediction)
 
-        self.last_drawn_img = img
-        self.last_update = time.time()
+        return img
 
     def to_api_model(self):
         return StreamModel(
@@ -592,10 +683,31 @@ class Stream:
     def display_is_alive(self):
         return self.last_display_keep_alive + DISPLAY_KEEP_ALIVE_THRESHOLD > time.time()
 
+    def get_jpg(self):
+        """JPEG of last_drawn_img, encoded once per new frame."""
+        with self.jpg_mutex:
+            last_update = self.last_update
+            if self.last_jpg is None or self.last_jpg_update != last_update:
+                img = self.last_drawn_img
+                if PREVIEW_SCALE != 1.0:
+                    img = cv2.resize(
+                        img,
+                        None,
+                        fx=PREVIEW_SCALE,
+                        fy=PREVIEW_SCALE,
+                        interpolation=cv2.INTER_AREA,
+                    )
+                self.last_jpg = cv2.imencode(
+                    ".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY]
+                )[1].tobytes()
+                self.last_jpg_update = last_update
+                self.jpg_encode_num += 1
+            return self.last_jpg
+
     def gen(self):
         while self.cam_is_alive and self.display_is_alive():
             if self.last_drawn_img is not None:
-                jpg = cv2.imencode(".jpg", self.last_drawn_img)[1].tobytes()
+                jpg = self.get_jpg()
                 yield (
                     b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + jpg + b"\r\n"
                 )
@@ -632,30 +744,8 @@ def draw_aoi(img, aoi_info):
 
 
 def is_inside_aoi(x1, y1, x2, y2, aoi_info):
-
-    obj_shape = Polygon([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
-
-    for aoi_area in aoi_info:
-        aoi_type = aoi_area["type"]
-        label = aoi_area["label"]
-
-        if aoi_area["type"] == "BBox":
-            if (
-                (label["x1"] <= x1 <= label["x2"]) or (label["x1"] <= x2 <= label["x2"])
-            ) and (
-                (label["y1"] <= y1 <= label["y2"]) or (label["y1"] <= y2 <= label["y2"])
-            ):
-                return True
-
-        elif aoi_area["type"] == "Polygon":
-            points = []
-            for point in label:
-                points.append([point["x"], point["y"]])
-            aoi_shape = Polygon(points)
-            if aoi_shape.is_valid and aoi_shape.intersects(obj_shape):
-                return True
-
-    return False
+    """Prefer a compiled AOI(aoi_info) when checking several boxes."""
+    return AOI(aoi_info).is_inside(x1, y1, x2, y2)
 
 
 def parse_bbox(prediction, width, height):
@@ -689,11 +779,13 @@ def draw_confidence_level(img, prediction):
 
 
 def send_message_to_iothub(predictions):
+    """Run on the side channel, raise to retry."""
     if iot:
         try:
             iot.send_message_to_output(json.dumps(predictions), "metrics")
         except:
             print("[ERROR] Failed to send message to iothub", flush=True)
+            raise
         print("[INFO] sending metrics to iothub", flush=True)
     else:
         # print('[METRICS]', json.dumps(predictions_to_send))
@@ -701,6 +793,7 @@ def send_message_to_iothub(predictions):
 
 
 def send_message_to_lva(cam_id):
+    """Run on the side channel, raise to retry."""
     if iot:
         try:
             target = "/graphInstances/" + str(cam_id)
@@ -709,17 +802,34 @@ def send_message_to_lva(cam_id):
             iot.send_message_to_output(msg, "InferenceToLVA")
         except:
             print("[ERROR] Failed to send signal to LVA", flush=True)
+            raise
         print("[INFO] sending signal to LVA", flush=True)
     else:
         # print('[INFO] Cannot detect IoT module')
         pass
 
 
-def send_retrain_image_to_webmodule(jpg, tag, labels, confidence, cam_id):
+class EncodedImage:
+    """Frame encoded to JPEG on first use, once for every retry."""
+
+    def __init__(self, img):
+        self.img = img
+        self.jpg = None
+
+    def get_jpg(self):
+        if self.jpg is None:
+            self.jpg = cv2.imencode(".jpg", self.img)[1].tobytes()
+            self.img = None
+        return self.jpg
+
+
+def send_retrain_image_to_webmodule(image, tag, labels, confidence, cam_id):
+    """Run on the side channel, raise to retry."""
     print("[INFO] Sending Image to relabeling", tag, flush=True)
+    jpg = image.get_jpg()
     try:
         # requests.post('http://'+web_module_url()+'/api/relabel', data={
-        res = requests.post(
+        res = side_channel.session.post(
             "http://"
             + web_module_url()
             + "/api/part_detections/1/upload_relabel_image/",
@@ -731,6 +841,9 @@ def send_retrain_image_to_webmodule(jpg, tag, labels, confidence, cam_id):
                 "img": base64.b64encode(jpg),
                 "camera_id": cam_id,
             },
+            timeout=10,
         )
+        res.raise_for_status()
     except:
         print("[ERROR] Failed to update image for relabeling", flush=True)
+        raise
@@ -0,0 +1,73 @@
+"""Frame ring tests, CVCaptureModule writer and InferenceModule reader.
+
+    python -m pytest tests/test_shared_memory.py
+"""
+
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+MODULES_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, os.path.join(MODULES_DIR, "InferenceModule"))
+from shared_memory import FrameRingReader  # noqa: E402
+
+# Both modules have a shared_memory module, load the writer under its own name
+_spec = importlib.util.spec_from_file_location(
+    "cvcapture_shared_memory",
+    os.path.join(MODULES_DIR, "CVCaptureModule", "shared_memory.py"),
+)
+cvcapture_shared_memory = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(cvcapture_shared_memory)
+SharedMemoryFrameRing = cvcapture_shared_memory.SharedMemoryFrameRing
+
+SHAPE = (4, 6, 3)
+
+
+@pytest.fixture
+def ring_name():
+    name = "test_frame_ring_{}".format(os.getpid())
+    yield name
+    path = os.path.join(cvcapture_shared_memory.SHM_FILE_PATH, name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def make_frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+def test_read_frame(ring_name):
+    ring = SharedMemoryFrameRing(ring_name, make_frame(0).nbytes, num_slots=2)
+    reader = FrameRingReader()
+
+    descriptor = ring.write_frame(make_frame(1))
+    assert np.array_equal(reader.read_frame(descriptor), make_frame(1))
+
+    # Overwritten when the ring wraps around
+    ring.write_frame(make_frame(2))
+    ring.write_frame(make_frame(3))
+    assert reader.read_frame(descriptor) is None
+    ring.close()
+
+
+def test_read_frame_ring_recreated(ring_name):
+    """A stream recreated at the same resolution reuses the ring name and
+    size, and starts its sequence numbers over."""
+    reader = FrameRingReader()
+    ring = SharedMemoryFrameRing(ring_name, make_frame(0).nbytes)
+    for value in range(1, 4):
+        assert np.array_equal(
+            reader.read_frame(ring.write_frame(make_frame(value))), make_frame(value)
+        )
+    ring.close()
+
+    ring = SharedMemoryFrameRing(ring_name, make_frame(0).nbytes)
+    for value in range(4, 8):
+        descriptor = ring.write_frame(make_frame(value))
+        assert np.array_equal(reader.read_frame(descriptor), make_frame(value))
+    ring.close()
@@ -0,0 +1,155 @@
+"""Benchmark database load
+
+Simulate the concurrent writers of a WebModule on a temporary SQLite
+database: relabel uploads (count, insert, pop the oldest image) from several
+inference streams, plus training / deploy status polling and updates.
+Compare the former SQLite settings with configs.sqlite3 (WAL, busy timeout,
+BEGIN IMMEDIATE), and report lock errors and latency percentiles.
+
+    python benchmark_db_load.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+N_RELABEL_THREADS = 8
+N_POLLING_THREADS = 4
+DURATION = 10  # seconds
+MAX_IMAGES = 20
+
+PROFILES = {
+    "legacy": {"ENGINE": "django.db.backends.sqlite3", "OPTIONS": {}},
+    "tuned": {"ENGINE": "configs.sqlite3", "OPTIONS": {"timeout": 20}},
+}
+
+
+def percentiles(latencies):
+    if not latencies:
+        return "-"
+    latencies = sorted(latencies)
+    return ", ".join(
+        "p{} {:.1f} ms".format(p, latencies[int(len(latencies) * p / 100) - 1] * 1000)
+        for p in [50, 95, 99]
+    )
+
+
+def run_profile(profile):
+    """Run in a fresh process, the database is configured before setup."""
+    # pylint: disable = import-outside-toplevel
+    import django
+    from django.conf import settings
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "configs.settings.local")
+    db_dir = tempfile.mkdtemp()
+    settings.DATABASES["default"].update(
+        PROFILES[profile], NAME=os.path.join(db_dir, "db.sqlite3")
+    )
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import OperationalError, connection, transaction
+
+    from vision_on_edge.azure_parts.models import Part
+    from vision_on_edge.azure_projects.models import Project
+    from vision_on_edge.azure_settings.models import Setting
+    from vision_on_edge.azure_training_status.models import TrainingStatus
+    from vision_on_edge.images.models import Image
+
+    call_command("migrate", verbosity=0)
+    Setting.validate = lambda self: False
+    setting = Setting.objects.create(name="benchmark")
+    project = Project.objects.create(setting=setting, name="benchmark")
+    parts = [
+        Part.objects.create(project=project, name="part_" + str(i))
+        for i in range(N_RELABEL_THREADS)
+    ]
+    TrainingStatus.objects.update_or_create(
+        project=project, defaults={"status": "ok", "log": "ok"}
+    )
+    connection.close()
+
+    mutex = threading.Lock()
+    stats = {"relabel": [], "polling": [], "lock_errors": 0, "other_errors": 0}
+    stop_at = time.time() + DURATION
+
+    def _record(key, elapsed):
+        with mutex:
+            stats[key].append(elapsed)
+
+    def _error(error):
+        with mutex:
+            if isinstance(error, OperationalError) and "locked" in str(error):
+                stats["lock_errors"] += 1
+            else:
+                stats["other_errors"] += 1
+
+    def relabel(part):
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    relabel_imgs = Image.objects.filter(
+                        project=project, part=part, is_relabel=True
+                    )
+                    count = relabel_imgs.count()
+                    Image.objects.create(
+                        project=project,
+                        part=part,
+                        image="images/benchmark.jpg",
+                        labels="[]",
+                        is_relabel=True,
+                    )
+                    if count >= MAX_IMAGES:
+                        relabel_imgs.order_by("timestamp").first().delete()
+                _record("relabel", time.perf_counter() - start)
+            except Exception as error:
+                _error(error)
+        connection.close()
+
+    def polling(index):
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                status_obj = TrainingStatus.objects.get(project=project)
+                Image.objects.filter(project=project, is_relabel=True).count()
+                if index % 2 == 0:
+                    status_obj.log = str(time.time())
+                    status_obj.save()
+                _record("polling", time.perf_counter() - start)
+            except Exception as error:
+                _error(error)
+            time.sleep(0.01)
+        connection.close()
+
+    threads = [threading.Thread(target=relabel, args=(part,)) for part in parts]
+    threads += [
+        threading.Thread(target=polling, args=(i,)) for i in range(N_POLLING_THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print("---- {} ----".format(profile))
+    print("  relabel uploads :", len(stats["relabel"]))
+    print("  relabel latency :", percentiles(stats["relabel"]))
+    print("  status polls    :", len(stats["polling"]))
+    print("  polling latency :", percentiles(stats["polling"]))
+    print("  lock errors     :", stats["lock_errors"])
+    print("  other errors    :", stats["other_errors"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_profile(sys.argv[1])
+    else:
+        for profile_name in PROFILES:
+            subprocess.run(
+                [sys.executable, __file__, profile_name],
+                check=True,
+                stderr=subprocess.DEVNULL,
+            )
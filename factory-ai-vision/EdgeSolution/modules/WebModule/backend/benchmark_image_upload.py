@@ -0,0 +1,172 @@
+"""Benchmark image upload
+
+Compare the concurrent uploader of images/utils.py with the former one
+(one part after another, batches of 10, one request at a time) against a
+local fake Custom Vision trainer with a fixed per-request latency.
+
+    python benchmark_image_upload.py
+"""
+
+import io
+import json
+import os
+import threading
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "configs.settings.local")
+django.setup()
+
+# pylint: disable = wrong-import-position
+from PIL import Image as PILImage  # noqa: E402
+
+from vision_on_edge.images.utils import (  # noqa: E402
+    CUSTOMVISION_MAX_IMAGE_BATCH,
+    IMAGE_UPLOAD_WORKERS,
+    create_image_entry,
+    upload_image_batches,
+)
+
+N_PARTS = 5
+N_IMAGES_PER_PART = 100
+REQUEST_LATENCY = 0.3  # seconds
+LATENCY_PER_IMAGE = 0.005  # seconds
+LEGACY_BATCH_SIZE = 10
+
+
+class FakeImageField:
+    """Enough of an ImageFieldFile for create_image_entry."""
+
+    def __init__(self, contents, width, height):
+        self.contents = contents
+        self.width = width
+        self.height = height
+        self.file = None
+
+    def open(self):
+        self.file = io.BytesIO(self.contents)
+
+    def read(self):
+        return self.file.read()
+
+    def close(self):
+        self.file = None
+
+
+class FakeImage:
+    def __init__(self, index, part_id, contents):
+        self.id = index
+        self.part_id = part_id
+        self.image = FakeImageField(contents, 640, 480)
+        self.labels = json.dumps([{"x1": 10, "y1": 20, "x2": 300, "y2": 200}])
+        self.customvision_id = None
+        self.remote_url = None
+        self.uploaded = False
+
+    def __str__(self):
+        return "<FakeImage " + str(self.id) + ">"
+
+
+class FakeResult:
+    def __init__(self, image_id):
+        self.status = "OK"
+        self.image = self
+        self.id = image_id
+        self.original_image_uri = "https://fake/" + image_id
+
+
+class FakeUploadResult:
+    def __init__(self, images):
+        self.images = images
+        self.is_batch_successful = True
+
+
+class FakeTrainer:
+    """create_images_from_files with a network-like latency."""
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.counter = 0
+        self.requests = 0
+
+    def create_images_from_files(self, project_id, images):
+        time.sleep(REQUEST_LATENCY + LATENCY_PER_IMAGE * len(images))
+        with self.mutex:
+            self.requests += 1
+            results = []
+            for _ in images:
+                self.counter += 1
+                results.append(FakeResult("cv_" + str(self.counter)))
+        return FakeUploadResult(results)
+
+
+def fake_images():
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (640, 480)).save(buffer, format="JPEG")
+    contents = buffer.getvalue()
+    return [
+        FakeImage(part_id * N_IMAGES_PER_PART + i, part_id, contents)
+        for part_id in range(N_PARTS)
+        for i in range(N_IMAGES_PER_PART)
+    ]
+
+
+def legacy_upload(trainer, images, tags_dict, saved):
+    for part_id in tags_dict:
+        img_entries = []
+        img_objs = []
+        part_images = [image for image in images if image.part_id == part_id]
+        for index, image_obj in enumerate(part_images):
+            img_objs.append(image_obj)
+            img_entries.append(create_image_entry(image_obj, tags_dict[part_id]))
+            if len(img_entries) >= LEGACY_BATCH_SIZE or index == len(part_images) - 1:
+                upload_result = trainer.create_images_from_files(
+                    project_id="project", images=img_entries
+                )
+                for i, img_obj in enumerate(img_objs):
+                    img_obj.customvision_id = upload_result.images[i].image.id
+                    img_obj.uploaded = True
+                    # one save() per image
+                    saved.append([img_obj])
+                img_entries = []
+                img_objs = []
+
+
+def concurrent_upload(trainer, images, tags_dict, saved):
+    batches = (
+        images[index : index + CUSTOMVISION_MAX_IMAGE_BATCH]
+        for index in range(0, len(images), CUSTOMVISION_MAX_IMAGE_BATCH)
+    )
+    upload_image_batches(
+        trainer=trainer,
+        customvision_project_id="project",
+        batches=batches,
+        tags_dict=tags_dict,
+        max_workers=IMAGE_UPLOAD_WORKERS,
+        # one bulk_update per batch
+        on_uploaded=saved.append,
+    )
+
+
+def benchmark(name, upload):
+    trainer = FakeTrainer()
+    images = fake_images()
+    tags_dict = {part_id: "tag_" + str(part_id) for part_id in range(N_PARTS)}
+    saved = []
+
+    start = time.perf_counter()
+    upload(trainer, images, tags_dict, saved)
+    elapsed = time.perf_counter() - start
+
+    assert all(image.uploaded for image in images)
+    print("---- {} ----".format(name))
+    print("  images   :", len(images))
+    print("  requests :", trainer.requests)
+    print("  db writes:", len(saved))
+    print("  time     : {:.2f} s".format(elapsed))
+
+
+if __name__ == "__main__":
+    benchmark("legacy", legacy_upload)
+    benchmark("concurrent", concurrent_upload)
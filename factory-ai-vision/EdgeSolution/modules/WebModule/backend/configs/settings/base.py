@@ -98,10 +98,17 @@ ASGI_APPLICATION = "configs.routing.application"
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# SQLite in WAL mode, see configs/sqlite3. Writers wait up to
+# SQLITE_BUSY_TIMEOUT for the write lock instead of failing.
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 20))  # Seconds
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 60))  # Seconds
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "configs.sqlite3",
         "NAME": os.path.join(ROOT_DIR, "db.sqlite3"),
+        "OPTIONS": {"timeout": SQLITE_BUSY_TIMEOUT},
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
     }
 }
 
@@ -18,5 +18,6 @@ DATABASES = {
         "USER": os.environ["DBUSER"],
         "PASSWORD": os.environ["DBPASS"],
         "OPTIONS": {"connect_timeout": 5},
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
     }
 }
@@ -0,0 +1,2 @@
+"""SQLite database backend tuned for concurrent writers.
+"""
@@ -0,0 +1,27 @@
+"""SQLite database backend tuned for concurrent writers.
+
+The relabel writer, deploy and training threads write while requests read.
+With the default rollback journal a reader blocks every writer, and a
+deferred transaction upgrading its read lock fails with "database is
+locked" without waiting for the busy timeout.
+
+- WAL: readers don't block the writer and the writer doesn't block readers.
+- synchronous=NORMAL: safe with WAL, no fsync per commit.
+- BEGIN IMMEDIATE: transactions take the write lock at BEGIN, where the busy
+  timeout (OPTIONS "timeout") applies.
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """DatabaseWrapper."""
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
@@ -6,7 +6,6 @@ from __future__ import absolute_import, unicode_literals
 import logging
 
 import requests
-from django.core.files.images import ImageFile
 from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -25,7 +24,6 @@ from ...general.api.serializers import (
     SimpleOKSerializer,
 )
 from ...general.shortcuts import drf_get_object_or_404
-from ...images.models import Image
 from ..exceptions import (
     PdExportInfereceReadTimeout,
     PdInferenceModuleUnreachable,
@@ -37,7 +35,12 @@ from ..exceptions import (
     PdRelabelWithoutProject,
 )
 from ..models import PartDetection, PDScenario
-from ..utils import if_trained_then_deploy_helper
+from ..utils import (
+    INFERENCE_METRICS_CACHE,
+    RELABEL_IMAGE_WRITER,
+    format_inference_metrics,
+    if_trained_then_deploy_helper,
+)
 from .serializers import (
     ExportSerializer,
     PartDetectionSerializer,
@@ -47,6 +50,16 @@ from .serializers import (
 
 logger = logging.getLogger(__name__)
 
+EMPTY_INFERENCE_METRICS = {
+    "success_rate": 0.0,
+    "inference_num": 0,
+    "unidentified_num": 0,
+    "gpu": "",
+    "count": 0,
+    "average_time": 0.0,
+    "scenario_metrics": [],
+}
+
 
 class PartDetectionViewSet(FiltersMixin, viewsets.ModelViewSet):
     """PartDetection ModelViewSet"""
@@ -108,43 +121,23 @@ class PartDetectionViewSet(FiltersMixin, viewsets.ModelViewSet):
         inference_module_obj = instance.inference_module
         drf_get_object_or_404(instance.cameras.all(), pk=cam_id)
 
-        success_rate = 0.0
-        inference_num = 0
-        unidentified_num = 0
         if deploy_status_obj.status != "ok":
             return Response(
                 {
                     "status": deploy_status_obj.status,
                     "log": "Status: " + deploy_status_obj.log,
                     "download_uri": "",
-                    "success_rate": 0.0,
-                    "inference_num": 0,
-                    "unidentified_num": 0,
-                    "gpu": "",
-                    "count": 0,
-                    "average_time": 0.0,
-                    "scenario_metrics": [],
+                    **EMPTY_INFERENCE_METRICS,
                 }
             )
         try:
-            res = requests.get(
-                "http://" + inference_module_obj.url + "/metrics",
-                params={"cam_id": cam_id},
-                timeout=3,
-            )
-            data = res.json()
-            success_rate = int(data["success_rate"] * 100) / 100
-            inference_num = data["inference_num"]
-            unidentified_num = data["unidentified_num"]
-            is_gpu = data["is_gpu"]
-            average_inference_time = data["average_inference_time"]
-            last_prediction_count = data["last_prediction_count"]
-            scenario_metrics = data["scenario_metrics"] or []
+            data = INFERENCE_METRICS_CACHE.get(
+                url=inference_module_obj.url, cam_ids=[cam_id]
+            )[str(cam_id)]
         except requests.exceptions.ConnectionError as err:
             raise PdInferenceModuleUnreachable from err
         except ReadTimeout as err:
             raise PdExportInfereceReadTimeout from err
-        deploy_status_obj.save()
         logger.info(
             "Deploy status: %s, %s", deploy_status_obj.status, deploy_status_obj.log
         )
@@ -157,13 +150,63 @@ class PartDetectionViewSet(FiltersMixin, viewsets.ModelViewSet):
                 "status": deploy_status_obj.status,
                 "log": "Status: " + deploy_status_obj.log,
                 "download_uri": download_uri,
-                "success_rate": success_rate,
-                "inference_num": inference_num,
-                "unidentified_num": unidentified_num,
-                "gpu": is_gpu,
-                "count": last_prediction_count,
-                "average_time": average_inference_time,
-                "scenario_metrics": scenario_metrics,
+                **format_inference_metrics(data),
+            }
+        )
+
+    @swagger_auto_schema(
+        operation_summary="Export Part Detection status of every camera",
+        responses={
+            "400": MSStyleErrorResponseSerializer,
+            "503": MSStyleErrorResponseSerializer,
+        },
+    )
+    @action(detail=True, methods=["get"])
+    def metrics(self, request, pk=None) -> Response:
+        """metrics.
+
+        export of every camera with one request to the inference module.
+        """
+        queryset = self.get_queryset()
+        instance = drf_get_object_or_404(queryset, pk=pk)
+        project_obj = instance.project
+        deploy_status_obj = DeployStatus.objects.get(part_detection=instance)
+        cam_ids = [
+            str(cam_id) for cam_id in instance.cameras.values_list("id", flat=True)
+        ]
+
+        # Nothing deployed to ask for metrics
+        if (
+            deploy_status_obj.status != "ok"
+            or len(cam_ids) == 0
+            or instance.inference_module is None
+        ):
+            return Response(
+                {
+                    "status": deploy_status_obj.status,
+                    "log": "Status: " + deploy_status_obj.log,
+                    "download_uri": "",
+                    "cameras": {
+                        cam_id: dict(EMPTY_INFERENCE_METRICS) for cam_id in cam_ids
+                    },
+                }
+            )
+        try:
+            data = INFERENCE_METRICS_CACHE.get(
+                url=instance.inference_module.url, cam_ids=cam_ids
+            )
+        except requests.exceptions.ConnectionError as err:
+            raise PdInferenceModuleUnreachable from err
+        except ReadTimeout as err:
+            raise PdExportInfereceReadTimeout from err
+        return Response(
+            {
+                "status": deploy_status_obj.status,
+                "log": "Status: " + deploy_status_obj.log,
+                "download_uri": project_obj.download_uri if project_obj else "",
+                "cameras": {
+                    cam_id: format_inference_metrics(data[cam_id]) for cam_id in cam_ids
+                },
             }
         )
 
@@ -222,9 +265,6 @@ class PartDetectionViewSet(FiltersMixin, viewsets.ModelViewSet):
         if project_obj.is_demo:
             raise PdRelabelDemoProjectError
 
-        # Relabel images count does not exceed project.maxImages
-        # Handled by signals
-
         confidence_float = serializer.validated_data["confidence"] * 100
         # Confidence check
         if (
@@ -234,70 +274,49 @@ class PartDetectionViewSet(FiltersMixin, viewsets.ModelViewSet):
             logger.error("Inferenece confidence %s out of range", confidence_float)
             raise PdRelabelConfidenceOutOfRange
 
-        # Relabel images count does not exceed project.maxImages
-        if (
-            instance.maxImages
-            > Image.objects.filter(
-                project=project_obj, part=part, is_relabel=True
-            ).count()
-        ):
-            img_io = serializer.validated_data["img"].file
-
-            img = ImageFile(img_io)
-            img.name = str(timezone.now()) + ".jpg"
-            img_obj = Image(
-                image=img,
-                part_id=part.id,
-                camera_id=serializer.validated_data["camera_id"],
-                labels=serializer.validated_data["labels"],
-                confidence=serializer.validated_data["confidence"],
-                project=instance.project,
-                is_relabel=True,
-            )
-            img_obj.save()
-            return Response({"status": "ok"})
-
-        # User is not relabling and exceed maxImages
-        # queue...
-        logger.info(project_obj.relabel_expired_time)
-        logger.info(timezone.now())
-        if project_obj.relabel_expired_time < timezone.now():
-            logger.info("Queuing relabel images...")
-            img_io = serializer.validated_data["img"].file
-            img = ImageFile(img_io)
-            img.name = str(timezone.now()) + ".jpg"
-            img_obj = Image(
-                image=img,
-                camera_id=serializer.validated_data["camera_id"],
-                part_id=part.id,
-                labels=serializer.validated_data["labels"],
-                confidence=serializer.validated_data["confidence"],
-                project=project_obj,
-                is_relabel=True,
-            )
-            img_obj.save()
-            # pop
-            earliest_img = (
-                Image.objects.filter(project=project_obj, part=part, is_relabel=True)
-                .order_by("timestamp")
-                .first()
-            )
-            if earliest_img is not None:
-                earliest_img.delete()
-            return Response({"status": "ok"})
-            # pop image
+        # Saving and evicting are done by RELABEL_IMAGE_WRITER
+        relabel_count = RELABEL_IMAGE_WRITER.get_count(
+            project_id=project_obj.id, part_id=part.id
+        )
+        is_relabeling = project_obj.relabel_expired_time >= timezone.now()
 
         # User is relabeling and exceed maxImages
-        for _ in range(
-            Image.objects.filter(
-                project=project_obj, part=part, is_relabel=True
-            ).count()
-            - instance.maxImages
-        ):
-            Image.objects.filter(
-                project=project_obj, part=part, is_relabel=True
-            ).order_by("timestamp").last().delete()
-        raise PdRelabelImageFull
+        if relabel_count >= instance.maxImages and is_relabeling:
+            if relabel_count > instance.maxImages:
+                # Drop the newest images above maxImages
+                RELABEL_IMAGE_WRITER.submit(
+                    project_id=project_obj.id,
+                    part_id=part.id,
+                    camera_id=None,
+                    labels=None,
+                    confidence=None,
+                    image=None,
+                    max_images=instance.maxImages,
+                    keep_newest=False,
+                )
+            RELABEL_IMAGE_WRITER.reject()
+            raise PdRelabelImageFull
+
+        # Relabel images count does not exceed maxImages, or user is not
+        # relabeling and the earliest images are popped
+        RELABEL_IMAGE_WRITER.submit(
+            project_id=project_obj.id,
+            part_id=part.id,
+            camera_id=serializer.validated_data["camera_id"],
+            labels=serializer.validated_data["labels"],
+            confidence=serializer.validated_data["confidence"],
+            image=serializer.validated_data["img"].read(),
+            max_images=instance.maxImages,
+        )
+        return Response({"status": "ok"})
+
+    @swagger_auto_schema(
+        operation_summary="Relabel image ingestion throughput.",
+    )
+    @action(detail=False, methods=["get"])
+    def relabel_metrics(self, request) -> Response:
+        """relabel_metrics."""
+        return Response(RELABEL_IMAGE_WRITER.get_metrics())
 
 
 class PDScenarioViewSet(viewsets.ReadOnlyModelViewSet):
@@ -0,0 +1,512 @@
+"""App utility tests.
+"""
+
+import base64
+import datetime
+import io
+import threading
+
+import pytest
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIRequestFactory
+
+from ...azure_parts.models import Part
+from ...azure_pd_deploy_status.models import DeployStatus
+from ...azure_training_status.models import TrainingStatus
+from ...images.models import Image
+from .. import utils
+from ..api import views
+from ..api.views import PartDetectionViewSet
+from ..models import PartDetection
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        assert self.status_code < 400
+
+
+def stream_metrics(success_rate):
+    return {
+        "success_rate": success_rate,
+        "inference_num": 3,
+        "unidentified_num": 1,
+        "is_gpu": False,
+        "average_inference_time": 0.1,
+        "last_prediction_count": {"part": 2},
+        "scenario_metrics": None,
+    }
+
+
+def image_bytes():
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (40, 30)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    """A writer without thread, jobs are written by process_pending."""
+    writer = utils.RelabelImageWriter()
+    monkeypatch.setattr(writer, "start", lambda: None)
+    monkeypatch.setattr(views, "RELABEL_IMAGE_WRITER", writer)
+    return writer
+
+
+def test_relabel_image_writer(writer, project):
+    """test_relabel_image_writer.
+
+    Type:
+        Positive
+
+    Description:
+        Queued images are written in one batch, the oldest images above
+        max_images are evicted.
+    """
+    part = Part.objects.create(project=project, name="part")
+    assert writer.get_count(project.id, part.id) == 0
+    for i in range(5):
+        assert writer.submit(
+            project_id=project.id,
+            part_id=part.id,
+            camera_id=None,
+            labels=str(i),
+            confidence=0.5,
+            image=image_bytes(),
+            max_images=3,
+        )
+    assert not Image.objects.exists()
+    assert writer.get_count(project.id, part.id) == 3
+
+    writer.process_pending()
+
+    relabel_imgs = Image.objects.filter(project=project, part=part, is_relabel=True)
+    assert sorted(relabel_imgs.values_list("labels", flat=True)) == ["2", "3", "4"]
+    assert writer.get_count(project.id, part.id) == 3
+    metrics = writer.get_metrics()
+    assert metrics["accepted"] == 5
+    assert metrics["written"] == 5
+    assert metrics["evicted"] == 2
+    assert metrics["batches"] == 1
+    assert metrics["queue_depth"] == 0
+
+
+def test_relabel_image_writer_evict_newest(writer, project):
+    """test_relabel_image_writer_evict_newest.
+
+    Type:
+        Positive
+
+    Description:
+        An eviction job without image drops the newest images.
+    """
+    part = Part.objects.create(project=project, name="part")
+    for i in range(5):
+        writer.submit(
+            project_id=project.id,
+            part_id=part.id,
+            camera_id=None,
+            labels=str(i),
+            confidence=0.5,
+            image=image_bytes(),
+            max_images=10,
+        )
+    writer.process_pending()
+    writer.submit(
+        project_id=project.id,
+        part_id=part.id,
+        camera_id=None,
+        labels=None,
+        confidence=None,
+        image=None,
+        max_images=3,
+        keep_newest=False,
+    )
+    writer.process_pending()
+
+    relabel_imgs = Image.objects.filter(project=project, part=part, is_relabel=True)
+    assert sorted(relabel_imgs.values_list("labels", flat=True)) == ["0", "1", "2"]
+
+
+def test_upload_relabel_image(writer, part_detection, camera):
+    """test_upload_relabel_image.
+
+    Type:
+        Positive
+
+    Description:
+        Relabel images are accepted before being written, then refused when
+        the part is full and the user is relabeling.
+    """
+    part = Part.objects.create(project=part_detection.project, name="part")
+    part_detection.parts.add(part)
+    part_detection.cameras.add(camera)
+    part_detection.accuracyRangeMin = 0
+    part_detection.accuracyRangeMax = 100
+    part_detection.maxImages = 2
+    part_detection.save()
+
+    view = PartDetectionViewSet.as_view({"post": "upload_relabel_image"})
+    data = {
+        "part_name": "part",
+        "labels": "[]",
+        "img": base64.b64encode(image_bytes()).decode(),
+        "confidence": 0.5,
+        "is_relabel": True,
+        "camera_id": camera.id,
+    }
+    factory = APIRequestFactory()
+    for _ in range(2):
+        request = factory.post("/fake-url/", data, format="json")
+        response = view(request, pk=part_detection.id)
+        assert response.status_code == 200
+    assert not Image.objects.exists()
+    writer.process_pending()
+    assert Image.objects.filter(is_relabel=True).count() == 2
+
+    project_obj = part_detection.project
+    project_obj.relabel_expired_time = timezone.now() + datetime.timedelta(
+        seconds=30
+    )
+    project_obj.save(update_fields=["relabel_expired_time"])
+    request = factory.post("/fake-url/", data, format="json")
+    response = view(request, pk=part_detection.id)
+    assert response.status_code == 400
+    assert writer.get_metrics()["rejected"] == 1
+
+
+def test_inference_metrics_cache(monkeypatch):
+    """test_inference_metrics_cache.
+
+    Type:
+        Positive
+
+    Description:
+        Metrics of every camera are fetched with one request and cached.
+    """
+    calls = []
+
+    def fake_get(url, params, timeout):
+        calls.append((url, params))
+        return FakeResponse(
+            200,
+            {
+                "cameras": {
+                    cam_id: stream_metrics(50.123)
+                    for cam_id in params["cam_ids"].split(",")
+                },
+                "is_gpu": True,
+            },
+        )
+
+    monkeypatch.setattr(utils.requests, "get", fake_get)
+    cache = utils.InferenceMetricsCache(ttl=60)
+
+    metrics = cache.get(url="inference:5000", cam_ids=[2, 1])
+    assert calls == [("http://inference:5000/metrics_all", {"cam_ids": "1,2"})]
+    assert set(metrics) == {"1", "2"}
+    assert metrics["1"]["is_gpu"]
+    assert utils.format_inference_metrics(metrics["1"])["success_rate"] == 50.12
+
+    assert cache.get(url="inference:5000", cam_ids=[1, 2]) is metrics
+    assert len(calls) == 1
+
+
+def test_inference_metrics_cache_fallback(monkeypatch):
+    """test_inference_metrics_cache_fallback.
+
+    Type:
+        Positive
+
+    Description:
+        Cameras are fetched concurrently from an inference module without
+        /metrics_all.
+    """
+    mutex = threading.Lock()
+    calls = []
+
+    def fake_get(url, params, timeout):
+        with mutex:
+            calls.append(url)
+        if url.endswith("/metrics_all"):
+            return FakeResponse(404)
+        return FakeResponse(200, stream_metrics(int(params["cam_id"])))
+
+    monkeypatch.setattr(utils.requests, "get", fake_get)
+    cache = utils.InferenceMetricsCache(ttl=0)
+
+    metrics = cache.get(url="inference:5000", cam_ids=["1", "2", "3"])
+    assert {cam_id: m["success_rate"] for cam_id, m in metrics.items()} == {
+        "1": 1,
+        "2": 2,
+        "3": 3,
+    }
+    assert calls.count("http://inference:5000/metrics") == 3
+
+
+def test_metrics(monkeypatch, part_detection, camera):
+    """test_metrics.
+
+    Type:
+        Positive
+
+    Description:
+        metrics returns export of every camera of a part detection.
+    """
+    part_detection.cameras.add(camera)
+    DeployStatus.objects.update_or_create(
+        part_detection=part_detection, defaults={"status": "ok", "log": "ok"}
+    )
+
+    cache = utils.InferenceMetricsCache(ttl=60)
+    monkeypatch.setattr(
+        cache,
+        "fetch",
+        lambda url, cam_ids: {cam_id: stream_metrics(10.0) for cam_id in cam_ids},
+    )
+    monkeypatch.setattr(views, "INFERENCE_METRICS_CACHE", cache)
+
+    view = PartDetectionViewSet.as_view({"get": "metrics"})
+    request = APIRequestFactory().get("/fake-url/")
+    response = view(request, pk=part_detection.id)
+
+    assert response.status_code == 200
+    assert response.data["status"] == "ok"
+    assert response.data["cameras"] == {
+        str(camera.id): {
+            "success_rate": 10.0,
+            "inference_num": 3,
+            "unidentified_num": 1,
+            "gpu": False,
+            "count": {"part": 2},
+            "average_time": 0.1,
+            "scenario_metrics": [],
+        }
+    }
+
+
+def test_metrics_without_inference_module(part_detection, camera):
+    """test_metrics_without_inference_module.
+
+    Type:
+        Negative
+
+    Description:
+        metrics returns empty metrics if no inference module is set.
+    """
+    part_detection.cameras.add(camera)
+    DeployStatus.objects.update_or_create(
+        part_detection=part_detection, defaults={"status": "ok", "log": "ok"}
+    )
+    PartDetection.objects.filter(pk=part_detection.id).update(inference_module=None)
+
+    view = PartDetectionViewSet.as_view({"get": "metrics"})
+    request = APIRequestFactory().get("/fake-url/")
+    response = view(request, pk=part_detection.id)
+
+    assert response.status_code == 200
+    assert response.data["download_uri"] == ""
+    assert response.data["cameras"] == {
+        str(camera.id): dict(views.EMPTY_INFERENCE_METRICS)
+    }
+
+
+def test_deploy_worker(monkeypatch, part_detection, camera):
+    """test_deploy_worker.
+
+    Type:
+        Positive
+
+    Description:
+        The whole configuration is deployed with one request.
+    """
+    part_detection.cameras.add(camera)
+    part = Part.objects.create(project=part_detection.project, name="part")
+    part_detection.parts.add(part)
+    PartDetection.objects.filter(pk=part_detection.id).update(has_configured=True)
+    calls = []
+
+    def fake_post(url, json, timeout):
+        calls.append((url, json))
+        return FakeResponse(200, {"applied": list(json)})
+
+    monkeypatch.setattr(utils.requests, "post", fake_post)
+    utils.deploy_worker(part_detection_id=part_detection.id)
+
+    assert len(calls) == 1
+    url, configuration = calls[0]
+    assert url == (
+        "http://" + part_detection.inference_module.url + "/apply_configuration"
+    )
+    assert configuration["part_detection_id"] == part_detection.id
+    assert configuration["parts"] == {"parts": [{"id": part.id, "name": "part"}]}
+    assert configuration["prob_threshold"] == part_detection.prob_threshold
+    assert [cam["id"] for cam in configuration["cameras"]["cameras"]] == [
+        str(camera.id)
+    ]
+
+
+def test_deploy_worker_one_by_one(monkeypatch, part_detection, camera):
+    """test_deploy_worker_one_by_one.
+
+    Type:
+        Positive
+
+    Description:
+        Inference modules without /apply_configuration are updated with one
+        request per section.
+    """
+    part_detection.cameras.add(camera)
+    PartDetection.objects.filter(pk=part_detection.id).update(has_configured=True)
+    calls = []
+
+    def fake_post(url, json, timeout):
+        calls.append(url.rsplit("/", 1)[1])
+        if url.endswith("/apply_configuration"):
+            return FakeResponse(404)
+        return FakeResponse(200)
+
+    def fake_get(url, params, timeout):
+        calls.append(url.rsplit("/", 1)[1])
+        return FakeResponse(200)
+
+    monkeypatch.setattr(utils.requests, "post", fake_post)
+    monkeypatch.setattr(utils.requests, "get", fake_get)
+    utils.deploy_worker(part_detection_id=part_detection.id)
+
+    assert calls == [
+        "apply_configuration",
+        "update_part_detection_id",
+        "update_part_detection_mode",
+        "update_model",
+        "update_parts",
+        "update_retrain_parameters",
+        "update_iothub_parameters",
+        "update_cams",
+        "update_prob_threshold",
+    ]
+
+
+def test_deploy_scheduler():
+    """test_deploy_scheduler.
+
+    Type:
+        Positive
+
+    Description:
+        Deploys requested while one is scheduled or running are merged.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    done = threading.Event()
+    deployed = []
+
+    def worker(part_detection_id):
+        deployed.append(part_detection_id)
+        started.set()
+        release.wait(5)
+        if len(deployed) == 2:
+            done.set()
+
+    scheduler = utils.DeployScheduler(delay=0.01, worker=worker)
+    assert scheduler.request(1)
+    assert started.wait(5)
+    for _ in range(5):
+        assert not scheduler.request(1)
+    release.set()
+    assert done.wait(5)
+
+    assert deployed == [1, 1]
+    metrics = scheduler.get_metrics()
+    assert metrics["requested"] == 6
+    assert metrics["coalesced"] == 5
+
+
+def test_if_trained_then_deploy_worker_project_changed(
+    monkeypatch, part_detection, project
+):
+    """test_if_trained_then_deploy_worker_project_changed.
+
+    Type:
+        Positive
+
+    Description:
+        A part detection configured with another project while waiting for
+        training is deployed once the new project is trained.
+    """
+    old_project = part_detection.project
+    DeployStatus.objects.update_or_create(
+        part_detection=part_detection, defaults={"status": "ok", "log": "ok"}
+    )
+    TrainingStatus.objects.update_or_create(
+        project=old_project, defaults={"status": "training", "log": "training"}
+    )
+    TrainingStatus.objects.update_or_create(
+        project=project, defaults={"status": "ok", "log": "ok"}
+    )
+    waited = []
+    deployed = []
+
+    def fake_wait(project_id, version, timeout=None):
+        waited.append(project_id)
+        # The former project is never trained
+        assert len(waited) < 3
+        # Configured meanwhile
+        PartDetection.objects.filter(pk=part_detection.id).update(project=project)
+
+    monkeypatch.setattr(utils.TRAINING_STATUS_EVENTS, "wait", fake_wait)
+    monkeypatch.setattr(
+        utils,
+        "deploy_worker",
+        lambda part_detection_id: deployed.append(
+            PartDetection.objects.get(pk=part_detection_id).project_id
+        ),
+    )
+    utils.if_trained_then_deploy_worker(part_detection_id=part_detection.id)
+
+    assert waited == [old_project.id]
+    assert deployed == [project.id]
+    assert PartDetection.objects.get(pk=part_detection.id).deployed
+
+
+def test_deploy_scheduler_watch():
+    """test_deploy_scheduler_watch.
+
+    Type:
+        Positive
+
+    Description:
+        A watch requested while one runs is not dropped, it runs once more
+        after it.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    done = threading.Event()
+    watched = []
+
+    def target(part_detection_id):
+        watched.append(part_detection_id)
+        started.set()
+        release.wait(5)
+        if len(watched) == 2:
+            done.set()
+
+    scheduler = utils.DeployScheduler(delay=0.01)
+    assert scheduler.watch(1, target)
+    assert started.wait(5)
+    for _ in range(3):
+        assert not scheduler.watch(1, target)
+    release.set()
+    assert done.wait(5)
+
+    assert watched == [1, 1]
+    assert scheduler.get_metrics()["coalesced"] == 3
@@ -3,21 +3,62 @@
 
 import json
 import logging
+import queue
 import threading
 import time
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
 from django.utils import timezone
 
 from ..azure_pd_deploy_status import progress as deploy_progress
 from ..azure_pd_deploy_status.utils import upcreate_deploy_status
 from ..azure_training_status.models import TrainingStatus
+from ..azure_training_status.utils import TRAINING_STATUS_EVENTS
+from ..images.models import Image
 from .api.serializers import UpdateCamBodySerializer
 from .models import PartDetection
 
 logger = logging.getLogger(__name__)
 
+# Training status normally comes from TRAINING_STATUS_EVENTS, re-read the
+# database if nothing was published for that long.
+TRAINING_STATUS_WAIT_TIMEOUT = 30  # seconds
+
+# Relabel image ingestion
+RELABEL_QUEUE_SIZE = 256
+RELABEL_BATCH_SIZE = 32
+RELABEL_BATCH_WAIT = 0.5  # seconds
+# Relabel counts are re-read from the database once that old, images may be
+# deleted or labelled by the user meanwhile.
+RELABEL_COUNT_TTL = 10  # seconds
+RELABEL_METRICS_WINDOW = 60  # seconds
+
+# Inference module metrics, shared by every dashboard refreshing within the TTL
+INFERENCE_METRICS_TTL = 2  # seconds
+INFERENCE_METRICS_TIMEOUT = 3  # seconds
+INFERENCE_METRICS_WORKERS = 8
+
+DEPLOY_REQUEST_TIMEOUT = 60  # seconds
+# Deploys requested within that delay, or while one is running, are merged
+DEPLOY_COALESCE_DELAY = 1  # seconds
+
+
+def get_training_status(project_id):
+    """get_training_status.
+
+    Returns:
+        (version, status, log): version of TRAINING_STATUS_EVENTS taken before
+        reading the database, so no change is missed in between.
+    """
+    version = TRAINING_STATUS_EVENTS.get_version(project_id)
+    training_status_obj = TrainingStatus.objects.get(project_id=project_id)
+    return version, training_status_obj.status, training_status_obj.log
+
 
 def if_trained_then_deploy_worker(part_detection_id):
     """if_trained_then_deploy_worker.
@@ -31,31 +72,43 @@ def if_trained_then_deploy_worker(part_detection_id):
     # =====================================================
     logger.info("Wait for project to be trained")
     part_detection_obj = PartDetection.objects.get(pk=part_detection_id)
-    project_obj = part_detection_obj.project
+    project_id = part_detection_obj.project_id
+    version, status, log = get_training_status(project_id)
     last_log = None
     while True:
-        time.sleep(1)
-        training_status_obj = TrainingStatus.objects.get(project=project_obj)
-        logger.info("Listening on Training Status: %s", training_status_obj)
-        if training_status_obj.status in ["ok", "failed"]:
-            break
-        if training_status_obj.log != last_log:
+        logger.info("Listening on Training Status: %s %s", status, log)
+        if status in ["ok", "failed"]:
+            # Configured with another project meanwhile, wait for that one
+            part_detection_obj.refresh_from_db()
+            if part_detection_obj.project_id == project_id:
+                break
+        elif log != last_log:
             upcreate_deploy_status(
-                part_detection_id=part_detection_id,
-                status=training_status_obj.status,
-                log=training_status_obj.log,
+                part_detection_id=part_detection_id, status=status, log=log
             )
-            last_log = training_status_obj.log
+            last_log = log
+        if part_detection_obj.project_id != project_id:
+            project_id = part_detection_obj.project_id
+            logger.info("Part Detection project changed to %s", project_id)
+            version, status, log = get_training_status(project_id)
+            continue
+        event = TRAINING_STATUS_EVENTS.wait(
+            project_id, version, timeout=TRAINING_STATUS_WAIT_TIMEOUT
+        )
+        if event:
+            version, status, log = event
+        else:
+            # Not updated by this process, fall back to the database
+            part_detection_obj.refresh_from_db()
+            _, status, log = get_training_status(project_id)
 
     # =====================================================
     # 2. Project training failed                        ===
     # =====================================================
-    if training_status_obj.status == "failed":
+    if status == "failed":
         logger.info("Project train/export failed.")
         upcreate_deploy_status(
-            part_detection_id=part_detection_id,
-            status=training_status_obj.status,
-            log=training_status_obj.log,
+            part_detection_id=part_detection_id, status=status, log=log
         )
         return
 
@@ -88,143 +141,149 @@ def if_trained_then_deploy_worker(part_detection_id):
     )
 
 
-def deploy_worker(part_detection_id):
-    """deploy.
+def get_deploy_configuration(instance: PartDetection) -> dict:
+    """get_deploy_configuration.
+
+    Whole configuration of a part detection, as taken by the inference
+    module /apply_configuration.
 
     Args:
-        part_detection_obj: Part Detection Objects
+        instance (PartDetection): instance
     """
-    REQUEST_TIMEOUT = 60
-    instance: PartDetection = PartDetection.objects.get(pk=part_detection_id)
-    if not instance.has_configured:
-        logger.error("This PartDetection is not configured")
-        logger.error("Not sending any request to inference")
-        return
-    confidence_min = getattr(instance, "accuracyRangeMin", 30)
-    confidence_max = getattr(instance, "accuracyRangeMax", 80)
-    max_images = getattr(instance, "maxImages", 10)
-    metrics_is_send_iothub = getattr(instance, "metrics_is_send_iothub", False)
-    metrics_accuracy_threshold = getattr(instance, "metrics_accuracy_threshold", 50)
-    metrics_frame_per_minutes = getattr(instance, "metrics_frame_per_minutes", 6)
-    need_retraining = getattr(instance, "needRetraining", False)
+    configuration = {
+        "part_detection_id": instance.id,
+        "part_detection_mode": instance.inference_mode,
+        "parts": {
+            "parts": [
+                {"id": part.id, "name": part.name} for part in instance.parts.all()
+            ]
+        },
+        "retrain_parameters": {
+            "is_retrain": getattr(instance, "needRetraining", False),
+            "confidence_min": getattr(instance, "accuracyRangeMin", 30),
+            "confidence_max": getattr(instance, "accuracyRangeMax", 80),
+            "max_images": getattr(instance, "maxImages", 10),
+        },
+        "iothub_parameters": {
+            "is_send": getattr(instance, "metrics_is_send_iothub", False),
+            "threshold": getattr(instance, "metrics_accuracy_threshold", 50),
+            "fpm": getattr(instance, "metrics_frame_per_minutes", 6),
+        },
+        "prob_threshold": instance.prob_threshold,
+    }
+    if not instance.project:
+        pass
+    elif not instance.project.is_demo:
+        configuration["model"] = {"model_uri": instance.project.download_uri}
+    else:
+        configuration["model"] = {"model_dir": instance.project.download_uri}
 
-    # =====================================================
-    # 1. Update params                                  ===
-    # =====================================================
+    cameras = {
+        "fps": instance.fps,
+        "lva_mode": instance.inference_protocol,
+        "cameras": [],
+    }
+    for cam in instance.cameras.all():
+        cam_data = {
+            "id": cam.id,
+            "type": "rtsp",
+            "source": cam.rtsp,
+            "lines": cam.lines,
+            "zones": cam.danger_zones,
+            "send_video_to_cloud": cam.send_video_to_cloud,
+        }
+        if cam.area:
+            cam_data["aoi"] = cam.area
+        cameras["cameras"].append(cam_data)
+    serializer = UpdateCamBodySerializer(data=cameras)
+    serializer.is_valid(raise_exception=True)
+    configuration["cameras"] = json.loads(json.dumps(serializer.validated_data))
+    return configuration
+
+
+def deploy_configuration_one_by_one(url: str, configuration: dict):
+    """deploy_configuration_one_by_one.
+
+    Deploy for inference modules without /apply_configuration, one request
+    per section.
+
+    Args:
+        url (str): inference module url
+        configuration (dict): from get_deploy_configuration
+    """
+    url = "http://" + url
     requests.get(
-        "http://" + str(instance.inference_module.url) + "/update_part_detection_id",
-        params={"part_detection_id": instance.id},
-        timeout=REQUEST_TIMEOUT,
+        url + "/update_part_detection_id",
+        params={"part_detection_id": configuration["part_detection_id"]},
+        timeout=DEPLOY_REQUEST_TIMEOUT,
     )
     requests.get(
-        "http://" + str(instance.inference_module.url) + "/update_part_detection_mode",
-        params={"part_detection_mode": instance.inference_mode},
-        timeout=REQUEST_TIMEOUT,
+        url + "/update_part_detection_mode",
+        params={"part_detection_mode": configuration["part_detection_mode"]},
+        timeout=DEPLOY_REQUEST_TIMEOUT,
     )
-
-    # =====================================================
-    # 2. Update model                                  ===
-    # =====================================================
-    if not instance.project:
-        pass
-    elif not instance.project.is_demo:
+    if "model" in configuration:
         requests.post(
-            "http://" + str(instance.inference_module.url) + "/update_model",
-            json={"model_uri": instance.project.download_uri},
-            timeout=REQUEST_TIMEOUT,
+            url + "/update_model",
+            json=configuration["model"],
+            timeout=DEPLOY_REQUEST_TIMEOUT,
         )
-    else:
-        requests.post(
-            "http://" + str(instance.inference_module.url) + "/update_model",
-            json={"model_dir": instance.project.download_uri},
-            timeout=REQUEST_TIMEOUT,
-        )
-    # =====================================================
-    # 3. Update parts                                   ===
-    # =====================================================
-    logger.info("Update Parts!!!")
-    parts = instance.parts.all()
-    res_data = {"parts": []}
-
-    for part in parts.all():
-        res_data["parts"].append({"id": part.id, "name": part.name})
     requests.post(
-        url="http://" + instance.inference_module.url + "/update_parts",
-        json=res_data,
-        timeout=REQUEST_TIMEOUT,
+        url + "/update_parts",
+        json=configuration["parts"],
+        timeout=DEPLOY_REQUEST_TIMEOUT,
     )
-
     requests.get(
-        "http://" + instance.inference_module.url + "/update_retrain_parameters",
-        params={
-            "is_retrain": need_retraining,
-            "confidence_min": confidence_min,
-            "confidence_max": confidence_max,
-            "max_images": max_images,
-        },
-        timeout=REQUEST_TIMEOUT,
+        url + "/update_retrain_parameters",
+        params=configuration["retrain_parameters"],
+        timeout=DEPLOY_REQUEST_TIMEOUT,
     )
     requests.get(
-        "http://" + instance.inference_module.url + "/update_iothub_parameters",
-        params={
-            "is_send": metrics_is_send_iothub,
-            "threshold": metrics_accuracy_threshold,
-            "fpm": metrics_frame_per_minutes,
-        },
-        timeout=REQUEST_TIMEOUT,
+        url + "/update_iothub_parameters",
+        params=configuration["iothub_parameters"],
+        timeout=DEPLOY_REQUEST_TIMEOUT,
     )
-
-    # =====================================================
-    # 4. Update cams                                    ===
-    # =====================================================
-    logger.info("Update Cam!!!")
-    cameras = instance.cameras.all()
-    res_data = {
-        "fps": instance.fps,
-        "lva_mode": instance.inference_protocol,
-        "cameras": [],
-    }
-
-    for cam in cameras.all():
-        if cam.area:
-            res_data["cameras"].append(
-                {
-                    "id": cam.id,
-                    "type": "rtsp",
-                    "source": cam.rtsp,
-                    "aoi": cam.area,
-                    "lines": cam.lines,
-                    "zones": cam.danger_zones,
-                    "send_video_to_cloud": cam.send_video_to_cloud,
-                }
-            )
-        else:
-            res_data["cameras"].append(
-                {
-                    "id": cam.id,
-                    "type": "rtsp",
-                    "source": cam.rtsp,
-                    "lines": cam.lines,
-                    "zones": cam.danger_zones,
-                    "send_video_to_cloud": cam.send_video_to_cloud,
-                }
-            )
-    serializer = UpdateCamBodySerializer(data=res_data)
-    serializer.is_valid(raise_exception=True)
-    logger.info(serializer.validated_data)
     requests.post(
-        url="http://" + instance.inference_module.url + "/update_cams",
-        json=dict(serializer.validated_data),
-        timeout=REQUEST_TIMEOUT,
+        url + "/update_cams",
+        json=configuration["cameras"],
+        timeout=DEPLOY_REQUEST_TIMEOUT,
     )
-    # =====================================================
-    # 5. Update prob_threshold                          ===
-    # =====================================================
     requests.get(
-        "http://" + instance.inference_module.url + "/update_prob_threshold",
-        params={"prob_threshold": instance.prob_threshold},
-        timeout=REQUEST_TIMEOUT,
+        url + "/update_prob_threshold",
+        params={"prob_threshold": configuration["prob_threshold"]},
+        timeout=DEPLOY_REQUEST_TIMEOUT,
+    )
+
+
+def deploy_worker(part_detection_id):
+    """deploy.
+
+    Send the whole configuration to the inference module at once, it only
+    updates what changed.
+
+    Args:
+        part_detection_id: Part Detection id
+    """
+    instance: PartDetection = PartDetection.objects.get(pk=part_detection_id)
+    if not instance.has_configured:
+        logger.error("This PartDetection is not configured")
+        logger.error("Not sending any request to inference")
+        return
+    configuration = get_deploy_configuration(instance)
+    logger.info(configuration)
+    response = requests.post(
+        "http://" + str(instance.inference_module.url) + "/apply_configuration",
+        json=configuration,
+        timeout=DEPLOY_REQUEST_TIMEOUT,
     )
+    if response.status_code == 404:
+        logger.info("Inference module without /apply_configuration")
+        deploy_configuration_one_by_one(
+            url=str(instance.inference_module.url), configuration=configuration
+        )
+        return
+    response.raise_for_status()
+    logger.info("Applied sections: %s", response.json()["applied"])
 
 
 def if_trained_then_deploy_catcher(part_detection_id):
@@ -243,13 +302,126 @@ def if_trained_then_deploy_catcher(part_detection_id):
         )
 
 
+class DeployScheduler:
+    """DeployScheduler
+
+    Coalesce the deploys of a part detection. A deploy requested while one is
+    scheduled is merged into it, one requested while one is running runs
+    once after it. Deploys read the latest configuration when they start.
+
+    Args:
+        delay (float): seconds a deploy waits for more requests
+        worker: deploy function
+    """
+
+    def __init__(self, delay=DEPLOY_COALESCE_DELAY, worker=deploy_worker):
+        self.delay = delay
+        self.worker = worker
+        self.mutex = threading.Lock()
+        # part_detection_id => "scheduled", "running" or "pending"
+        self.states = {}
+        # part_detection_id waiting for training => requested again meanwhile
+        self.watching = {}
+        self.counters = {"requested": 0, "coalesced": 0, "deployed": 0}
+
+    def request(self, part_detection_id) -> bool:
+        """request a deploy.
+
+        Returns:
+            bool: False if merged into another deploy
+        """
+        with self.mutex:
+            self.counters["requested"] += 1
+            state = self.states.get(part_detection_id)
+            if state == "running":
+                self.states[part_detection_id] = "pending"
+            if state is not None:
+                self.counters["coalesced"] += 1
+                return False
+            self.states[part_detection_id] = "scheduled"
+        threading.Thread(
+            name="deploy_scheduler",
+            target=self._run,
+            args=(part_detection_id,),
+            daemon=True,
+        ).start()
+        return True
+
+    def _run(self, part_detection_id):
+        while True:
+            time.sleep(self.delay)
+            with self.mutex:
+                self.states[part_detection_id] = "running"
+            try:
+                self.worker(part_detection_id=part_detection_id)
+            except Exception:
+                logger.exception(
+                    "Deploy of part detection %s failed", part_detection_id
+                )
+            finally:
+                close_old_connections()
+            with self.mutex:
+                self.counters["deployed"] += 1
+                if self.states[part_detection_id] != "pending":
+                    del self.states[part_detection_id]
+                    return
+                self.states[part_detection_id] = "scheduled"
+
+    def watch(self, part_detection_id, target) -> bool:
+        """watch.
+
+        Run target(part_detection_id) in a thread. If one still runs for
+        this part detection, it runs target once more when done, so the
+        latest configuration is watched.
+
+        Returns:
+            bool: False if merged into the one running
+        """
+        with self.mutex:
+            if part_detection_id in self.watching:
+                self.watching[part_detection_id] = True
+                self.counters["coalesced"] += 1
+                return False
+            self.watching[part_detection_id] = False
+
+        def _watch():
+            while True:
+                try:
+                    target(part_detection_id)
+                except Exception:
+                    logger.exception(
+                        "Watch of part detection %s failed", part_detection_id
+                    )
+                finally:
+                    close_old_connections()
+                with self.mutex:
+                    if not self.watching[part_detection_id]:
+                        del self.watching[part_detection_id]
+                        return
+                    self.watching[part_detection_id] = False
+
+        threading.Thread(
+            name="deploy_scheduler_watch", target=_watch, daemon=True
+        ).start()
+        return True
+
+    def get_metrics(self):
+        """get_metrics."""
+        with self.mutex:
+            return dict(self.counters, scheduled=len(self.states))
+
+
+DEPLOY_SCHEDULER = DeployScheduler()
+
+
 # Helper here.
 
 
 def if_trained_then_deploy_helper(part_detection_id):
     """update_train_status.
 
-    Open a thread to follow training status object.
+    Open a thread to follow training status object, unless one already
+    follows it.
 
     Args:
         project_id:
@@ -261,23 +433,342 @@ def if_trained_then_deploy_helper(part_detection_id):
         part_detection_id=part_detection_id,
         **deploy_progress.PROGRESS_1_WATINING_PROJECT_TRAINED
     )
-    threading.Thread(
-        name="if_trained_then_deploy_catcher",
-        target=if_trained_then_deploy_catcher,
-        args=(part_detection_id,),
-        daemon=True,
-    ).start()
+    DEPLOY_SCHEDULER.watch(part_detection_id, if_trained_then_deploy_catcher)
 
 
 def deploy_all_helper(part_detection_id=None, instance: PartDetection = None) -> None:
     """deploy_helper.
 
-    Deploy everything to inference in a thread.
+    Deploy everything to inference in a thread, rapid successive calls are
+    coalesced.
     """
-    if part_detection_id or instance:
-        threading.Thread(
-            name="deploy_all_helper",
-            target=deploy_worker,
-            args=(part_detection_id,),
-            daemon=True,
-        ).start()
+    if instance:
+        part_detection_id = instance.id
+    if part_detection_id:
+        DEPLOY_SCHEDULER.request(part_detection_id)
+
+
+class RelabelImageWriter:
+    """RelabelImageWriter
+
+    Persist relabel images uploaded by inference modules on a background
+    thread. Images are written in batches, one bulk_create per batch, and
+    the relabel images of a (project, part) above max_images are evicted
+    with one delete.
+
+    Relabel counts are kept in memory so accepting an image needs no query.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = RELABEL_QUEUE_SIZE,
+        batch_size: int = RELABEL_BATCH_SIZE,
+        batch_wait: float = RELABEL_BATCH_WAIT,
+    ):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+        self.mutex = threading.Lock()
+        # (project_id, part_id) => [count, time of the last database read]
+        self.counts = {}
+        self.counters = {
+            "accepted": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "written": 0,
+            "evicted": 0,
+            "failed": 0,
+            "batches": 0,
+        }
+        # (time, images written) of the recent batches
+        self.history = deque()
+        self.worker = None
+
+    def get_count(self, project_id, part_id) -> int:
+        """get_count.
+
+        Relabel images of a part, including the images not written yet.
+        """
+        key = (project_id, part_id)
+        with self.mutex:
+            if key in self.counts and (
+                self.counts[key][1] + RELABEL_COUNT_TTL > time.time()
+            ):
+                return self.counts[key][0]
+        count = Image.objects.filter(
+            project_id=project_id, part_id=part_id, is_relabel=True
+        ).count()
+        with self.mutex:
+            self.counts[key] = [count + self._pending(key), time.time()]
+            return self.counts[key][0]
+
+    def _pending(self, key):
+        with self.queue.mutex:
+            return sum(
+                1
+                for job in self.queue.queue
+                if job["image"] is not None and job["key"] == key
+            )
+
+    def submit(
+        self,
+        project_id,
+        part_id,
+        camera_id,
+        labels,
+        confidence,
+        image: bytes,
+        max_images: int,
+        keep_newest: bool = True,
+    ) -> bool:
+        """submit.
+
+        Queue a relabel image, never blocks.
+
+        Args:
+            image (bytes): image file, None to only evict
+            max_images (int): relabel images to keep for this part
+            keep_newest (bool): evict the oldest images if True, the
+                newest otherwise
+
+        Returns:
+            bool: queued, False if the queue is full
+        """
+        key = (project_id, part_id)
+        job = {
+            "key": key,
+            "camera_id": camera_id,
+            "labels": labels,
+            "confidence": confidence,
+            "image": image,
+            "name": str(timezone.now()) + ".jpg",
+            "max_images": max_images,
+            "keep_newest": keep_newest,
+        }
+        self.start()
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            logger.warning("Relabel queue full, image dropped")
+            self._count("dropped")
+            return False
+        if image is not None:
+            self._count("accepted")
+            with self.mutex:
+                if key in self.counts:
+                    self.counts[key][0] = min(self.counts[key][0] + 1, max_images)
+        return True
+
+    def reject(self):
+        """Count an image refused because the part is full."""
+        self._count("rejected")
+
+    def start(self):
+        """start the writer thread once."""
+        with self.mutex:
+            if self.worker is not None:
+                return
+            self.worker = threading.Thread(
+                name="relabel_image_writer", target=self._run, daemon=True
+            )
+            self.worker.start()
+
+    def _count(self, key, value=1):
+        with self.mutex:
+            self.counters[key] += value
+
+    def _run(self):
+        while True:
+            jobs = [self.queue.get()]
+            deadline = time.time() + self.batch_wait
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(
+                        self.queue.get(timeout=max(deadline - time.time(), 0))
+                    )
+                except queue.Empty:
+                    break
+            try:
+                self.write(jobs)
+            except Exception:
+                logger.exception("Relabel images write failed")
+                self._count("failed", len(jobs))
+            finally:
+                close_old_connections()
+
+    def process_pending(self):
+        """Write every queued job in the caller thread."""
+        jobs = []
+        while True:
+            try:
+                jobs.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if jobs:
+            self.write(jobs)
+
+    def write(self, jobs):
+        """write.
+
+        Save the image files of a batch, bulk create the rows, then evict.
+        """
+        img_objs = []
+        evictions = {}
+        for job in jobs:
+            project_id, part_id = job["key"]
+            evictions[job["key"]] = (job["max_images"], job["keep_newest"])
+            if job["image"] is None:
+                continue
+            img_obj = Image(
+                part_id=part_id,
+                camera_id=job["camera_id"],
+                labels=job["labels"],
+                confidence=job["confidence"],
+                project_id=project_id,
+                is_relabel=True,
+            )
+            img_obj.image.save(job["name"], ContentFile(job["image"]), save=False)
+            img_objs.append(img_obj)
+        Image.objects.bulk_create(img_objs)
+
+        evicted = 0
+        for (project_id, part_id), (max_images, keep_newest) in evictions.items():
+            relabel_imgs = Image.objects.filter(
+                project_id=project_id, part_id=part_id, is_relabel=True
+            )
+            count = relabel_imgs.count()
+            if count > max_images:
+                order = "timestamp" if keep_newest else "-timestamp"
+                evict_ids = list(
+                    relabel_imgs.order_by(order, "id").values_list("id", flat=True)[
+                        : count - max_images
+                    ]
+                )
+                Image.objects.filter(pk__in=evict_ids).delete()
+                evicted += len(evict_ids)
+                count = max_images
+            with self.mutex:
+                self.counts[(project_id, part_id)] = [
+                    count + self._pending((project_id, part_id)),
+                    time.time(),
+                ]
+
+        with self.mutex:
+            self.counters["written"] += len(img_objs)
+            self.counters["evicted"] += evicted
+            self.counters["batches"] += 1
+            self.history.append((time.time(), len(img_objs)))
+        logger.info("Relabel images written: %s, evicted: %s", len(img_objs), evicted)
+
+    def get_metrics(self):
+        """get_metrics."""
+        now = time.time()
+        with self.mutex:
+            while self.history and self.history[0][0] + RELABEL_METRICS_WINDOW < now:
+                self.history.popleft()
+            written_recently = sum(written for _, written in self.history)
+            metrics = dict(self.counters)
+        metrics["queue_depth"] = self.queue.qsize()
+        metrics["images_per_second"] = written_recently / RELABEL_METRICS_WINDOW
+        return metrics
+
+
+RELABEL_IMAGE_WRITER = RelabelImageWriter()
+
+
+def format_inference_metrics(data) -> dict:
+    """format_inference_metrics.
+
+    Inference module /metrics of a camera to the fields of export.
+    """
+    return {
+        "success_rate": int(data["success_rate"] * 100) / 100,
+        "inference_num": data["inference_num"],
+        "unidentified_num": data["unidentified_num"],
+        "gpu": data["is_gpu"],
+        "count": data["last_prediction_count"],
+        "average_time": data["average_inference_time"],
+        "scenario_metrics": data["scenario_metrics"] or [],
+    }
+
+
+class InferenceMetricsCache:
+    """InferenceMetricsCache
+
+    Metrics of the cameras of an inference module, fetched with one
+    /metrics_all request and kept for ttl seconds. Inference modules
+    without /metrics_all are asked for every camera concurrently.
+
+    Raises:
+        requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout
+    """
+
+    def __init__(
+        self,
+        ttl: float = INFERENCE_METRICS_TTL,
+        max_workers: int = INFERENCE_METRICS_WORKERS,
+    ):
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.mutex = threading.Lock()
+        # (url, cam_ids) => (time, {cam_id: metrics})
+        self.entries = {}
+        self.executor = None
+
+    def get(self, url: str, cam_ids) -> dict:
+        """get.
+
+        Args:
+            url (str): inference module url
+            cam_ids: camera ids
+
+        Returns:
+            {str(cam_id): /metrics of the camera}
+        """
+        cam_ids = tuple(sorted(str(cam_id) for cam_id in cam_ids))
+        key = (url, cam_ids)
+        now = time.time()
+        with self.mutex:
+            if key in self.entries and self.entries[key][0] + self.ttl > now:
+                return self.entries[key][1]
+            # Drop expired entries, cameras and modules change over time
+            self.entries = {
+                k: v for k, v in self.entries.items() if v[0] + self.ttl > now
+            }
+
+        metrics = self.fetch(url, cam_ids)
+        with self.mutex:
+            self.entries[key] = (time.time(), metrics)
+        return metrics
+
+    def fetch(self, url: str, cam_ids) -> dict:
+        """fetch the metrics, bypassing the cache."""
+        res = requests.get(
+            "http://" + url + "/metrics_all",
+            params={"cam_ids": ",".join(cam_ids)},
+            timeout=INFERENCE_METRICS_TIMEOUT,
+        )
+        if res.status_code != 404:
+            data = res.json()
+            return {
+                cam_id: dict(data["cameras"][cam_id], is_gpu=data["is_gpu"])
+                for cam_id in cam_ids
+            }
+
+        # Inference module without /metrics_all
+        with self.mutex:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        def _fetch_camera(cam_id):
+            return requests.get(
+                "http://" + url + "/metrics",
+                params={"cam_id": cam_id},
+                timeout=INFERENCE_METRICS_TIMEOUT,
+            ).json()
+
+        return dict(zip(cam_ids, self.executor.map(_fetch_camera, cam_ids)))
+
+
+INFERENCE_METRICS_CACHE = InferenceMetricsCache()
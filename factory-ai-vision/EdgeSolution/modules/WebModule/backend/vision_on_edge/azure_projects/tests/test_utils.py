@@ -0,0 +1,253 @@
+"""App utility tests.
+"""
+
+import asyncio
+import io
+import json
+import time
+from unittest import mock
+
+import pytest
+from PIL import Image as PILImage
+
+from ...azure_parts.models import Part
+from ...azure_training_status import progress
+from ...images.models import Image
+from .. import utils
+
+
+class FakeIteration:
+    def __init__(self, status, exportable):
+        self.id = "iteration_id"
+        self.status = status
+        self.exportable = exportable
+
+
+class FakeExport:
+    def __init__(self, download_uri):
+        self.download_uri = download_uri
+
+
+class FakeRegion:
+    def __init__(self, tag_id, left, top, width, height):
+        self.tag_id = tag_id
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+
+class FakeTaggedImage:
+    def __init__(self, image_id, regions):
+        self.id = image_id
+        self.original_image_uri = "https://fake/" + image_id
+        self.regions = regions
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(utils, "TRAINING_POLL_MIN_INTERVAL", 0)
+    monkeypatch.setattr(utils, "TRAINING_POLL_MAX_INTERVAL", 0)
+
+
+@pytest.fixture
+def trainer():
+    trainer = mock.MagicMock()
+    trainer.get_iterations.side_effect = [
+        [],
+        [FakeIteration("Training", False)],
+        [FakeIteration("Training", False)],
+        [FakeIteration("Completed", True)],
+    ]
+    trainer.get_exports.side_effect = [[], [FakeExport("model_uri")]]
+    return trainer
+
+
+@pytest.fixture
+def project_obj(trainer):
+    project_obj = mock.MagicMock()
+    project_obj.customvision_id = "customvision_id"
+    project_obj.setting.get_trainer_obj.return_value = trainer
+    return project_obj
+
+
+@pytest.mark.fast
+def test_train_project_async(monkeypatch, fast_polling, project_obj, trainer):
+    """test_train_project_async.
+
+    Type:
+        Positive
+
+    Description:
+        Poll Custom Vision until the iteration is trained and exported.
+    """
+    upcreate_training_status = mock.MagicMock()
+    save_training_result = mock.MagicMock()
+    monkeypatch.setattr(utils, "upcreate_training_status", upcreate_training_status)
+    monkeypatch.setattr(utils, "save_training_result", save_training_result)
+    monkeypatch.setattr(
+        utils,
+        "prepare_training",
+        mock.MagicMock(return_value=(project_obj, True, False)),
+    )
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(utils.train_project_async(project_id=1))
+    loop.close()
+
+    assert trainer.get_iterations.call_count == 4
+    assert trainer.get_exports.call_count == 2
+    project_obj.export_iterationv3_2.assert_called_once_with("iteration_id")
+
+    statuses = [call[1]["status"] for call in upcreate_training_status.call_args_list]
+    assert statuses == [
+        progress.PROGRESS_6_PREPARING_CUSTOM_VISION_ENV["status"],
+        progress.PROGRESS_7_TRAINING["status"],
+        progress.PROGRESS_8_EXPORTING["status"],
+    ]
+    save_training_result.assert_called_once()
+    assert save_training_result.call_args[1]["has_new_parts"]
+
+
+@pytest.mark.fast
+def test_train_project_async_iteration_timeout(
+    monkeypatch, fast_polling, project_obj, trainer
+):
+    """test_train_project_async_iteration_timeout.
+
+    Type:
+        Negative
+
+    Description:
+        Training fails if no iteration shows up.
+    """
+    trainer.get_iterations.side_effect = None
+    trainer.get_iterations.return_value = []
+    upcreate_training_status = mock.MagicMock()
+    monkeypatch.setattr(utils, "TRAINING_FIND_ITERATION_TIMEOUT", 0)
+    monkeypatch.setattr(utils, "upcreate_training_status", upcreate_training_status)
+    monkeypatch.setattr(
+        utils,
+        "prepare_training",
+        mock.MagicMock(return_value=(project_obj, True, False)),
+    )
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(utils.train_project_async(project_id=1))
+    loop.close()
+
+    assert upcreate_training_status.call_args[1]["status"] == "failed"
+    trainer.get_exports.assert_not_called()
+
+
+@pytest.mark.fast
+def test_training_manager(monkeypatch):
+    """test_training_manager.
+
+    Type:
+        Positive
+
+    Description:
+        Trainings run on the manager loop and are removed once finished.
+    """
+    async def fake_train_project_async(project_id, executor=None):
+        await asyncio.sleep(0.1)
+
+    monkeypatch.setattr(utils, "train_project_async", fake_train_project_async)
+    manager = utils.TrainingManager(max_workers=1)
+    manager.add(project_id=1)
+    task = manager.get_task_by_id(1)
+    assert task is not None
+    with pytest.raises(utils.ProjectAlreadyTraining):
+        manager.add(project_id=1)
+
+    task.result(timeout=5)
+    for _ in range(50):
+        if manager.get_task_by_id(1) is None:
+            break
+        time.sleep(0.01)
+    assert manager.get_task_by_id(1) is None
+
+
+@pytest.mark.django_db
+def test_pull_tagged_images(monkeypatch, project):
+    """test_pull_tagged_images.
+
+    Type:
+        Positive
+
+    Description:
+        Tagged images are pulled page by page, one row per part with the
+        regions of that part, failed downloads are discarded.
+    """
+    parts_by_tag_id = {
+        tag_id: Part.objects.create(project=project, name=tag_id)
+        for tag_id in ["tag_a", "tag_b"]
+    }
+    imgs = [
+        FakeTaggedImage(
+            "img_" + str(i),
+            [
+                FakeRegion("tag_a", 0.1, 0.1, 0.5, 0.5),
+                FakeRegion("tag_a", 0.5, 0.5, 0.25, 0.25),
+                FakeRegion("tag_b", 0, 0, 1, 1),
+                FakeRegion("unknown_tag", 0, 0, 1, 1),
+            ],
+        )
+        for i in range(7)
+    ]
+    imgs.append(FakeTaggedImage("img_failed", [FakeRegion("tag_b", 0, 0, 1, 1)]))
+    imgs.append(
+        FakeTaggedImage("img_unknown", [FakeRegion("unknown_tag", 0, 0, 1, 1)])
+    )
+
+    trainer = mock.MagicMock()
+    trainer.get_tagged_image_count.return_value = len(imgs)
+    trainer.get_tagged_images.side_effect = lambda project_id, take, skip: imgs[
+        skip : skip + take
+    ]
+
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (200, 100)).save(buffer, format="PNG")
+    session = mock.MagicMock()
+    session.get.side_effect = lambda url, timeout: (
+        FakeResponse(404)
+        if url.endswith("failed")
+        else FakeResponse(200, buffer.getvalue())
+    )
+    monkeypatch.setattr(utils, "get_download_session", lambda pool_size: session)
+
+    created = utils.pull_tagged_images(
+        trainer=trainer,
+        project_obj=project,
+        customvision_project_id="customvision_id",
+        parts_by_tag_id=parts_by_tag_id,
+        page_size=3,
+        max_workers=2,
+    )
+
+    assert created == 14
+    assert trainer.get_tagged_images.call_count == 3
+    # Only images with a region of a pulled part are downloaded
+    assert session.get.call_count == 8
+    session.close.assert_called_once()
+
+    img_objs = Image.objects.filter(project=project)
+    assert img_objs.count() == 14
+    img_a = img_objs.get(customvision_id="img_0", part=parts_by_tag_id["tag_a"])
+    assert json.loads(img_a.labels) == [
+        {"x1": 20, "y1": 10, "x2": 120, "y2": 60},
+        {"x1": 100, "y1": 50, "x2": 150, "y2": 75},
+    ]
+    assert img_a.manual_checked
+    assert img_a.remote_url == "https://fake/img_0"
+    assert img_a.image.width == 200
+    img_b = img_objs.get(customvision_id="img_0", part=parts_by_tag_id["tag_b"])
+    assert json.loads(img_b.labels) == [{"x1": 0, "y1": 0, "x2": 200, "y2": 100}]
+    assert not img_objs.filter(customvision_id="img_failed").exists()
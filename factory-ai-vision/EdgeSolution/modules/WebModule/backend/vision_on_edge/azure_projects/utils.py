@@ -1,12 +1,18 @@
 """App utilities.
 """
 
+import asyncio
+import functools
 import json
 import logging
 import sys
 import threading
-import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage
 
 from configs.general_configs import PRINT_THREAD
 
@@ -14,15 +20,31 @@ from ..azure_app_insight.utils import get_app_insight_logger
 from ..azure_parts.models import Part
 from ..azure_parts.utils import batch_upload_parts_to_customvision
 from ..azure_settings.exceptions import SettingCustomVisionAccessFailed
+from ..azure_settings.utils import TRAINER_CACHE
 from ..azure_training_status import progress
 from ..azure_training_status.utils import upcreate_training_status
 from ..images.models import Image
-from ..images.utils import upload_images_to_customvision_helper
+from ..images.utils import (
+    IMAGE_DOWNLOAD_WORKERS,
+    download_remote_images,
+    get_download_session,
+    upload_images_to_customvision,
+)
 from .exceptions import ProjectAlreadyTraining, ProjectRemovedError
 from .models import Project, Task
 
 logger = logging.getLogger(__name__)
 
+# Custom Vision polling while training / exporting
+TRAINING_POLL_MIN_INTERVAL = 1  # seconds
+TRAINING_POLL_MAX_INTERVAL = 15  # seconds
+TRAINING_POLL_BACKOFF = 1.5
+TRAINING_FIND_ITERATION_TIMEOUT = 60  # seconds
+# Threads for the blocking part (ORM, uploads, Custom Vision calls)
+TRAINING_MAX_WORKERS = 4
+# Max take of get_tagged_images
+CUSTOMVISION_MAX_TAGGED_IMAGES_TAKE = 256
+
 
 def update_app_insight_counter(
     project_obj,
@@ -90,6 +112,8 @@ def pull_cv_project_helper(project_id, customvision_project_id: str, is_partial:
         raise SettingCustomVisionAccessFailed
 
     trainer = project_obj.setting.get_trainer_obj()
+    # Pull what is on Custom Vision now
+    TRAINER_CACHE.invalidate(project_id=customvision_project_id)
 
     # Check Customvision Project id
     try:
@@ -109,6 +133,7 @@ def pull_cv_project_helper(project_id, customvision_project_id: str, is_partial:
     # Download parts and images
     logger.info("Pulling Parts...")
     counter = 0
+    parts_by_tag_id = {}
     tags = trainer.get_tags(customvision_project_id)
     for tag in tags:
         logger.info("Creating Part %s: %s %s", counter, tag.name, tag.description)
@@ -118,6 +143,7 @@ def pull_cv_project_helper(project_id, customvision_project_id: str, is_partial:
             description=tag.description if tag.description else "",
             customvision_id=tag.id,
         )
+        parts_by_tag_id[tag.id] = part_obj
 
         # Make sure part is created
         if not created:
@@ -183,65 +209,166 @@ def pull_cv_project_helper(project_id, customvision_project_id: str, is_partial:
         return
 
     # Full Download
+    pull_tagged_images(
+        trainer=trainer,
+        project_obj=project_obj,
+        customvision_project_id=customvision_project_id,
+        parts_by_tag_id=parts_by_tag_id,
+    )
+    logger.info("Pulling Custom Vision Project... End")
+
+
+def create_pulled_image_objs(project_obj, img, parts_by_tag_id, contents):
+    """create_pulled_image_objs.
+
+    One unsaved Image per part tagged on a Custom Vision image, labelled with
+    every region of that part.
+
+    Args:
+        img: Custom Vision image, with regions
+        parts_by_tag_id: {Custom Vision tag id: Part}
+        contents: downloaded image file
+
+    Returns:
+        list of Image objects
+    """
+    with PILImage.open(BytesIO(contents)) as pil_img:
+        size_width, size_height = pil_img.size
+
+    labels_by_part = {}
+    for region in img.regions:
+        part_obj = parts_by_tag_id.get(region.tag_id)
+        if part_obj is None:
+            continue
+        label = Image.region_to_label(
+            left=region.left,
+            top=region.top,
+            width=region.width,
+            height=region.height,
+            size_width=size_width,
+            size_height=size_height,
+        )
+        labels = labels_by_part.setdefault(part_obj, [])
+        if label is not None:
+            labels.append(label)
+
+    max_labels_length = Image._meta.get_field("labels").max_length
+    img_objs = []
+    for part_obj, labels in labels_by_part.items():
+        while len(json.dumps(labels)) > max_labels_length:
+            logger.warning("Too many regions on %s, dropping one", img.id)
+            labels.pop()
+        img_obj = Image(
+            part=part_obj,
+            project=project_obj,
+            remote_url=img.original_image_uri,
+            customvision_id=img.id,
+            manual_checked=True,
+            labels=json.dumps(labels) if labels else None,
+        )
+        file_name = f"{part_obj.name}-{img.original_image_uri.split('/')[-1]}"
+        img_obj.image.save(file_name, ContentFile(contents), save=False)
+        img_objs.append(img_obj)
+    return img_objs
+
+
+def pull_tagged_images(
+    trainer,
+    project_obj,
+    customvision_project_id: str,
+    parts_by_tag_id: dict,
+    page_size: int = CUSTOMVISION_MAX_TAGGED_IMAGES_TAKE,
+    max_workers: int = IMAGE_DOWNLOAD_WORKERS,
+) -> int:
+    """pull_tagged_images.
+
+    Page through the tagged images of a Custom Vision project, download each
+    page concurrently and bulk create its Image rows.
+
+    Args:
+        parts_by_tag_id: {Custom Vision tag id: Part}
+        page_size (int): images per get_tagged_images, at most 256
+        max_workers (int): concurrent downloads
+
+    Returns:
+        int: number of Image rows created
+    """
     logger.info("Pulling Tagged Images...")
-    img_counter = 0
     imgs_count = trainer.get_tagged_image_count(project_id=customvision_project_id)
-    img_batch_size = 50
+    page_size = min(page_size, CUSTOMVISION_MAX_TAGGED_IMAGES_TAKE)
+    session = get_download_session(pool_size=max_workers)
+
     img_index = 0
+    img_counter = 0
+    failed_counter = 0
+    try:
+        while img_index < imgs_count:
+            imgs = trainer.get_tagged_images(
+                project_id=customvision_project_id, take=page_size, skip=img_index
+            )
+            if len(imgs) == 0:
+                break
+            img_index += len(imgs)
+
+            # Images without any region of a pulled part are not downloaded
+            imgs = [
+                img
+                for img in imgs
+                if any(region.tag_id in parts_by_tag_id for region in img.regions)
+            ]
+            contents_list = download_remote_images(
+                urls=[img.original_image_uri for img in imgs],
+                session=session,
+                max_workers=max_workers,
+            )
 
-    while img_index <= imgs_count:
-        logger.info("Img Index: %s. Img Count: %s", img_index, imgs_count)
-        imgs = trainer.get_tagged_images(
-            project_id=customvision_project_id, take=img_batch_size, skip=img_index
-        )
-        for img in imgs:
-            logger.info("*** img %s", img_counter)
-            for region in img.regions:
-                part_objs = Part.objects.filter(
-                    name=region.tag_name, project_id=project_id
-                )
-                if not part_objs.exists():
+            img_objs = []
+            for img, contents in zip(imgs, contents_list):
+                if contents is None:
+                    logger.error("Image %s discarded...", img.id)
+                    failed_counter += 1
                     continue
-                part_obj = part_objs.first()
-                img_obj, created = Image.objects.update_or_create(
-                    part=part_obj,
-                    remote_url=img.original_image_uri,
-                    project=project_obj,
-                    customvision_id=img.id,
-                    manual_checked=True,
-                )
-                if created:
-                    logger.info("Downloading img %s", img.id)
-                    img_obj.get_remote_image()
-                    logger.info("Setting label of %s", img.id)
-                    img_obj.set_labels(
-                        left=region.left,
-                        top=region.top,
-                        width=region.width,
-                        height=region.height,
-                    )
-                    img_counter += 1
-                else:
-                    # TODO:  Multiple region with same tag
-                    logger.info("Adding label to %s", img.id)
-                    img_obj.add_labels(
-                        left=region.left,
-                        top=region.top,
-                        width=region.width,
-                        height=region.height,
+                try:
+                    img_objs.extend(
+                        create_pulled_image_objs(
+                            project_obj=project_obj,
+                            img=img,
+                            parts_by_tag_id=parts_by_tag_id,
+                            contents=contents,
+                        )
                     )
+                except Exception:
+                    logger.exception("Image %s discarded...", img.id)
+                    failed_counter += 1
+            Image.objects.bulk_create(img_objs)
+            img_counter += len(img_objs)
+
+            logger.info(
+                "Pulling Tagged Images... %s/%s (%s images created, %s failed)",
+                img_index,
+                imgs_count,
+                img_counter,
+                failed_counter,
+            )
+    finally:
+        session.close()
 
-        img_index += img_batch_size
-    logger.info("Pulled %s images", counter)
+    logger.info("Pulled %s images", img_counter)
     logger.info("Pulling Tagged Images... End")
-    logger.info("Pulling Custom Vision Project... End")
+    return img_counter
+
 
+def prepare_training(project_id):
+    """prepare_training.
 
-def train_project_worker(project_id):
-    """train_project_worker.
+    Upload parts and images, then submit the training task.
 
     Args:
         project_id: Django ORM project id
+
+    Returns:
+        (project_obj, has_new_parts, has_new_images) if a training task is
+        submitted, None otherwise.
     """
     # =====================================================
     # 0. Get Project in Django                          ===
@@ -252,7 +379,7 @@ def train_project_worker(project_id):
         upcreate_training_status(
             project_id=project_obj.id, status="failed", log="Custom Vision Access Error"
         )
-        return
+        return None
     if project_obj.is_demo:
         logger.info("Demo project is already trained")
         upcreate_training_status(
@@ -260,7 +387,7 @@ def train_project_worker(project_id):
             need_to_send_notification=True,
             **progress.PROGRESS_0_OK,
         )
-        return
+        return None
 
     # =====================================================
     # 1. Prepare Custom Vision Client                   ===
@@ -331,13 +458,12 @@ def train_project_worker(project_id):
     # =====================================================
     # 4. Upload images to Custom Vision Project         ===
     # =====================================================
-    for part_id in part_ids:
-        logger.info("Uploading images with part_id %s", part_id)
-        has_new_images = upload_images_to_customvision_helper(
-            project_id=project_obj.id, part_id=part_id
-        )
-        if has_new_images:
-            project_changed = True
+    # Batches of every part are uploaded concurrently
+    has_new_images = upload_images_to_customvision(
+        project_id=project_obj.id, part_ids=part_ids
+    )
+    if has_new_images:
+        project_changed = True
 
     # =====================================================
     # 5. Submit Training Task to Custom Vision          ===
@@ -350,7 +476,7 @@ def train_project_worker(project_id):
             need_to_send_notification=True,
             **progress.PROGRESS_0_OK,
         )
-        return
+        return None
     upcreate_training_status(
         project_id=project_obj.id,
         need_to_send_notification=True,
@@ -366,86 +492,24 @@ def train_project_worker(project_id):
             parts_last_train=parts_last_train,
             images_last_train=images_last_train,
         )
+    return project_obj, has_new_parts, has_new_images
 
-    # =====================================================
-    # 6. Training (Finding Iteration)                   ===
-    # =====================================================
-    logger.info("Finding Iteration")
-    customvision_id = project_obj.customvision_id
-    wait_prepare = 0
-    max_wait_prepare = 60
-    status_init = False
-    while True:
-        time.sleep(1)
-        wait_prepare += 1
-        iterations = trainer.get_iterations(customvision_id)
-        if not status_init:
-            upcreate_training_status(
-                project_id=project_obj.id,
-                need_to_send_notification=True,
-                **progress.PROGRESS_6_PREPARING_CUSTOM_VISION_ENV,
-            )
-            status_init = True
-        if len(iterations) > 0:
-            logger.info("Iteration Found %s", iterations[0])
-            break
-        if wait_prepare > max_wait_prepare:
-            logger.info("Something went wrong...")
-            upcreate_training_status(
-                project_id=project_obj.id,
-                status="failed",
-                log="Get iteration from Custom Vision occurs error.",
-                need_to_send_notification=True,
-            )
-            break
-
-    # =====================================================
-    # 6. Training (Waiting)                             ===
-    # =====================================================
-    logger.info("Training")
-    status_init = False
-    while True:
-        time.sleep(1)
-        iterations = trainer.get_iterations(customvision_id)
-        iteration = iterations[0]
-        if not status_init:
-            upcreate_training_status(
-                project_id=project_obj.id,
-                need_to_send_notification=True,
-                **progress.PROGRESS_7_TRAINING,
-            )
-            status_init = True
-        if iteration.exportable and iteration.status == "Completed":
-            break
-        logger.info("Still training...")
-
-    # =====================================================
-    # 7. Exporting                                      ===
-    # =====================================================
-    status_init = False
-    while True:
-        time.sleep(1)
-        exports = trainer.get_exports(customvision_id, iteration.id)
-        if not status_init:
-            upcreate_training_status(
-                project_id=project_obj.id,
-                need_to_send_notification=True,
-                **progress.PROGRESS_8_EXPORTING,
-            )
-            status_init = True
-        if len(exports) == 0 or not exports[0].download_uri:
 
-            res = project_obj.export_iterationv3_2(iteration.id)
-            logger.info("Export response from Custom Vision: %s", res.json())
-            continue
-        break
+def save_training_result(
+    project_obj, iterations, iteration, has_new_parts: bool, has_new_images: bool
+):
+    """save_training_result.
 
+    Save the exported model and the performance of the last iterations.
+    """
     # =====================================================
     # 8. Saving model and performance                   ===
     # =====================================================
     logger.info("Successfully export model: %s", project_obj.download_uri)
     logger.info("Training about to completed.")
 
+    trainer = project_obj.setting.get_trainer_obj()
+    customvision_id = project_obj.customvision_id
     exports = trainer.get_exports(customvision_id, iteration.id)
     project_obj.download_uri = exports[0].download_uri
     train_performance_list = []
@@ -475,112 +539,213 @@ def train_project_worker(project_id):
     project_obj.save()
 
 
-def train_project_catcher(project_id):
-    """train_project_catcher.
+async def poll(loop, executor, func, is_done, on_first_poll=None, timeout=None):
+    """poll.
+
+    Call func on the executor until is_done(result). The interval starts at
+    TRAINING_POLL_MIN_INTERVAL and grows exponentially, training and
+    exporting take minutes.
+
+    Raises:
+        asyncio.TimeoutError: not done after timeout seconds
+    """
+    interval = TRAINING_POLL_MIN_INTERVAL
+    start = loop.time()
+    while True:
+        await asyncio.sleep(interval)
+        result = await loop.run_in_executor(executor, func)
+        if on_first_poll:
+            await loop.run_in_executor(executor, on_first_poll)
+            on_first_poll = None
+        if is_done(result):
+            return result
+        if timeout is not None and loop.time() - start > timeout:
+            raise asyncio.TimeoutError
+        interval = min(interval * TRAINING_POLL_BACKOFF, TRAINING_POLL_MAX_INTERVAL)
+
+
+async def train_project_async(project_id, executor=None):
+    """train_project_async.
 
-    Dummy exception handler.
+    Blocking Django ORM and Custom Vision calls run on executor, the event
+    loop only waits.
 
     Args:
-        project_id:
+        project_id: Django ORM project id
+        executor: concurrent.futures.Executor, None for the loop default
     """
-    try:
-        train_project_worker(project_id=project_id)
-    except Exception:
-        upcreate_training_status(
+    loop = asyncio.get_event_loop()
+
+    def status_updater(**kwargs):
+        return functools.partial(
+            upcreate_training_status,
             project_id=project_id,
-            status="failed",
-            log=traceback.format_exc(),
             need_to_send_notification=True,
+            **kwargs,
         )
 
+    prepared = await loop.run_in_executor(
+        executor, functools.partial(prepare_training, project_id=project_id)
+    )
+    if prepared is None:
+        return
+    project_obj, has_new_parts, has_new_images = prepared
+    trainer = project_obj.setting.get_trainer_obj()
+    customvision_id = project_obj.customvision_id
 
-class TrainingManager:
-    """TrainingManager."""
+    # =====================================================
+    # 6. Training (Finding Iteration)                   ===
+    # =====================================================
+    logger.info("Finding Iteration")
+    try:
+        iterations = await poll(
+            loop,
+            executor,
+            functools.partial(trainer.get_iterations, customvision_id),
+            is_done=lambda iterations: len(iterations) > 0,
+            on_first_poll=status_updater(
+                **progress.PROGRESS_6_PREPARING_CUSTOM_VISION_ENV
+            ),
+            timeout=TRAINING_FIND_ITERATION_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        logger.info("Something went wrong...")
+        await loop.run_in_executor(
+            executor,
+            status_updater(
+                status="failed",
+                log="Get iteration from Custom Vision occurs error.",
+            ),
+        )
+        return
+    logger.info("Iteration Found %s", iterations[0])
 
-    def __init__(self):
-        """__init__."""
-        self.training_tasks = {}
-        self.mutex = threading.Lock()
-        self.garbage_collector()
+    # =====================================================
+    # 6. Training (Waiting)                             ===
+    # =====================================================
+    logger.info("Training")
+    iterations = await poll(
+        loop,
+        executor,
+        functools.partial(trainer.get_iterations, customvision_id),
+        is_done=lambda iterations: (
+            iterations[0].exportable and iterations[0].status == "Completed"
+        ),
+        on_first_poll=status_updater(**progress.PROGRESS_7_TRAINING),
+    )
+    iteration = iterations[0]
 
-    def add(self, project_id):
-        """add.
+    # =====================================================
+    # 7. Exporting                                      ===
+    # =====================================================
+    def get_exports():
+        exports = trainer.get_exports(customvision_id, iteration.id)
+        if len(exports) == 0 or not exports[0].download_uri:
+            res = project_obj.export_iterationv3_2(iteration.id)
+            logger.info("Export response from Custom Vision: %s", res.json())
+        return exports
+
+    await poll(
+        loop,
+        executor,
+        get_exports,
+        is_done=lambda exports: len(exports) > 0 and exports[0].download_uri,
+        on_first_poll=status_updater(**progress.PROGRESS_8_EXPORTING),
+    )
 
-        Add a project in training tasks.
-        """
-        if project_id in self.training_tasks:
-            raise ProjectAlreadyTraining
-        self.mutex.acquire()
-        task = TrainingTask(project_id=project_id)
-        self.training_tasks[project_id] = task
-        task.start()
-        self.mutex.release()
+    await loop.run_in_executor(
+        executor,
+        functools.partial(
+            save_training_result,
+            project_obj=project_obj,
+            iterations=iterations,
+            iteration=iteration,
+            has_new_parts=has_new_parts,
+            has_new_images=has_new_images,
+        ),
+    )
 
-    def get_task_by_id(self, project_id):
-        """get_task_by_id."""
 
-        self.mutex.acquire()
-        if project_id in self.training_tasks:
-            return self.training_tasks["project_id"]
-        self.mutex.release()
-        return None
+class TrainingManager:
+    """TrainingManager.
 
-    def garbage_collector(self):
-        """garbage_collector.
+    Track every in-flight training from one asyncio event loop. Polling
+    Custom Vision only holds a coroutine, blocking calls share a small
+    thread pool.
+    """
+
+    def __init__(self, max_workers=TRAINING_MAX_WORKERS):
+        """__init__."""
+        self.training_tasks = {}
+        self.mutex = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="training_worker"
+        )
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self._run_loop, name="training_manager", daemon=True
+        )
+        self.thread.start()
+
+    def _run_loop(self):
+        """_run_loop.
 
         IMPORTANT, autoreloader will not reload threading,
         please restart the server if you modify the thread.
         """
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
 
-        def _gc(self):
-            while True:
-                self.mutex.acquire()
-                if PRINT_THREAD:
-                    logger.info("tasks: %s", self.training_tasks)
-                to_delete = []
-                for project_id in self.training_tasks:
-                    if not self.training_tasks[project_id].worker.is_alive():
-                        logger.info("Project %s Training Task is finished", project_id)
-                        to_delete.append(project_id)
-
-                for project_id in to_delete:
-                    del self.training_tasks[project_id]
-
-                self.mutex.release()
-                time.sleep(3)
-
-        threading.Thread(target=_gc, args=(self,), daemon=True).start()
+    async def _train(self, project_id):
+        """_train.
 
+        Dummy exception handler.
+        """
+        try:
+            await train_project_async(project_id=project_id, executor=self.executor)
+        except Exception:
+            await self.loop.run_in_executor(
+                self.executor,
+                functools.partial(
+                    upcreate_training_status,
+                    project_id=project_id,
+                    status="failed",
+                    log=traceback.format_exc(),
+                    need_to_send_notification=True,
+                ),
+            )
 
-class TrainingTask:
-    """TrainingTask."""
+    def _remove(self, project_id, task):
+        """_remove."""
+        with self.mutex:
+            if self.training_tasks.get(project_id) is task:
+                logger.info("Project %s Training Task is finished", project_id)
+                del self.training_tasks[project_id]
+            if PRINT_THREAD:
+                logger.info("tasks: %s", self.training_tasks)
 
-    def __init__(self, project_id):
-        """__init__.
+    def add(self, project_id):
+        """add.
 
-        Args:
-            project_id: Django ORM
+        Add a project in training tasks.
         """
-        self.project_id = project_id
-        self.status = "init"
-        self.worker = None
-
-    def start(self):
-        """start."""
-        self.status = "running"
-        self.worker = threading.Thread(
-            target=train_project_catcher,
-            name=f"train_project_worker_{self.project_id}",
-            kwargs={"project_id": self.project_id},
-            daemon=True,
-        )
-        self.worker.start()
+        with self.mutex:
+            if project_id in self.training_tasks:
+                raise ProjectAlreadyTraining
+            task = asyncio.run_coroutine_threadsafe(
+                self._train(project_id=project_id), self.loop
+            )
+            self.training_tasks[project_id] = task
+        task.add_done_callback(lambda task: self._remove(project_id, task))
 
-    def __str__(self):
-        return "<Training Task " + str(self.project_id) + ">"
+    def get_task_by_id(self, project_id):
+        """get_task_by_id.
 
-    def __repr__(self):
-        return "<Training Task " + str(self.project_id) + ">"
+        Returns:
+            concurrent.futures.Future of the training, None if not training.
+        """
+        with self.mutex:
+            return self.training_tasks.get(project_id, None)
 
 
 if "runserver" in sys.argv:
@@ -21,6 +21,7 @@ from ..exceptions import (
     SettingEmptyKeyError,
 )
 from ..models import Setting
+from ..utils import TRAINER_CACHE
 from .serializers import ListProjectSerializer, SettingSerializer
 
 logger = logging.getLogger(__name__)
@@ -57,3 +58,11 @@ class SettingViewSet(viewsets.ModelViewSet):
             return Response(serializer.validated_data)
         except CustomVisionErrorException:
             raise SettingCustomVisionAccessFailed
+
+    @swagger_auto_schema(
+        operation_summary="Custom Vision trainer cache hit / miss counters.",
+    )
+    @action(detail=False, methods=["get"])
+    def trainer_cache_metrics(self, request) -> Response:
+        """trainer_cache_metrics."""
+        return Response(TRAINER_CACHE.get_metrics())
@@ -22,6 +22,7 @@ from .exceptions import (
     SettingCustomVisionAccessFailed,
     SettingCustomVisionCannotCreateProject,
 )
+from .utils import TRAINER_CACHE
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +56,11 @@ class Setting(models.Model):
         is_trainer_valid = False
         if not self.training_key or not self.endpoint:
             return is_trainer_valid
-        trainer = CustomVisionTrainingClient(self.training_key, self.endpoint)
+        # Credentials may have been revoked, do not trust a cached answer
+        TRAINER_CACHE.invalidate(
+            endpoint=self.endpoint, training_key=self.training_key, name="get_domains"
+        )
+        trainer = self.get_trainer_obj()
         try:
             trainer.get_domains()
             logger.info("Setting validate success.")
@@ -73,11 +78,14 @@ class Setting(models.Model):
     def get_trainer_obj(self) -> CustomVisionTrainingClient:
         """get_trainer_obj.
 
+        The client is shared by every setting with the same endpoint and
+        training_key, its reads are cached by TRAINER_CACHE.
+
         Returns:
             CustomVisionTrainingClient:
         """
-        return CustomVisionTrainingClient(
-            api_key=self.training_key, endpoint=self.endpoint
+        return TRAINER_CACHE.get_client(
+            endpoint=self.endpoint, training_key=self.training_key
         )
 
     def get_domain_id(
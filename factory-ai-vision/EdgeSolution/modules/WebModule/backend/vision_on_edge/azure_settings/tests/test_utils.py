@@ -0,0 +1,188 @@
+"""App utility tests.
+"""
+
+import pytest
+
+from ..utils import TrainerCache
+
+
+class StubIteration:
+    def __init__(self, iteration_id, status):
+        self.id = iteration_id
+        self.status = status
+
+
+class StubTrainingClient:
+    """Local stand-in for CustomVisionTrainingClient, counting calls."""
+
+    def __init__(self, api_key, endpoint):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.calls = []
+        self.entered = False
+        self.iteration_status = "Completed"
+
+    def __enter__(self):
+        self.entered = True
+        return self
+
+    def get_domains(self):
+        self.calls.append("get_domains")
+        return ["domain"]
+
+    def get_tags(self, project_id):
+        self.calls.append("get_tags")
+        return ["tag_" + project_id]
+
+    def get_iterations(self, project_id):
+        self.calls.append("get_iterations")
+        return [StubIteration("iteration", self.iteration_status)]
+
+    def get_iteration_performance(self, project_id, iteration_id):
+        self.calls.append("get_iteration_performance")
+        return {"precision": 1.0}
+
+    def create_tag(self, project_id, name):
+        self.calls.append("create_tag")
+        return name
+
+    def get_project(self, project_id):
+        self.calls.append("get_project")
+        return project_id
+
+
+@pytest.fixture
+def cache():
+    return TrainerCache(client_class=StubTrainingClient)
+
+
+@pytest.mark.fast
+def test_get_client(cache):
+    """test_get_client.
+
+    Type:
+        Positive
+
+    Description:
+        One keep-alive client per endpoint and training key.
+    """
+    trainer = cache.get_client(endpoint="endpoint", training_key="key")
+    assert cache.get_client(endpoint="endpoint", training_key="key") is trainer
+    assert cache.get_client(endpoint="endpoint", training_key="key_2") is not trainer
+    assert trainer.client.entered
+    assert trainer.client.api_key == "key"
+
+
+@pytest.mark.fast
+def test_cached_reads(cache):
+    """test_cached_reads.
+
+    Type:
+        Positive
+
+    Description:
+        Reads are cached by arguments, other calls go to the client.
+    """
+    trainer = cache.get_client(endpoint="endpoint", training_key="key")
+    assert trainer.get_domains() == ["domain"]
+    assert trainer.get_domains() == ["domain"]
+    assert trainer.get_tags("project_1") == ["tag_project_1"]
+    assert trainer.get_tags(project_id="project_1") == ["tag_project_1"]
+    assert trainer.get_tags("project_1") == ["tag_project_1"]
+    assert trainer.get_iteration_performance("project_1", "iteration") == {
+        "precision": 1.0
+    }
+    assert trainer.get_iteration_performance("project_1", "iteration") == {
+        "precision": 1.0
+    }
+    trainer.get_project("project_1")
+    trainer.get_project("project_1")
+
+    assert trainer.client.calls == [
+        "get_domains",
+        "get_tags",
+        "get_tags",
+        "get_iteration_performance",
+        "get_project",
+        "get_project",
+    ]
+    counters = cache.get_metrics()["counters"]
+    assert counters["get_domains"] == {"hit": 1, "miss": 1, "invalidated": 0}
+    assert counters["get_tags"] == {"hit": 1, "miss": 2, "invalidated": 0}
+
+
+@pytest.mark.fast
+def test_iterations_training_not_cached(cache):
+    """test_iterations_training_not_cached.
+
+    Type:
+        Positive
+
+    Description:
+        Iterations are only cached once no iteration is training.
+    """
+    trainer = cache.get_client(endpoint="endpoint", training_key="key")
+    trainer.client.iteration_status = "Training"
+    trainer.get_iterations("project_1")
+    trainer.get_iterations("project_1")
+    assert trainer.client.calls.count("get_iterations") == 2
+
+    trainer.client.iteration_status = "Completed"
+    trainer.get_iterations("project_1")
+    trainer.get_iterations("project_1")
+    assert trainer.client.calls.count("get_iterations") == 3
+
+
+@pytest.mark.fast
+def test_invalidate(cache):
+    """test_invalidate.
+
+    Type:
+        Positive
+
+    Description:
+        Mutations and explicit invalidation drop the reads of a project.
+    """
+    trainer = cache.get_client(endpoint="endpoint", training_key="key")
+    trainer.get_domains()
+    trainer.get_tags("project_1")
+    trainer.get_tags("project_2")
+
+    trainer.create_tag("project_1", name="new_tag")
+    trainer.get_tags("project_1")
+    trainer.get_tags("project_2")
+    assert trainer.client.calls.count("get_tags") == 3
+
+    cache.invalidate(project_id="project_2")
+    trainer.get_tags("project_2")
+    trainer.get_domains()
+    assert trainer.client.calls.count("get_tags") == 4
+    assert trainer.client.calls.count("get_domains") == 1
+
+    cache.invalidate(name="get_domains")
+    trainer.get_domains()
+    trainer.get_tags("project_1")
+    assert trainer.client.calls.count("get_domains") == 2
+    assert trainer.client.calls.count("get_tags") == 4
+
+    cache.invalidate()
+    trainer.get_domains()
+    assert trainer.client.calls.count("get_domains") == 3
+    assert cache.get_metrics()["counters"]["get_tags"]["invalidated"] == 4
+
+
+@pytest.mark.fast
+def test_ttl(cache):
+    """test_ttl.
+
+    Type:
+        Positive
+
+    Description:
+        Expired reads are fetched again.
+    """
+    cache.ttl["get_tags"] = 0
+    trainer = cache.get_client(endpoint="endpoint", training_key="key")
+    trainer.get_tags("project_1")
+    trainer.get_tags("project_1")
+    assert trainer.client.calls.count("get_tags") == 2
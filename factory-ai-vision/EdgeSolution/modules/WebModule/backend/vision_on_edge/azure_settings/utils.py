@@ -0,0 +1,189 @@
+"""App utilities.
+"""
+
+import functools
+import logging
+import threading
+import time
+
+from azure.cognitiveservices.vision.customvision.training import (
+    CustomVisionTrainingClient,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds a Custom Vision read is cached, by method
+TRAINER_CACHE_TTL = {
+    "get_domains": 3600,
+    "get_tags": 60,
+    "get_iterations": 10,
+    "get_iteration_performance": 3600,
+}
+# Methods changing a project, the cache of that project is invalidated
+TRAINER_MUTATION_PREFIXES = (
+    "create_",
+    "delete_",
+    "update_",
+    "train_",
+    "publish_",
+    "unpublish_",
+    "export_",
+    "quick_",
+)
+ITERATION_SETTLED_STATUSES = ("Completed", "Failed")
+
+
+def _is_settled(method_name, result):
+    """Iterations still training are not cached, callers poll them."""
+    if method_name != "get_iterations":
+        return True
+    return all(
+        getattr(iteration, "status", None) in ITERATION_SETTLED_STATUSES
+        for iteration in result
+    )
+
+
+def _get_project_id(args, kwargs):
+    if "project_id" in kwargs:
+        return kwargs["project_id"]
+    if args:
+        return args[0]
+    return None
+
+
+class CachedTrainingClient:
+    """CachedTrainingClient
+
+    CustomVisionTrainingClient proxy. Reads in TRAINER_CACHE_TTL are served
+    by the TrainerCache, mutations invalidate the cache of their project,
+    everything else goes to the client.
+    """
+
+    def __init__(self, client, cache, credentials):
+        self.client = client
+        self.cache = cache
+        self.credentials = credentials
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        if name in self.cache.ttl:
+            return functools.partial(self.cache.call, self.credentials, name, attr)
+        if name.startswith(TRAINER_MUTATION_PREFIXES):
+            return functools.partial(self._mutate, name, attr)
+        return attr
+
+    def _mutate(self, _name, _method, *args, **kwargs):
+        # Underscored, Custom Vision methods take a "name" argument
+        try:
+            return _method(*args, **kwargs)
+        finally:
+            project_id = _get_project_id(args, kwargs)
+            if _name == "create_project":
+                project_id = None
+            self.cache.invalidate(
+                endpoint=self.credentials[0],
+                training_key=self.credentials[1],
+                project_id=project_id,
+            )
+
+
+class TrainerCache:
+    """TrainerCache
+
+    One keep-alive CustomVisionTrainingClient per (endpoint, training_key),
+    and a TTL cache of its reads.
+
+    Args:
+        ttl (dict): seconds by cached method
+        client_class: training client class
+    """
+
+    def __init__(self, ttl=None, client_class=CustomVisionTrainingClient):
+        self.ttl = dict(TRAINER_CACHE_TTL if ttl is None else ttl)
+        self.client_class = client_class
+        self.mutex = threading.Lock()
+        self.clients = {}
+        # (endpoint, training_key, method, args, kwargs) => (expire time, result)
+        self.entries = {}
+        self.counters = {}
+
+    def get_client(self, endpoint: str, training_key: str) -> CachedTrainingClient:
+        """get_client."""
+        credentials = (endpoint, training_key)
+        with self.mutex:
+            if credentials not in self.clients:
+                client = self.client_class(api_key=training_key, endpoint=endpoint)
+                # Keep the requests session, connections are pooled
+                if hasattr(client, "__enter__"):
+                    client.__enter__()
+                self.clients[credentials] = CachedTrainingClient(
+                    client=client, cache=self, credentials=credentials
+                )
+            return self.clients[credentials]
+
+    def _count(self, name, key):
+        if name not in self.counters:
+            self.counters[name] = {"hit": 0, "miss": 0, "invalidated": 0}
+        self.counters[name][key] += 1
+
+    def call(self, _credentials, _name, _method, *args, **kwargs):
+        """call a cached read."""
+        key = _credentials + (_name, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return _method(*args, **kwargs)
+        with self.mutex:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._count(_name, "hit")
+                return entry[1]
+            self._count(_name, "miss")
+
+        result = _method(*args, **kwargs)
+        if _is_settled(_name, result):
+            with self.mutex:
+                self.entries[key] = (time.time() + self.ttl[_name], result)
+        return result
+
+    def invalidate(self, endpoint=None, training_key=None, project_id=None, name=None):
+        """invalidate.
+
+        Drop the cached reads matching every given argument, everything if
+        none is given.
+
+        Args:
+            endpoint (str): endpoint
+            training_key (str): training_key
+            project_id (str): Custom Vision project id, domains are kept
+            name (str): cached method name
+        """
+        with self.mutex:
+            for key in list(self.entries):
+                key_endpoint, key_training_key, key_name, args, kwargs = key
+                if endpoint is not None and endpoint != key_endpoint:
+                    continue
+                if training_key is not None and training_key != key_training_key:
+                    continue
+                if name is not None and name != key_name:
+                    continue
+                if project_id is not None and (
+                    project_id != _get_project_id(args, dict(kwargs))
+                ):
+                    continue
+                del self.entries[key]
+                self._count(key_name, "invalidated")
+
+    def get_metrics(self):
+        """get_metrics."""
+        with self.mutex:
+            return {
+                "clients": len(self.clients),
+                "entries": len(self.entries),
+                "counters": {name: dict(c) for name, c in self.counters.items()},
+            }
+
+
+TRAINER_CACHE = TrainerCache()
@@ -0,0 +1,44 @@
+"""App utility tests.
+"""
+
+import threading
+
+import pytest
+
+from ..utils import TrainingStatusEvents
+
+
+@pytest.mark.fast
+def test_training_status_events_wait():
+    """test_training_status_events_wait.
+
+    Type:
+        Positive
+
+    Description:
+        A waiter is woken up by a newer event.
+    """
+    events = TrainingStatusEvents()
+    version = events.get_version(1)
+    assert version == 0
+
+    threading.Timer(0.05, events.publish, args=(1, "training", "Training")).start()
+    assert events.wait(1, version, timeout=5) == (1, "training", "Training")
+
+
+@pytest.mark.fast
+def test_training_status_events_timeout():
+    """test_training_status_events_timeout.
+
+    Type:
+        Negative
+
+    Description:
+        Events of other projects or already seen events don't wake up.
+    """
+    events = TrainingStatusEvents()
+    events.publish(1, "ok", "Ok")
+    events.publish(2, "training", "Training")
+
+    assert events.wait(1, 1, timeout=0.01) is None
+    assert events.wait(3, 0, timeout=0.01) is None
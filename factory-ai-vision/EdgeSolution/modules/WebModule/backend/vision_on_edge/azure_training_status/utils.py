@@ -2,12 +2,61 @@
 """
 
 import logging
+import threading
 
 from .models import TrainingStatus
 
 logger = logging.getLogger(__name__)
 
 
+class TrainingStatusEvents:
+    """In-process training status change notifications.
+
+    upcreate_training_status publishes every change, so waiters in this
+    process don't need to poll TrainingStatus.
+    """
+
+    def __init__(self):
+        """__init__."""
+        self.condition = threading.Condition()
+        self.events = {}
+
+    def get_version(self, project_id) -> int:
+        """get_version.
+
+        Version of the latest event of a project, 0 if none.
+        """
+        with self.condition:
+            return self.events.get(project_id, (0, None, None))[0]
+
+    def publish(self, project_id, status: str, log: str):
+        """publish."""
+        with self.condition:
+            version = self.events.get(project_id, (0, None, None))[0] + 1
+            self.events[project_id] = (version, status, log)
+            self.condition.notify_all()
+
+    def wait(self, project_id, version: int, timeout=None):
+        """wait.
+
+        Wait for an event newer than version.
+
+        Returns:
+            (version, status, log), None on timeout.
+        """
+        with self.condition:
+            is_new = self.condition.wait_for(
+                lambda: self.events.get(project_id, (0, None, None))[0] > version,
+                timeout=timeout,
+            )
+            if not is_new:
+                return None
+            return self.events[project_id]
+
+
+TRAINING_STATUS_EVENTS = TrainingStatusEvents()
+
+
 def upcreate_training_status(
     project_id,
     status: str,
@@ -45,6 +94,11 @@ def upcreate_training_status(
     training_status_object.performance = performance
     training_status_object.need_to_send_notification = need_to_send_notification
     training_status_object.save()
+    TRAINING_STATUS_EVENTS.publish(
+        project_id=project_id,
+        status=training_status_object.status,
+        log=training_status_object.log,
+    )
 
 
 # def training_status_failed(project_id,
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.8 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0004_image_manual_checked"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["project", "part", "is_relabel", "timestamp"],
+                name="image_relabel_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["part", "manual_checked", "uploaded"],
+                name="image_upload_idx",
+            ),
+        ),
+    ]
@@ -39,6 +39,20 @@ class Image(models.Model):
     remote_url = models.CharField(max_length=1000, null=True)
     timestamp = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Relabel images of a part, oldest first
+            models.Index(
+                fields=["project", "part", "is_relabel", "timestamp"],
+                name="image_relabel_idx",
+            ),
+            # Images waiting for upload
+            models.Index(
+                fields=["part", "manual_checked", "uploaded"],
+                name="image_upload_idx",
+            ),
+        ]
+
     def get_remote_image(self):
         """get_remote_image.
 
@@ -68,33 +82,59 @@ class Image(models.Model):
             height (float): height
         """
         logger.info("Setting Image labels")
+        with PILImage.open(self.image) as img:
+            size_width, size_height = img.size
+        logger.info("Setting labels. Image size %s", self.image)
+        label = self.region_to_label(
+            left=left,
+            top=top,
+            width=width,
+            height=height,
+            size_width=size_width,
+            size_height=size_height,
+        )
+        if label is None:
+            return
+        self.labels = json.dumps([label])
+        self.save()
+        logger.info("Set image labels success %s", self.labels)
+
+    @staticmethod
+    def region_to_label(
+        left: float,
+        top: float,
+        width: float,
+        height: float,
+        size_width: int,
+        size_height: int,
+    ):
+        """region_to_label.
+
+        Convert a Custom Vision region (relative) to a label (pixels).
+
+        Returns:
+            {"x1", "y1", "x2", "y2"}, None if the region is out of range.
+        """
         if left > 1 or top > 1 or width > 1 or height > 1:
             logger.error("%s, %s, %s, %s must be less than 1", left, top, width, height)
-            return
+            return None
         if left < 0 or top < 0 or width < 0 or height < 0:
             logger.error(
                 "%s, %s, %s, %s must be greater than 0", left, top, width, height
             )
-            return
+            return None
         if left + width > 1:
             logger.error("left + width: %s + %s must be less than 1", left, width)
-            return
+            return None
         if top + height > 1:
             logger.error("top + height: %s + %s must be less than 1", top, height)
-            return
-
-        with PILImage.open(self.image) as img:
-            size_width, size_height = img.size
-            logger.info("Setting labels. Image size %s", self.image)
-            label_x1 = int(size_width * left)
-            label_y1 = int(size_height * top)
-            label_x2 = int(size_width * (left + width))
-            label_y2 = int(size_height * (top + height))
-            self.labels = json.dumps(
-                [{"x1": label_x1, "y1": label_y1, "x2": label_x2, "y2": label_y2}]
-            )
-            self.save()
-            logger.info("Set image labels success %s", self.labels)
+            return None
+        return {
+            "x1": int(size_width * left),
+            "y1": int(size_height * top),
+            "x2": int(size_width * (left + width)),
+            "y2": int(size_height * (top + height)),
+        }
 
     @staticmethod
     def pre_save(**kwargs):
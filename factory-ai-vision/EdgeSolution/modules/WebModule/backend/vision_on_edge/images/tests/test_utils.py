@@ -0,0 +1,161 @@
+"""App utility tests.
+"""
+
+import io
+import json
+import threading
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage
+
+from ...azure_parts.models import Part
+from ...azure_settings.models import Setting
+from ..models import Image
+from ..utils import upload_images_to_customvision
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeCreatedImage:
+    def __init__(self, image_id):
+        self.id = image_id
+        self.original_image_uri = "https://fake/" + image_id
+
+
+class FakeImageResult:
+    def __init__(self, image_id):
+        self.status = "OK"
+        self.image = FakeCreatedImage(image_id)
+
+
+class FakeUploadResult:
+    def __init__(self, images):
+        self.images = images
+        self.is_batch_successful = all(image.image for image in images)
+
+
+class FakeTrainer:
+    """Fake CustomVisionTrainingClient.create_images_from_files."""
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.batches = []
+        self.counter = 0
+
+    def create_images_from_files(self, project_id, images):
+        results = []
+        with self.mutex:
+            self.batches.append(len(images))
+            for _ in images:
+                self.counter += 1
+                results.append(FakeImageResult("cv_" + str(self.counter)))
+        return FakeUploadResult(results)
+
+
+def create_images(project, part, n, labeled=True, uploaded=False):
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (40, 30)).save(buffer, format="PNG")
+    labels = [{"x1": 1, "y1": 2, "x2": 20, "y2": 15}] if labeled else []
+    images = []
+    for _ in range(n):
+        image = Image(
+            project=project,
+            part=part,
+            labels=json.dumps(labels),
+            manual_checked=True,
+            uploaded=uploaded,
+        )
+        image.image.save("test.png", ContentFile(buffer.getvalue()), save=False)
+        image.save()
+        images.append(image)
+    return images
+
+
+@pytest.fixture
+def trainer(monkeypatch):
+    trainer = FakeTrainer()
+    monkeypatch.setattr(Setting, "get_trainer_obj", mock.MagicMock(return_value=trainer))
+    return trainer
+
+
+@pytest.fixture
+def parts(project):
+    return [
+        Part.objects.create(project=project, name="part_" + str(i)) for i in range(3)
+    ]
+
+
+def test_upload_images_to_customvision(project, parts, trainer):
+    """test_upload_images_to_customvision.
+
+    Type:
+        Positive
+
+    Description:
+        Images of every part are uploaded in batches and marked uploaded.
+    """
+    for part in parts:
+        create_images(project, part, 30)
+    create_images(project, parts[0], 5, labeled=False)
+
+    assert upload_images_to_customvision(project_id=project.id, batch_size=16)
+
+    assert sum(trainer.batches) == 90
+    assert max(trainer.batches) <= 16
+    uploaded = Image.objects.filter(uploaded=True)
+    assert uploaded.count() == 90
+    assert len(set(uploaded.values_list("customvision_id", flat=True))) == 90
+    assert all(
+        image.remote_url == "https://fake/" + image.customvision_id
+        for image in uploaded
+    )
+    # Images without labels are not uploaded
+    assert Image.objects.filter(uploaded=False).count() == 5
+
+
+def test_upload_images_to_customvision_resume(project, parts, trainer):
+    """test_upload_images_to_customvision_resume.
+
+    Type:
+        Positive
+
+    Description:
+        Only images left with uploaded=False are uploaded again.
+    """
+    create_images(project, parts[0], 10, uploaded=True)
+    create_images(project, parts[1], 7)
+
+    assert upload_images_to_customvision(project_id=project.id)
+    assert trainer.batches == [7]
+    assert not upload_images_to_customvision(project_id=project.id)
+    assert trainer.batches == [7]
+
+
+def test_upload_images_to_customvision_batch_error(project, parts, trainer):
+    """test_upload_images_to_customvision_batch_error.
+
+    Type:
+        Negative
+
+    Description:
+        Finished batches are saved even if another batch fails.
+    """
+    create_images(project, parts[0], 20)
+    calls = []
+
+    def create_images_from_files(project_id, images):
+        calls.append(len(images))
+        if len(calls) == 2:
+            raise ValueError("Custom Vision error")
+        return FakeTrainer.create_images_from_files(trainer, project_id, images)
+
+    trainer.create_images_from_files = create_images_from_files
+
+    with pytest.raises(ValueError):
+        upload_images_to_customvision(
+            project_id=project.id, batch_size=5, max_workers=1
+        )
+    assert Image.objects.filter(uploaded=True).count() == 15
+    assert Image.objects.filter(uploaded=False).count() == 5
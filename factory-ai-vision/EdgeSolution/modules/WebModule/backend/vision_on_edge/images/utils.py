@@ -4,122 +4,299 @@
 import datetime
 import json
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 
+import requests
 from azure.cognitiveservices.vision.customvision.training.models import (
     ImageFileCreateEntry,
     Region,
 )
+from requests.adapters import HTTPAdapter
+from rest_framework import status
 
 from vision_on_edge.azure_parts.models import Part
 from vision_on_edge.azure_projects.models import Project
 
+from .exceptions import ImageGetRemoteImageRequestsError
 from .models import Image
 
 logger = logging.getLogger(__name__)
 
+# Max images per create_images_from_files request
+CUSTOMVISION_MAX_IMAGE_BATCH = 64
+IMAGE_UPLOAD_WORKERS = 4
+IMAGE_DOWNLOAD_WORKERS = 8
+IMAGE_DOWNLOAD_TIMEOUT = 30  # seconds
 
-def upload_images_to_customvision_helper(
-    project_id, part_id, batch_size: int = 10
-) -> bool:
-    """upload_images_to_customvision_helper.
 
-    Helper function for uploading images to Custom Vision.
-    Make sure part already upload to Custom Vision (
-    customvision_id not null or blank).
+def create_image_entry(image_obj, tag_id):
+    """create_image_entry.
 
-    Args:
-        project_id:
-        part_id:
-        batch_size (int): batch_size
+    Read an image and its labels.
 
     Returns:
-        bool:
+        ImageFileCreateEntry, None if the image has no label.
     """
+    img_name = "img-" + datetime.datetime.utcnow().isoformat()
 
-    logger.info("Uploading images with part_id %s", part_id)
+    regions = []
+    width = image_obj.image.width
+    height = image_obj.image.height
+    labels = json.loads(image_obj.labels)
+    if len(labels) == 0:
+        return None
+    for label in labels:
+        label_x = label["x1"] / width
+        label_y = label["y1"] / height
+        label_w = (label["x2"] - label["x1"]) / width
+        label_h = (label["y2"] - label["y1"]) / height
+        region = Region(
+            tag_id=tag_id, left=label_x, top=label_y, width=label_w, height=label_h
+        )
+        regions.append(region)
 
-    has_new_images = False
-    project_obj = Project.objects.get(pk=project_id)
-    trainer = project_obj.setting.get_trainer_obj()
-    part_obj: Part = Part.objects.get(pk=part_id)
-    tag_id = part_obj.customvision_id
-    images = Image.objects.filter(part_id=part_id, manual_checked=True, uploaded=False)
-    logger.info("Tag id %s", tag_id)
-    count = 0
-    img_entries = []
-    img_objs = []
+    image = image_obj.image
+    image.open()
+    try:
+        contents = image.read()
+    finally:
+        image.close()
+    return ImageFileCreateEntry(name=img_name, contents=contents, regions=regions)
 
-    logger.info("Image length: %s", len(images))
 
-    for index, image_obj in enumerate(images):
-        logger.info("*** image %s, %s", index + 1, image_obj)
-        has_new_images = True
+def get_download_session(pool_size: int = IMAGE_DOWNLOAD_WORKERS):
+    """get_download_session.
+
+    Keep-alive session with one pooled connection per download worker.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_remote_image(session, url: str) -> bytes:
+    """download_remote_image.
+
+    Raises:
+        ImageGetRemoteImageRequestsError
+    """
+    try:
+        resp = session.get(url, timeout=IMAGE_DOWNLOAD_TIMEOUT)
+    except Exception:
+        raise ImageGetRemoteImageRequestsError(detail=("url: " + url))
+    if resp.status_code != status.HTTP_200_OK:
+        raise ImageGetRemoteImageRequestsError(detail=("url: " + url))
+    return resp.content
+
 
-        img_name = "img-" + datetime.datetime.utcnow().isoformat()
+def download_remote_images(urls, session, max_workers: int = IMAGE_DOWNLOAD_WORKERS):
+    """download_remote_images.
 
-        regions = []
-        width = image_obj.image.width
-        height = image_obj.image.height
+    Download urls on up to max_workers threads.
+
+    Returns:
+        list of contents in the order of urls, None for failed downloads.
+    """
+
+    def _download(url):
         try:
-            labels = json.loads(image_obj.labels)
-            if len(labels) == 0:
-                continue
-            for label in labels:
-                label_x = label["x1"] / width
-                label_y = label["y1"] / height
-                label_w = (label["x2"] - label["x1"]) / width
-                label_h = (label["y2"] - label["y1"]) / height
-                region = Region(
-                    tag_id=tag_id,
-                    left=label_x,
-                    top=label_y,
-                    width=label_w,
-                    height=label_h,
-                )
-                regions.append(region)
+            return download_remote_image(session, url)
+        except ImageGetRemoteImageRequestsError:
+            logger.exception("Download remote image occur exception.")
+            return None
 
-            image = image_obj.image
-            image.open()
-            img_entry = ImageFileCreateEntry(
-                name=img_name, contents=image.read(), regions=regions
-            )
-            img_objs.append(image_obj)
-            img_entries.append(img_entry)
-            count += 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_download, urls))
+
+
+def upload_image_batch(trainer, customvision_project_id, image_objs, tags_dict):
+    """upload_image_batch.
+
+    Read and upload a batch of images. Run on upload workers, no ORM here.
+
+    Args:
+        trainer: Custom Vision training client
+        customvision_project_id: Custom Vision project id
+        image_objs: Image objects
+        tags_dict: {part_id: Custom Vision tag id}
+
+    Returns:
+        Image objects uploaded, customvision_id and remote_url set.
+    """
+    img_entries = []
+    img_objs = []
+    for image_obj in image_objs:
+        logger.info("*** image %s", image_obj)
+        try:
+            img_entry = create_image_entry(image_obj, tags_dict[image_obj.part_id])
         except:
             logger.exception("unexpected error")
+            continue
+        if img_entry is None:
+            continue
+        img_objs.append(image_obj)
+        img_entries.append(img_entry)
 
-        if len(img_entries) >= batch_size:
-            logger.info("Uploading %s images", len(img_entries))
-            upload_result = trainer.create_images_from_files(
-                project_id=project_obj.customvision_id, images=img_entries
-            )
-            logger.info(
-                "Uploading images... Is batch success: %s",
-                upload_result.is_batch_successful,
+    if len(img_entries) == 0:
+        return []
+
+    logger.info("Uploading %s images", len(img_entries))
+    upload_result = trainer.create_images_from_files(
+        project_id=customvision_project_id, images=img_entries
+    )
+    logger.info(
+        "Uploading images... Is batch success: %s", upload_result.is_batch_successful
+    )
+
+    uploaded_objs = []
+    for img_obj, result in zip(img_objs, upload_result.images):
+        if result.image is None:
+            logger.warning("Upload image %s failed: %s", img_obj, result.status)
+            continue
+        img_obj.customvision_id = result.image.id
+        img_obj.remote_url = result.image.original_image_uri
+        img_obj.uploaded = True
+        uploaded_objs.append(img_obj)
+    return uploaded_objs
+
+
+def upload_image_batches(
+    trainer, customvision_project_id, batches, tags_dict, max_workers, on_uploaded
+):
+    """upload_image_batches.
+
+    Keep up to max_workers batches in flight. Only those batches are read in
+    memory.
+
+    Args:
+        batches: iterable of lists of Image objects
+        on_uploaded: called in the caller thread with the uploaded Image
+            objects of every finished batch.
+
+    Raises:
+        The first error of a batch, after every other batch is finished.
+    """
+    errors = []
+
+    def _collect(futures):
+        for future in futures:
+            try:
+                uploaded_objs = future.result()
+            except Exception as error:
+                logger.exception("Upload image batch failed")
+                errors.append(error)
+                continue
+            if uploaded_objs:
+                on_uploaded(uploaded_objs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+        for batch in batches:
+            if len(in_flight) >= max_workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                _collect(done)
+            in_flight.add(
+                executor.submit(
+                    upload_image_batch,
+                    trainer,
+                    customvision_project_id,
+                    batch,
+                    tags_dict,
+                )
             )
-            img_entries = []
-            for i, img_obj in enumerate(img_objs):
-                img_obj.customvision_id = upload_result.images[i].image.id
-                img_obj.uploaded = True
-                img_obj.save()
-            img_objs = []
-
-    if len(img_entries) >= 1:
-        logger.info("Uploading %s images", len(img_entries))
-        upload_result = trainer.create_images_from_files(
-            project_id=project_obj.customvision_id, images=img_entries
-        )
-        logger.info(
-            "Uploading images... Is batch success: %s",
-            upload_result.is_batch_successful,
+        _collect(as_completed(in_flight))
+
+    if errors:
+        raise errors[0]
+
+
+def upload_images_to_customvision(
+    project_id,
+    part_ids=None,
+    batch_size: int = CUSTOMVISION_MAX_IMAGE_BATCH,
+    max_workers: int = IMAGE_UPLOAD_WORKERS,
+) -> bool:
+    """upload_images_to_customvision.
+
+    Upload the checked images of a project that are not uploaded yet.
+    Make sure parts already upload to Custom Vision (
+    customvision_id not null or blank).
+
+    Images are marked uploaded batch by batch, so an interrupted upload
+    resumes from the images left with uploaded=False.
+
+    Args:
+        project_id:
+        part_ids: parts to upload, all parts of the project if None
+        batch_size (int): images per request, at most 64 on Custom Vision
+        max_workers (int): batches in flight
+
+    Returns:
+        bool: has new images
+    """
+    project_obj = Project.objects.get(pk=project_id)
+    trainer = project_obj.setting.get_trainer_obj()
+    if part_ids is None:
+        parts = Part.objects.filter(project_id=project_id)
+    else:
+        parts = Part.objects.filter(pk__in=part_ids)
+    tags_dict = {part.id: part.customvision_id for part in parts}
+    logger.info("Tags %s", tags_dict)
+
+    # Rows only, images are read by the upload workers
+    images = list(
+        Image.objects.filter(
+            part_id__in=tags_dict.keys(), manual_checked=True, uploaded=False
+        ).order_by("part_id", "id")
+    )
+    logger.info("Image length: %s", len(images))
+    if len(images) == 0:
+        return False
+
+    batch_size = min(batch_size, CUSTOMVISION_MAX_IMAGE_BATCH)
+    batches = (
+        images[index : index + batch_size]
+        for index in range(0, len(images), batch_size)
+    )
+
+    def _save(uploaded_objs):
+        Image.objects.bulk_update(
+            uploaded_objs, ["customvision_id", "remote_url", "uploaded"]
         )
-        for i, img_obj in enumerate(img_objs):
-            img_obj.customvision_id = upload_result.images[i].image.id
-            img_obj.remote_url = upload_result.images[i].image.original_image_uri
-            img_obj.uploaded = True
-            img_obj.save()
+
+    upload_image_batches(
+        trainer=trainer,
+        customvision_project_id=project_obj.customvision_id,
+        batches=batches,
+        tags_dict=tags_dict,
+        max_workers=max_workers,
+        on_uploaded=_save,
+    )
     logger.info("Uploading images... Done")
+    return True
+
+
+def upload_images_to_customvision_helper(
+    project_id, part_id, batch_size: int = CUSTOMVISION_MAX_IMAGE_BATCH
+) -> bool:
+    """upload_images_to_customvision_helper.
+
+    Upload images of one part, see upload_images_to_customvision.
+
+    Args:
+        project_id:
+        part_id:
+        batch_size (int): batch_size
+
+    Returns:
+        bool:
+    """
+    logger.info("Uploading images with part_id %s", part_id)
+    has_new_images = upload_images_to_customvision(
+        project_id=project_id, part_ids=[part_id], batch_size=batch_size
+    )
     logger.info("Has new images: %s", has_new_images)
     return has_new_images
 
@@ -41,3 +41,8 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         """websocket send"""
         logger.info("notification_send!")
         await self.send_json(event)
+
+    async def notification_batch(self, event):
+        """websocket send notifications saved together"""
+        logger.info("notification_batch %s", len(event["notifications"]))
+        await self.send_json(event)
@@ -3,14 +3,13 @@
 
 import logging
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 
 from ..azure_pd_deploy_status.models import DeployStatus
 from ..azure_training_status.models import TrainingStatus
 from .models import Notification
+from .utils import NOTIFICATION_DISPATCHER
 
 logger = logging.getLogger(__name__)
 
@@ -20,29 +19,15 @@ def notification_post_save_websocket_handler(**kwargs):
     """notification_post_save_websocket_handler.
 
     When there is a notification been save, push to channel
-    layer to send to websocket.
+    layer to send to websocket. Notifications saved together are sent in
+    one frame.
 
     Args:
         kwargs:
     """
 
     logger.info("notification_post_save...")
-    logger.info("Sending notifications...")
-
-    instance = kwargs["instance"]
-    channels_layer = get_channel_layer()
-    async_to_sync(channels_layer.group_send)(
-        "notification",
-        {
-            "id": instance.id,
-            "type": "notification.send",
-            "notification_type": instance.notification_type,
-            "timestamp": str(instance.timestamp),
-            "sender": instance.sender,
-            "title": instance.title,
-            "details": instance.details,
-        },
-    )
+    NOTIFICATION_DISPATCHER.push(kwargs["instance"])
 
 
 # @receiver(signal=pre_save,
@@ -83,11 +68,12 @@ def training_status_listener(**kwargs):
         logger.info(
             "instance.need_to_send_notification %s", instance.need_to_send_notification
         )
-        Notification.objects.create(
+        NOTIFICATION_DISPATCHER.notify(
             notification_type="project",
             sender="system",
             title=instance.status.capitalize(),
             details=instance.log.capitalize(),
+            key=instance.project_id,
         )
     logger.info("Signal end")
 
@@ -108,9 +94,10 @@ def deploy_status_listener(**kwargs):
         logger.info(
             "instance.need_to_send_notification %s", instance.need_to_send_notification
         )
-        Notification.objects.create(
+        NOTIFICATION_DISPATCHER.notify(
             notification_type="part_detection",
             sender="system",
             title=instance.status.capitalize(),
             details=instance.log.capitalize(),
+            key=instance.part_detection_id,
         )
@@ -3,6 +3,7 @@
 
 import pytest
 
+from vision_on_edge.notifications import signals, utils
 from vision_on_edge.notifications.models import Notification
 from vision_on_edge.notifications.tests.factories import NotificationFactory
 
@@ -17,3 +18,15 @@ def notification() -> Notification:
         Notification:
     """
     return NotificationFactory()
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    """A dispatcher without thread, frames sent are collected in
+    dispatcher.frames."""
+    dispatcher = utils.NotificationDispatcher()
+    dispatcher.frames = []
+    monkeypatch.setattr(dispatcher, "start", lambda: None)
+    monkeypatch.setattr(dispatcher, "send", dispatcher.frames.append)
+    monkeypatch.setattr(signals, "NOTIFICATION_DISPATCHER", dispatcher)
+    return dispatcher
@@ -0,0 +1,72 @@
+"""App utility tests.
+"""
+
+import pytest
+
+from ...azure_training_status.models import TrainingStatus
+from ...azure_training_status.utils import upcreate_training_status
+from ..models import Notification
+from .factories import NotificationFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_notification_dispatcher(dispatcher, project):
+    """test_notification_dispatcher.
+
+    Type:
+        Positive
+
+    Description:
+        Notifications of a source are merged, and pushed in one frame.
+    """
+    TrainingStatus.objects.update_or_create(project=project)
+    for status in ["preparing", "training", "exporting", "ok"]:
+        upcreate_training_status(
+            project_id=project.id,
+            status=status,
+            log=status,
+            need_to_send_notification=True,
+        )
+    dispatcher.notify(notification_type="part_detection", title="Ok", key=1)
+    assert not Notification.objects.exists()
+
+    dispatcher.flush()
+
+    assert sorted(Notification.objects.values_list("title", flat=True)) == [
+        "Ok",
+        "Ok",
+    ]
+    assert len(dispatcher.frames) == 1
+    assert [n["notification_type"] for n in dispatcher.frames[0]] == [
+        "project",
+        "part_detection",
+    ]
+    metrics = dispatcher.get_metrics()
+    assert metrics["requested"] == 5
+    assert metrics["coalesced"] == 3
+    assert metrics["written"] == 2
+    assert metrics["pending"] == 0
+
+
+def test_notification_dispatcher_prune(dispatcher):
+    """test_notification_dispatcher_prune.
+
+    Type:
+        Positive
+
+    Description:
+        Only the newest max_rows notifications are kept.
+    """
+    dispatcher.max_rows = 3
+    for _ in range(5):
+        NotificationFactory()
+    dispatcher.notify(notification_type="project", title="newest")
+    dispatcher.flush()
+
+    assert Notification.objects.count() == 3
+    assert Notification.objects.order_by("-id").first().title == "newest"
+    assert dispatcher.get_metrics()["pruned"] == 3
+    # Every saved notification is pushed, in one frame
+    assert len(dispatcher.frames) == 1
+    assert len(dispatcher.frames[0]) == 6
@@ -0,0 +1,194 @@
+"""App utilities.
+"""
+
+import logging
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import close_old_connections, transaction
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Notifications of the same source within that window are merged, the
+# latest wins, and pushed to the websockets in one frame.
+NOTIFICATION_COALESCE_WINDOW = 1  # seconds
+# Older notifications are deleted
+NOTIFICATION_MAX_ROWS = 100
+NOTIFICATION_GROUP = "notification"
+
+
+def serialize_notification(instance: Notification) -> dict:
+    """serialize_notification."""
+    return {
+        "id": instance.id,
+        "notification_type": instance.notification_type,
+        "timestamp": str(instance.timestamp),
+        "sender": instance.sender,
+        "title": instance.title,
+        "details": instance.details,
+    }
+
+
+class NotificationDispatcher:
+    """NotificationDispatcher
+
+    Write and push notifications on a background thread. Notifications of
+    the same (notification_type, sender, key) within the window are merged,
+    written in one transaction and pushed to NotificationConsumer as one
+    "notification.batch" frame. Notifications above max_rows are pruned with
+    one delete.
+
+    Args:
+        window (float): seconds to wait for more notifications
+        max_rows (int): notifications kept
+    """
+
+    def __init__(
+        self,
+        window: float = NOTIFICATION_COALESCE_WINDOW,
+        max_rows: int = NOTIFICATION_MAX_ROWS,
+    ):
+        self.window = window
+        self.max_rows = max_rows
+        self.mutex = threading.Lock()
+        self.wakeup = threading.Event()
+        # (notification_type, sender, key) => fields of the latest notification
+        self.pending = {}
+        # Notifications saved, not pushed yet
+        self.outgoing = []
+        self.counters = {
+            "requested": 0,
+            "coalesced": 0,
+            "written": 0,
+            "pruned": 0,
+            "pushed": 0,
+            "frames": 0,
+            "failed": 0,
+        }
+        self.worker = None
+
+    def notify(
+        self,
+        notification_type: str,
+        title: str,
+        details: str = "",
+        sender: str = "system",
+        key=None,
+    ):
+        """notify.
+
+        Args:
+            notification_type (str): notification_type
+            title (str): title
+            details (str): details
+            sender (str): sender
+            key: source of the notification, e.g. a project id
+        """
+        pending_key = (notification_type, sender, key)
+        with self.mutex:
+            self.counters["requested"] += 1
+            if self.pending.pop(pending_key, None) is not None:
+                self.counters["coalesced"] += 1
+            self.pending[pending_key] = {
+                "notification_type": notification_type,
+                "sender": sender,
+                "title": title,
+                "details": details,
+            }
+        self._schedule()
+
+    def push(self, instance: Notification):
+        """push a saved notification to the websockets."""
+        with self.mutex:
+            self.outgoing.append(serialize_notification(instance))
+        self._schedule()
+
+    def _schedule(self):
+        self.start()
+        self.wakeup.set()
+
+    def start(self):
+        """start the dispatcher thread once."""
+        with self.mutex:
+            if self.worker is not None:
+                return
+            self.worker = threading.Thread(
+                name="notification_dispatcher", target=self._run, daemon=True
+            )
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(self.window)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Notifications dispatch failed")
+                with self.mutex:
+                    self.counters["failed"] += 1
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """flush.
+
+        Write the pending notifications, prune, and push what was saved.
+        """
+        with self.mutex:
+            pending = list(self.pending.values())
+            self.pending = {}
+        if pending:
+            # post_save of each notification pushes it
+            with transaction.atomic():
+                for fields in pending:
+                    Notification.objects.create(**fields)
+            pruned = self.prune()
+            with self.mutex:
+                self.counters["written"] += len(pending)
+                self.counters["pruned"] += pruned
+
+        with self.mutex:
+            outgoing = self.outgoing
+            self.outgoing = []
+        if outgoing:
+            self.send(outgoing)
+            with self.mutex:
+                self.counters["pushed"] += len(outgoing)
+                self.counters["frames"] += 1
+
+    def send(self, notifications):
+        """send notifications to the websockets in one frame."""
+        async_to_sync(get_channel_layer().group_send)(
+            NOTIFICATION_GROUP,
+            {"type": "notification.batch", "notifications": notifications},
+        )
+
+    def prune(self) -> int:
+        """prune.
+
+        Returns:
+            int: notifications deleted
+        """
+        last_kept = Notification.objects.order_by("-id").values_list(
+            "id", flat=True
+        )[self.max_rows - 1 : self.max_rows]
+        if not last_kept:
+            return 0
+        deleted, _ = Notification.objects.filter(id__lt=last_kept[0]).delete()
+        return deleted
+
+    def get_metrics(self):
+        """get_metrics."""
+        with self.mutex:
+            return dict(
+                self.counters, pending=len(self.pending), outgoing=len(self.outgoing)
+            )
+
+
+NOTIFICATION_DISPATCHER = NotificationDispatcher()
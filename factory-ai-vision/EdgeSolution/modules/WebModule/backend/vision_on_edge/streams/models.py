@@ -4,25 +4,230 @@
 import logging
 import threading
 import time
+from collections import deque
 
 import cv2
 
 from configs.general_configs import PRINT_THREAD
 
-from ..cameras.utils import normalize_rtsp, verify_rtsp
+from ..cameras.utils import normalize_rtsp
 from .exceptions import StreamOpenRTSPError
 
 logger = logging.getLogger(__name__)
 
 # Stream
 KEEP_ALIVE_THRESHOLD = 10  # Seconds
+STREAM_FRAME_WAIT_TIMEOUT = 1  # Seconds
+
+# Stream Hub
+HUB_FRAME_RING_SIZE = 4
+HUB_PREVIEW_SCALE = 0.5
+HUB_RECONNECT_INTERVAL = 1  # Seconds
 
 # Stream Manager
 STREAM_GC_TIME_THRESHOLD = 5  # Seconds
 
 
+class HubFrame:
+    """A decoded frame, JPEG encoded once on first request."""
+
+    def __init__(self, index, img):
+        self.index = index
+        self.img = img
+        self.jpg = None
+        self.mutex = threading.Lock()
+
+    def get_jpg(self, hub):
+        """get_jpg."""
+        with self.mutex:
+            if self.jpg is None:
+                img = cv2.resize(
+                    self.img, None, fx=HUB_PREVIEW_SCALE, fy=HUB_PREVIEW_SCALE
+                )
+                self.jpg = cv2.imencode(".jpg", img)[1].tobytes()
+                hub.encode_num += 1
+            return self.jpg
+
+
+class StreamHub:
+    """StreamHub
+
+    One capture / decoder thread per camera. Every Stream of the same rtsp
+    reads the frames of this hub, so a camera is decoded and each frame
+    encoded only once whatever the number of viewers.
+    """
+
+    def __init__(self, rtsp):
+        self.rtsp = rtsp
+        self.status = "init"
+        self.readers = 0
+        self.frames = deque(maxlen=HUB_FRAME_RING_SIZE)
+        self.frame_index = 0
+        self.read_num = 0
+        self.encode_num = 0
+        self.condition = threading.Condition()
+
+        if not isinstance(rtsp, (int, str)) or rtsp == "":
+            raise StreamOpenRTSPError
+        self.cap = cv2.VideoCapture(self.rtsp)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise StreamOpenRTSPError
+        has_img, img = self.cap.read()
+        if not has_img:
+            self.cap.release()
+            raise StreamOpenRTSPError
+        self._push(img)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """start the capture thread."""
+        self.status = "running"
+        self.thread.start()
+
+    def stop(self):
+        """stop the capture thread, the capture is released by the thread."""
+        with self.condition:
+            self.status = "stopped"
+            self.condition.notify_all()
+
+    def _push(self, img):
+        with self.condition:
+            self.read_num += 1
+            self.frame_index += 1
+            self.frames.append(HubFrame(self.frame_index, img))
+            self.condition.notify_all()
+
+    def _run(self):
+        logger.info("%s start capturing", self)
+        while self.status == "running":
+            has_img, img = False, None
+            if self.cap.isOpened():
+                has_img, img = self.cap.read()
+            # Need to add the video flag FIXME
+            if not has_img:
+                self.cap.release()
+                time.sleep(HUB_RECONNECT_INTERVAL)
+                if self.status == "running":
+                    self.cap = cv2.VideoCapture(self.rtsp)
+                continue
+            self._push(img)
+        logger.info("%s releasing cap...", self)
+        self.cap.release()
+
+    def get_latest_frame(self) -> HubFrame:
+        """get_latest_frame."""
+        with self.condition:
+            return self.frames[-1]
+
+    def wait_frame(self, after_index, timeout) -> HubFrame:
+        """wait_frame.
+
+        Returns:
+            the latest frame if newer than after_index, None on timeout or
+            if the hub is stopped.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.frame_index > after_index or self.status == "stopped",
+                timeout=timeout,
+            )
+            if self.status == "stopped" or self.frame_index <= after_index:
+                return None
+            return self.frames[-1]
+
+    def __str__(self):
+        return f"<StreamHub rtsp:{self.rtsp} readers:{self.readers}>"
+
+    def __repr__(self):
+        return f"<StreamHub rtsp:{self.rtsp} readers:{self.readers}>"
+
+
+class StreamHubManager:
+    """StreamHubManager
+
+    Hubs by normalized rtsp, reference counted by their readers. A hub is
+    stopped when its last reader leaves. Cameras are opened outside of the
+    manager mutex, under a lock of their rtsp, so a slow camera does not
+    block the others.
+    """
+
+    def __init__(self):
+        self.hubs = {}
+        self.open_locks = {}
+        self.mutex = threading.Lock()
+
+    def _get_running_hub(self, rtsp):
+        """reference the running hub of rtsp, the mutex must be held."""
+        hub = self.hubs.get(rtsp)
+        if hub is None or hub.status == "stopped":
+            return None
+        hub.readers += 1
+        return hub
+
+    def acquire(self, rtsp) -> StreamHub:
+        """acquire the hub of rtsp, open it if needed.
+
+        Raises:
+            StreamOpenRTSPError
+        """
+        with self.mutex:
+            hub = self._get_running_hub(rtsp)
+            if hub is not None:
+                return hub
+            open_lock = self.open_locks.setdefault(rtsp, threading.Lock())
+
+        with open_lock:
+            # Opened by another reader while waiting
+            with self.mutex:
+                hub = self._get_running_hub(rtsp)
+                if hub is not None:
+                    return hub
+            try:
+                hub = StreamHub(rtsp=rtsp)
+            except Exception:
+                with self.mutex:
+                    self._release_open_lock(rtsp, open_lock)
+                raise
+            hub.start()
+            with self.mutex:
+                self.hubs[rtsp] = hub
+                hub.readers += 1
+                self._release_open_lock(rtsp, open_lock)
+            return hub
+
+    def _release_open_lock(self, rtsp, open_lock):
+        """forget the open lock of rtsp, the mutex must be held."""
+        if self.open_locks.get(rtsp) is open_lock:
+            del self.open_locks[rtsp]
+
+    def release(self, hub: StreamHub):
+        """release a hub acquired before."""
+        with self.mutex:
+            hub.readers -= 1
+            if hub.readers > 0:
+                return
+            logger.info("%s has no reader, stopping", hub)
+            hub.stop()
+            if self.hubs.get(hub.rtsp) is hub:
+                del self.hubs[hub.rtsp]
+
+    def close_all(self):
+        """close_all."""
+        with self.mutex:
+            for hub in self.hubs.values():
+                hub.stop()
+            self.hubs = {}
+
+
+stream_hub_manager = StreamHubManager()
+
+
 class Stream:
-    """Stream Class"""
+    """Stream Class
+
+    A reader of the StreamHub of its rtsp.
+    """
 
     def __init__(self, rtsp, camera_id, part_id=None):
         self.rtsp = normalize_rtsp(rtsp=rtsp)
@@ -33,16 +238,14 @@ class Stream:
         self.status = "init"
         self.cur_img_index = 0
         self.last_get_img_index = 1
+        self.last_frame_index = 0
         self.id = id(self)
 
         self.mutex = threading.Lock()
         self.keep_alive = time.time()
 
-        # test rtsp
-        if not verify_rtsp(self.rtsp):
-            raise StreamOpenRTSPError
-        self.cap = cv2.VideoCapture(self.rtsp)
-        self.last_img = self.cap.read()[1]
+        self.hub = stream_hub_manager.acquire(self.rtsp)
+        self.has_hub = True
 
     def update_keep_alive(self):
         """update_keep_alive."""
@@ -56,32 +259,28 @@ class Stream:
         while self.status == "running" and (
             self.keep_alive + KEEP_ALIVE_THRESHOLD > time.time()
         ):
-            if not self.cap.isOpened():
-                raise StreamOpenRTSPError
-            has_img, img = self.cap.read()
-            # Need to add the video flag FIXME
-            if not has_img:
-                self.cap = cv2.VideoCapture(self.rtsp)
-                time.sleep(1)
+            frame = self.hub.wait_frame(
+                after_index=self.last_frame_index, timeout=STREAM_FRAME_WAIT_TIMEOUT
+            )
+            if frame is None:
+                if self.hub.status == "stopped":
+                    break
                 continue
 
-            img = cv2.resize(img, None, fx=0.5, fy=0.5)
+            self.last_frame_index = frame.index
             self.last_active = time.time()
-            self.last_img = img.copy()
             self.cur_img_index = (self.cur_img_index + 1) % 10000
             yield (
                 b"--frame\r\n"
                 b"Content-Type: image/jpeg\r\n\r\n"
-                + cv2.imencode(".jpg", img)[1].tobytes()
+                + frame.get_jpg(self.hub)
                 + b"\r\n"
             )
-        logger.info("%s releasing self...", self)
-        self.cap.release()
+        logger.info("%s stop streaming", self)
 
     def get_frame(self):
         """get_frame."""
         logger.info("get frame %s", self)
-        # b, img = self.cap.read()
         time_begin = time.time()
         while True:
             if time.time() - time_begin > 5:
@@ -91,22 +290,20 @@ class Stream:
             else:
                 break
         self.last_get_img_index = self.cur_img_index
-        img = self.last_img.copy()
-        # if b: return cv2.imencode('.jpg', img)[1].tobytes()
-        # else : return None
-        return cv2.imencode(".jpg", img)[1].tobytes()
+        return self.hub.get_latest_frame().get_jpg(self.hub)
 
     def close(self):
         """close.
 
-        close the stream.
+        close the stream, the hub is stopped if no other stream reads it.
         """
         self.status = "stopped"
-        try:
-            self.cap.release()
-            logger.info("Release cap success.")
-        except:
-            logger.error("Release cap failed.")
+        with self.mutex:
+            if not self.has_hub:
+                return
+            self.has_hub = False
+        stream_hub_manager.release(self.hub)
+        logger.info("Release hub success.")
 
     def __str__(self):
         return f"<Stream id:{self.id} rtsp:{self.rtsp}>"
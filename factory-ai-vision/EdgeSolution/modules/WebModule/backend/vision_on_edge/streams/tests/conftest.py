@@ -1,2 +1,13 @@
 """Conftests
 """
+
+import pytest
+
+from ..models import stream_hub_manager
+
+
+@pytest.fixture(autouse=True)
+def close_stream_hubs():
+    """Stop the capture threads opened by a test."""
+    yield
+    stream_hub_manager.close_all()
@@ -3,12 +3,15 @@
 # pylint: disable=W0613
 # skip unused-argument mock_cv2_capture
 
+import threading
 import time
 
+import cv2
 import pytest
 
 from ...cameras.tests.factories import CameraFactory
-from ..models import Stream
+from ...conftest import img_read
+from ..models import HUB_FRAME_RING_SIZE, Stream, stream_hub_manager
 
 pytestmark = pytest.mark.django_db
 
@@ -150,3 +153,110 @@ def test_method_stop(camera):
     assert stream_obj.status == "running"
     stream_obj.close()
     assert stream_obj.status == "stopped"
+
+
+@pytest.mark.fast
+def test_stream_hub_shared(camera):
+    """test_stream_hub_shared.
+
+    Streams of the same camera share one hub, each frame is encoded once.
+    """
+    stream_1 = Stream(rtsp=camera.rtsp, camera_id=camera.id)
+    stream_2 = Stream(rtsp=camera.rtsp, camera_id=camera.id)
+    hub = stream_1.hub
+    assert stream_2.hub is hub
+    assert hub.readers == 2
+    assert len(stream_hub_manager.hubs) == 1
+
+    assert next(stream_1.gen()).startswith(b"--frame")
+    assert next(stream_2.gen()).startswith(b"--frame")
+
+    frame = hub.get_latest_frame()
+    encode_num = hub.encode_num
+    jpg = frame.get_jpg(hub)
+    assert frame.get_jpg(hub) is jpg
+    assert hub.encode_num <= encode_num + 1
+    assert len(hub.frames) <= HUB_FRAME_RING_SIZE
+
+
+@pytest.mark.fast
+def test_stream_hub_release(camera):
+    """test_stream_hub_release.
+
+    The hub is stopped when its last stream is closed.
+    """
+    stream_1 = Stream(rtsp=camera.rtsp, camera_id=camera.id)
+    stream_2 = Stream(rtsp=camera.rtsp, camera_id=camera.id)
+    hub = stream_1.hub
+
+    stream_1.close()
+    stream_1.close()
+    assert hub.readers == 1
+    assert hub.status == "running"
+
+    stream_2.close()
+    assert hub.readers == 0
+    assert hub.status == "stopped"
+    assert camera.rtsp not in stream_hub_manager.hubs
+    hub.thread.join(timeout=3)
+    assert not hub.thread.is_alive()
+
+    stream_3 = Stream(rtsp=camera.rtsp, camera_id=camera.id)
+    assert stream_3.hub is not hub
+    assert stream_3.hub.status == "running"
+
+
+@pytest.mark.fast
+def test_stream_hub_open_outside_manager_lock(monkeypatch):
+    """test_stream_hub_open_outside_manager_lock.
+
+    A camera slow to open does not block the hubs of other cameras, and
+    readers waiting for it share the hub once opened.
+    """
+    slow_rtsp = "rtsp://slow"
+    opening = threading.Event()
+    opened = threading.Event()
+    open_num = []
+
+    class MockedVideoCap:
+        def __init__(self, rtsp):
+            if rtsp == slow_rtsp:
+                open_num.append(rtsp)
+                opening.set()
+                opened.wait(timeout=5)
+
+        def isOpened(self):
+            return True
+
+        def read(self):
+            return img_read
+
+        def release(self):
+            pass
+
+    monkeypatch.setattr(cv2, "VideoCapture", MockedVideoCap)
+
+    slow_hubs = []
+    threads = [
+        threading.Thread(
+            target=lambda: slow_hubs.append(stream_hub_manager.acquire(slow_rtsp))
+        )
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    assert opening.wait(timeout=3)
+
+    time_start = time.time()
+    fast_hub = stream_hub_manager.acquire("rtsp://fast")
+    assert time.time() - time_start < 1
+    assert fast_hub.status == "running"
+
+    opened.set()
+    for thread in threads:
+        thread.join(timeout=3)
+    assert len(slow_hubs) == 2
+    assert slow_hubs[0] is slow_hubs[1]
+    assert slow_hubs[0].readers == 2
+    assert len(open_num) == 1
+    assert not stream_hub_manager.open_locks
@@ -116,7 +116,7 @@ export const Deployment: React.FC = () => {
 
   useInterval(
     () => {
-      dispatch(thunkGetTrainingLog(projectId, isDemo, selectedCamera));
+      dispatch(thunkGetTrainingLog(projectId, isDemo));
     },
     status === Status.WaitTraining ? 5000 : null,
   );
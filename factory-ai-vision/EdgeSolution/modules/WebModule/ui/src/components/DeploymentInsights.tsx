@@ -37,18 +37,20 @@ export const Insights: React.FC<InsightsProps> = ({ status, projectId, cameraId
 
   useInterval(
     () => {
-      Axios.get(`/api/part_detections/${projectId}/export?camera_id=${cameraId}`)
+      // Metrics of every camera in one request, pick the selected one
+      Axios.get(`/api/part_detections/${projectId}/metrics`)
         .then(({ data }) => {
+          const metrics = data.cameras[cameraId] ?? {};
           setinferenceMetrics({
-            successRate: data.success_rate,
-            successfulInferences: data.inference_num,
-            unIdentifiedItems: data.unidentified_num,
-            isGpu: data.gpu,
-            averageTime: data.average_time,
-            objectCounts: normalizeObjectCount(data.count),
-            numAccrossLine: data.scenario_metrics?.find((e) => e.name === 'all_objects')?.count,
-            numOfViolation: data.scenario_metrics?.find((e) => e.name === 'violation')?.count,
-            numOfDefect: getNumOfDefects(data.scenario_metrics),
+            successRate: metrics.success_rate,
+            successfulInferences: metrics.inference_num,
+            unIdentifiedItems: metrics.unidentified_num,
+            isGpu: metrics.gpu,
+            averageTime: metrics.average_time,
+            objectCounts: normalizeObjectCount(metrics.count),
+            numAccrossLine: metrics.scenario_metrics?.find((e) => e.name === 'all_objects')?.count,
+            numOfViolation: metrics.scenario_metrics?.find((e) => e.name === 'violation')?.count,
+            numOfDefect: getNumOfDefects(metrics.scenario_metrics ?? []),
           });
           return void 0;
         })
@@ -1,6 +1,6 @@
 import { useEffect } from 'react';
 import { useDispatch } from 'react-redux';
-import { receiveNotification } from '../store/notificationSlice';
+import { receiveNotification, receiveNotifications } from '../store/notificationSlice';
 
 export const useWebSocket = (): void => {
   const dispatch = useDispatch();
@@ -14,7 +14,9 @@ export const useWebSocket = (): void => {
 
     ws.onmessage = ({ data }): void => {
       const deSerializedData = JSON.parse(data);
-      dispatch(receiveNotification(deSerializedData));
+      // Notifications saved together come in one frame
+      if (deSerializedData.notifications) dispatch(receiveNotifications(deSerializedData.notifications));
+      else dispatch(receiveNotification(deSerializedData));
     };
 
     ws.onerror = (evt): void => {
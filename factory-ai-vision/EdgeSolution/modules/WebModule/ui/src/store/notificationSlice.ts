@@ -52,6 +52,9 @@ const slice = createSlice({
     receiveNotification: (state, action) => {
       entityAdapter.addOne(state, getNormalizeNotification(action.payload, true));
     },
+    receiveNotifications: (state, action) => {
+      entityAdapter.addMany(state, action.payload.map((e) => getNormalizeNotification(e, true)));
+    },
     openNotificationPanel: (state) => {
       state.ids.forEach((id) => {
         state.entities[id].unRead = false;
@@ -74,7 +77,7 @@ const slice = createSlice({
 const { reducer } = slice;
 export default reducer;
 
-export const { receiveNotification, openNotificationPanel } = slice.actions;
+export const { receiveNotification, receiveNotifications, openNotificationPanel } = slice.actions;
 
 export const { selectAll: selectAllNotifications } = entityAdapter.getSelectors(
   (state: State) => state.notifications,
@@ -276,12 +276,10 @@ export const getConfigure = createWrappedAsync<any, number>('project/configure',
   await Axios.get(`/api/part_detections/${projectId}/configure`);
 });
 
-export const thunkGetTrainingLog = (projectId: number, isDemo: boolean, cameraId: number) => (
-  dispatch,
-): Promise<any> => {
+export const thunkGetTrainingLog = (projectId: number, isDemo: boolean) => (dispatch): Promise<any> => {
   dispatch(getTrainingLogRequest(isDemo));
 
-  return Axios.get(`/api/part_detections/${projectId}/export?camera_id=${cameraId}`)
+  return Axios.get(`/api/part_detections/${projectId}/metrics`)
     .then(({ data }) => {
       if (data.status === 'failed') throw new Error(data.log);
       else if (data.status === 'ok' || data.status === 'demo ok')
@@ -0,0 +1,170 @@
+"""Benchmark frame iterators
+
+Compare the in-process VA metadata reader of VideoInferenceIterator with
+the former one, which scraped the hex dump of
+``gst-launch-1.0 ... fakesink dump=true``, on a synthetic recording of the
+metadata stream. The former parser is timed on pre-rendered dump lines, the
+cost of the gst-launch process itself is not counted.
+
+    python3 benchmark_frame_iterators.py
+"""
+
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+
+# Import the module alone, the iotccsdk package needs the camera SDK
+# dependencies.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'iotccsdk'))
+from frame_iterators import VideoInferenceIterator  # noqa: E402
+
+N_INFERENCES = 20000
+N_OBJECTS = 5
+LARGE_N_OBJECTS = 100
+RTP_MAX_PAYLOAD = 1400
+PREVIEW_WIDTH = 1920
+PREVIEW_HEIGHT = 1080
+
+
+def make_message(timestamp, n_objects):
+    """VA metadata as sent by the camera."""
+    if n_objects == 0:
+        return '{ "timestamp": %d }' % timestamp
+    objects = ', '.join(
+        '{ "id": "%d", "display_name": "person", "confidence": %d, '
+        '"position": { "x": %d, "y": %d, "width": 1200, "height": 3000 } }'
+        % (i, 50 + i % 50, i * 70 % 10000, i * 90 % 10000)
+        for i in range(n_objects))
+    return '{ "timestamp": %d, "objects":[ %s ] }' % (timestamp, objects)
+
+
+def make_messages(n_objects):
+    # One message in five has no objects and is not yielded
+    return [make_message(i, 0 if i % 5 == 4 else n_objects)
+            for i in range(N_INFERENCES)]
+
+
+def make_rtp_packets(messages):
+    packets = []
+    seq = 0
+    for timestamp, message in enumerate(messages):
+        data = message.encode()
+        chunks = [data[i:i + RTP_MAX_PAYLOAD]
+                  for i in range(0, len(data), RTP_MAX_PAYLOAD)]
+        for index, chunk in enumerate(chunks):
+            marker = 0x80 if index == len(chunks) - 1 else 0
+            header = struct.pack('>BBHII', 0x80, marker | 107, seq & 0xffff,
+                                 timestamp * 3000, 0x1234abcd)
+            packets.append(header + chunk)
+            seq += 1
+    return packets
+
+
+def write_pcap(path, packets):
+    """Ethernet / IPv4 / UDP capture of the RTP packets."""
+    with open(path, 'wb') as pcap:
+        pcap.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for packet in packets:
+            udp = struct.pack('>HHHH', 50000, 50002, 8 + len(packet), 0) + packet
+            ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0,
+                             64, 17, 0, b'\x7f\x00\x00\x01',
+                             b'\x7f\x00\x00\x01') + udp
+            frame = b'\x00' * 12 + b'\x08\x00' + ip
+            pcap.write(struct.pack('<IIII', 0, 0, len(frame), len(frame)))
+            pcap.write(frame)
+
+
+def make_dump_lines(packets):
+    """fakesink dump=true output, the data starts at column 72."""
+    lines = []
+    for packet in packets:
+        for offset in range(0, len(packet), 16):
+            data = packet[offset:offset + 16]
+            hex_str = ''.join('%02x ' % byte for byte in data)
+            ascii_str = ''.join(chr(byte) if 32 <= byte < 127 else '.'
+                                for byte in data)
+            lines.append('%08x (0x%08x): %-48.48s %-16.16s\n'
+                         % (offset, 0xb6a01000, hex_str, ascii_str))
+    return lines
+
+
+class LegacyVideoInferenceIterator(VideoInferenceIterator):
+    """The former parsing loop of VideoInferenceIterator.start."""
+
+    def start_from_lines(self, lines):
+        data_idx = 72
+        json_str = ""
+        for line in lines:
+            l_str = line[data_idx:]
+            l_str = l_str.strip(os.linesep)
+            if ":[" in json_str and "] }" in json_str + l_str:
+                json_str = json_str + l_str
+                s_idx = json_str.index('{ "')
+                e_idx = json_str.index("] }") + 3
+                json_str = json_str[s_idx:e_idx]
+                try:
+                    result = self._get_inference_result(json.loads(json_str))
+                except ValueError:
+                    result = None
+                json_str = ""
+                if result is not None:
+                    yield result
+            elif (":[" not in json_str
+                  and '{ "' in json_str
+                  and " }" in json_str + l_str):
+                json_str = ""
+            else:
+                json_str = json_str + l_str
+
+
+def summary(results):
+    return [(r.timestamp, len(r.objects)) for r in results]
+
+
+def benchmark(name, parse):
+    start = time.perf_counter()
+    results = list(parse())
+    elapsed = time.perf_counter() - start
+    print("---- {} ----".format(name))
+    print("  inferences : {}".format(len(results)))
+    print("  time       : {:.2f} s".format(elapsed))
+    print("  per second : {:.0f}".format(len(results) / elapsed))
+    return results
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    for n_objects in [N_OBJECTS, LARGE_N_OBJECTS]:
+        messages = make_messages(n_objects)
+        packets = make_rtp_packets(messages)
+        pcap_path = os.path.join(tmp_dir, 'va_%d.pcap' % n_objects)
+        write_pcap(pcap_path, packets)
+        print("==== {} objects per inference, {} RTP packets ====".format(
+            n_objects, len(packets)))
+
+        iterator = VideoInferenceIterator(PREVIEW_WIDTH, PREVIEW_HEIGHT)
+        results = benchmark("in process", lambda: iterator.start(pcap_path))
+
+        if len(packets) > len(messages):
+            # The former parser mixes the RTP headers of the following
+            # packets into a message spanning several packets.
+            print("---- gst-launch dump ----")
+            print("  messages span several RTP packets, not supported")
+            continue
+        lines = make_dump_lines(packets)
+        legacy = LegacyVideoInferenceIterator(PREVIEW_WIDTH, PREVIEW_HEIGHT)
+        legacy_results = benchmark("gst-launch dump",
+                                   lambda: legacy.start_from_lines(lines))
+        # The former parser also loses messages whose RTP header bytes look
+        # like JSON
+        lost = set(summary(results)) - set(summary(legacy_results))
+        assert set(summary(legacy_results)) <= set(summary(results))
+        print("  lost       : {}".format(len(lost)))
+
+
+if __name__ == '__main__':
+    main()
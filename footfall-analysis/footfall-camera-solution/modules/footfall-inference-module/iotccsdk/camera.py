@@ -33,6 +33,7 @@ This module contains the high level client APIs.
 import base64
 import logging
 import os
+import time
 from contextlib import contextmanager
 from .ipcprovider import IpcProvider
 from .frame_iterators import VideoInferenceIterator
@@ -41,6 +42,11 @@ from azure.storage.blob import BlockBlobService, PublicAccess
 DOCKER_IP_PREFIX = "172.17"
 NULL_IP = "0.0.0.0"
 LOOPBACK_IP = "127.0.0.1"
+#: int: Retries of a failed configuration call, the camera may be busy
+#:      switching analytics or preview.
+CONFIGURE_RETRIES = 4
+#: int: Seconds between two attempts of a configuration call.
+CONFIGURE_RETRY_DELAY_IN_SECONDS = 1
 
 
 class CameraClient():
@@ -80,6 +86,10 @@ class CameraClient():
         Flag that tells whether HDMI display/preview is enabled or not.
         HDMI display/preview is enabled if this flag is 1 else disabled.
         This can be configured using `configure_preview` API.
+    overlay_config: str
+        Overlay type last configured, None if unknown.
+    overlay_state: str
+        Overlay state last set ("on"/"off"), None if unknown.
     """
     logger = logging.getLogger("iotccsdk")
 
@@ -118,6 +128,7 @@ class CameraClient():
             raise
         finally:
             ipc_provider.logout()
+            ipc_provider.close()
 
     def __init__(self, ipc_provider):
         """
@@ -143,6 +154,8 @@ class CameraClient():
         self.cur_bitrate = ""
         self.cur_framerate = 0
         self.display_out = 0
+        self.overlay_config = None
+        self.overlay_state = None
         self._get_supported_params()
 
     @contextmanager
@@ -230,6 +243,27 @@ class CameraClient():
         Exception
             Any exception raised by ipc provider post
 
+        """
+        payload = self._get_video_payload(
+            resolution, encode, bitrate, framerate, display_out)
+        path = "/video"
+        response = self.ipc_provider.post(path, payload)
+        if response["status"]:
+            self._set_video_settings(payload)
+        return response["status"]
+
+    def _get_video_payload(self, resolution=None, encode=None,
+                           bitrate=None, framerate=None, display_out=None):
+        """
+        Private method for building the `/video` payload.
+
+        Parameters which are not supported keep their current value.
+
+        Returns
+        -------
+        dict
+            Payload for the `/video` API.
+
         """
         if resolution and self.resolutions and resolution in self.resolutions:
             res = self.resolutions.index(resolution)
@@ -253,32 +287,177 @@ class CameraClient():
                 "Invalid value: display_out should 0/1 got: %s" % display_out)
             display_out = self.display_out
 
-        path = "/video"
-        payload = {
+        return {
             "resolutionSelectVal": res,
             "encodeModeSelectVal": enc,
             "bitRateSelectVal": bit,
             "fpsSelectVal": fps,
             "displayOut": display_out
         }
-        response = self.ipc_provider.post(path, payload)
-        if response["status"]:
-            if self.cur_resolution != self.resolutions[res]:
-                self.cur_resolution = self.resolutions[res]
-                self.logger.info("resolution now: %s" % self.cur_resolution)
-            if self.cur_codec != self.encodetype[enc]:
-                self.cur_codec = self.encodetype[enc]
-                self.logger.info("encodetype now: %s" % self.cur_codec)
-            if self.cur_bitrate != self.bitrates[bit]:
-                self.cur_bitrate = self.bitrates[bit]
-                self.logger.info("bitrate now : %s" % self.cur_bitrate)
-            if self.cur_framerate != self.framerates[fps]:
-                self.cur_framerate = self.framerates[fps]
-                self.logger.info("framerate now: %s" % self.cur_framerate)
-            if self.display_out != display_out:
-                self.display_out = display_out
-                self.logger.info("display_out now: %s" % self.display_out)
-        return response["status"]
+
+    def _set_video_settings(self, payload):
+        """
+        Private method for updating the current preview params.
+
+        Parameters
+        ----------
+        payload : dict
+            Payload accepted by the `/video` API.
+
+        """
+        resolution = self.resolutions[payload["resolutionSelectVal"]]
+        codec = self.encodetype[payload["encodeModeSelectVal"]]
+        bitrate = self.bitrates[payload["bitRateSelectVal"]]
+        framerate = self.framerates[payload["fpsSelectVal"]]
+        display_out = payload["displayOut"]
+        if self.cur_resolution != resolution:
+            self.cur_resolution = resolution
+            self.logger.info("resolution now: %s" % self.cur_resolution)
+        if self.cur_codec != codec:
+            self.cur_codec = codec
+            self.logger.info("encodetype now: %s" % self.cur_codec)
+        if self.cur_bitrate != bitrate:
+            self.cur_bitrate = bitrate
+            self.logger.info("bitrate now : %s" % self.cur_bitrate)
+        if self.cur_framerate != framerate:
+            self.cur_framerate = framerate
+            self.logger.info("framerate now: %s" % self.cur_framerate)
+        if self.display_out != display_out:
+            self.display_out = display_out
+            self.logger.info("display_out now: %s" % self.display_out)
+
+    def apply_configuration(self, resolution=None, encode=None, bitrate=None,
+                            framerate=None, display_out=None,
+                            preview_state=None, overlay_config=None,
+                            overlay_state=None, analytics_state=None,
+                            restart_analytics=False,
+                            retries=CONFIGURE_RETRIES,
+                            retry_delay=CONFIGURE_RETRY_DELAY_IN_SECONDS):
+        """
+        This method applies a full camera configuration at once.
+
+        Only the settings which differ from the current ones are sent, in
+        the order required by the camera: analytics off, preview off,
+        preview params, preview on, overlay, analytics on. The calls go
+        through `IpcProvider.batch` over one kept-alive connection and the
+        preview and VA urls are read once at the end. A failed call is
+        retried, with the calls after it, up to `retries` times.
+
+        Parameters
+        ----------
+        resolution : str
+            A value from `resolutions` attribute
+        encode : str
+            A value from `encodetype` attribute
+        bitrate : str
+            A value from `bitrates` attribute
+        framerate : int
+            A value from `framerates` attribute
+        display_out : {0, 1}
+            For enabling or disabling HDMI output
+        preview_state : {None, "on", "off"}
+            Preview state, None keeps the current one.
+        overlay_config : {None, "inference", "text"}
+            Type of the overlay, only applied while preview is on.
+        overlay_state : {None, "on", "off"}
+            Overlay state, only applied while preview is on.
+        analytics_state : {None, "on", "off"}
+            Video Analytics state, None keeps the current one.
+        restart_analytics : bool
+            Restart Video Analytics even if nothing changed, e.g. for
+            loading a new model (the default is False).
+        retries : int
+            Retries of a failed call (the default is `CONFIGURE_RETRIES`).
+        retry_delay : float
+            Seconds between two attempts (the default is
+            `CONFIGURE_RETRY_DELAY_IN_SECONDS`).
+
+        Returns
+        -------
+        bool
+            True if every request was successful.
+            False on failure.
+
+        """
+        if display_out is None:
+            display_out = self.display_out
+        video_payload = self._get_video_payload(
+            resolution, encode, bitrate, framerate, display_out)
+        video_changed = (
+            video_payload != self._get_video_payload(display_out=self.display_out))
+
+        preview_on = self.preview_running
+        if preview_state is not None:
+            preview_on = preview_state.lower() == "on"
+        preview_changed = video_changed or preview_on != self.preview_running
+
+        vam_on = self.vam_running
+        if analytics_state is not None:
+            vam_on = analytics_state.lower() == "on"
+        # VA runs on the preview, it is restarted with it
+        vam_changed = (restart_analytics or preview_changed
+                       or vam_on != self.vam_running)
+
+        overlay_changed = (overlay_config != self.overlay_config
+                           or overlay_state != self.overlay_state)
+
+        calls = []
+        if vam_changed and self.vam_running:
+            calls.append(("post", "/vam",
+                          {"switchStatus": False, "vamconfig": "MD"}))
+        if preview_changed:
+            if self.preview_running:
+                calls.append(("post", "/preview", {"switchStatus": False}))
+            if video_changed:
+                calls.append(("post", "/video", video_payload))
+            if preview_on:
+                calls.append(("post", "/preview", {"switchStatus": True}))
+        overlay_applied = preview_on and (overlay_changed or preview_changed)
+        if overlay_applied:
+            if overlay_config in ["inference", "text"]:
+                calls.append(("post", "/overlayconfig",
+                              self._get_overlay_payload(overlay_config)))
+            if overlay_state is not None:
+                calls.append(("post", "/overlay", {
+                    "switchStatus": overlay_state.lower() == "on"}))
+        if vam_changed and vam_on:
+            calls.append(("post", "/vam",
+                          {"switchStatus": True, "vamconfig": "MD"}))
+
+        if not calls:
+            self.logger.info("camera configuration unchanged")
+            return True
+
+        pending = calls
+        for attempt in range(retries + 1):
+            if attempt:
+                method, path, _ = pending[0]
+                self.logger.info("retrying %s %s: %d" % (method, path, attempt))
+                time.sleep(retry_delay)
+            responses = self.ipc_provider.batch(pending)
+            # the batch stops at the first call which fails
+            if not responses[-1].get("status", responses[-1].get("Status")):
+                responses.pop()
+            pending = pending[len(responses):]
+            if not pending:
+                break
+        was_success = not pending
+        if was_success:
+            if video_changed:
+                self._set_video_settings(video_payload)
+            if overlay_applied:
+                self.overlay_config = overlay_config
+                self.overlay_state = overlay_state
+        else:
+            # Unknown state, the overlay is applied again next time
+            self.overlay_config = None
+            self.overlay_state = None
+
+        if preview_changed:
+            self._get_preview_info()
+        if vam_changed:
+            self._get_vam_info()
+        return was_success
 
     def _get_supported_params(self):
         """
@@ -499,31 +678,63 @@ class CameraClient():
         else:
             self.logger.error("Invalid overlay type use (inference/text)")
 
-    def _configure_inference_overlay(self):
+    def _get_overlay_payload(self, type, text=None):
         """
-        Private method for inference overlay configuration.
+        Private method for building the `/overlayconfig` payload.
 
-        This is used by `configure_overlay` for inference type overlay.
+        Parameters
+        ----------
+        type : {"inference", "text"}
+            Type of the overlay.
+        text : str, optional
+            Text for text overlay type (the default is None).
 
         Returns
         -------
-        bool
-            True if the configuration was successful.
-            False on failure.
+        dict
+            Payload for the `/overlayconfig` API.
 
         """
-        path = "/overlayconfig"
-        payload = {
-            "ov_type_SelectVal": 5,
+        if type == "inference":
+            return {
+                "ov_type_SelectVal": 5,
+                "ov_position_SelectVal": 0,
+                "ov_color": "869007615",
+                "ov_usertext": "Text",
+                "ov_start_x": 0,
+                "ov_start_y": 0,
+                "ov_width": 0,
+                "ov_height": 0
+            }
+        return {
+            "ov_type_SelectVal": 0,
             "ov_position_SelectVal": 0,
             "ov_color": "869007615",
-            "ov_usertext": "Text",
+            "ov_usertext": text,
             "ov_start_x": 0,
             "ov_start_y": 0,
             "ov_width": 0,
             "ov_height": 0
         }
+
+    def _configure_inference_overlay(self):
+        """
+        Private method for inference overlay configuration.
+
+        This is used by `configure_overlay` for inference type overlay.
+
+        Returns
+        -------
+        bool
+            True if the configuration was successful.
+            False on failure.
+
+        """
+        path = "/overlayconfig"
+        payload = self._get_overlay_payload("inference")
         response = self.ipc_provider.post(path, payload)
+        if response["status"]:
+            self.overlay_config = "inference"
         return response["status"]
 
     def _configure_text_overlay(self, text):
@@ -540,17 +751,10 @@ class CameraClient():
 
         """
         path = "/overlayconfig"
-        payload = {
-            "ov_type_SelectVal": 0,
-            "ov_position_SelectVal": 0,
-            "ov_color": "869007615",
-            "ov_usertext": text,
-            "ov_start_x": 0,
-            "ov_start_y": 0,
-            "ov_width": 0,
-            "ov_height": 0
-        }
+        payload = self._get_overlay_payload("text", text)
         response = self.ipc_provider.post(path, payload)
+        if response["status"]:
+            self.overlay_config = "text"
         return response["status"]
 
     @contextmanager
@@ -580,6 +784,8 @@ class CameraClient():
         path = "/overlay"
         payload = {"switchStatus": status}
         response = self.ipc_provider.post(path, payload)
+        if response["status"]:
+            self.overlay_state = state.lower()
         return response["status"]
 
     @contextmanager
@@ -611,6 +817,27 @@ class CameraClient():
             f.write(base64.b64decode(response["Data"]))
         return True
 
+    def capture_snapshot(self):
+        """
+        This method is for taking a snapshot in memory.
+
+        Returns
+        -------
+        (str, bytes)
+            File name snapshot_<timestamp>.jpg and image data if the
+            request was successful. None on failure.
+
+        """
+        path = "/captureimage"
+        payload = {}
+        response = self.ipc_provider.post(path, payload)
+        if response["Error"] != "none":
+            self.logger.error(response["Error"])
+            return None
+
+        file_name = "snapshot_%s.jpg" % response["Timestamp"]
+        return file_name, base64.b64decode(response["Data"])
+
     def captureimagetoblob(self, block_blob_service, container_name):
         """
         This method is for taking a snapshot.
@@ -624,18 +851,13 @@ class CameraClient():
             True if the request was successful. False on failure.
 
         """
-        path = "/captureimage"
-        payload = {}
-        response = self.ipc_provider.post(path, payload)
-        if response["Error"] != "none":
-            self.logger.error(response["Error"])
+        snapshot = self.capture_snapshot()
+        if snapshot is None:
             return False
 
-        file_name = "snapshot_%s.jpg" % response["Timestamp"]
-        dir_name = os.path.dirname(os.path.abspath(__name__))
-        full_file_name = os.path.join(dir_name, file_name)
-        self.logger.info("Storing snapshot: %s" % full_file_name)
-        blobprops = block_blob_service.create_blob_from_bytes(container_name, file_name,base64.b64decode(response["Data"]))
+        file_name, data = snapshot
+        self.logger.info("Storing snapshot: %s/%s" % (container_name, file_name))
+        block_blob_service.create_blob_from_bytes(container_name, file_name, data)
         return True
 
     @contextmanager
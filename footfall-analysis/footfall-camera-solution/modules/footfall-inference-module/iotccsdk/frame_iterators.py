@@ -29,11 +29,26 @@
 This module provides iterator for getting frame and inference.
 """
 
+import base64
+import codecs
 import json
 import logging
-import os
-import subprocess
-import sys
+import re
+import socket
+import struct
+import time
+from urllib.parse import urljoin, urlsplit
+
+#: int: RTSP port when the url has none.
+RTSP_DEFAULT_PORT = 554
+#: int: Seconds to wait for the RTSP server.
+RTSP_TIMEOUT = 10
+#: int: Seconds between two keep-alive requests if the server sets no
+#:      session timeout.
+RTSP_KEEP_ALIVE_INTERVAL = 30
+#: int: Inference metadata larger than this is dropped, it is most likely
+#:      a corrupted stream.
+MAX_METADATA_SIZE = 1024 * 1024
 
 
 class CameraInference(object):
@@ -114,6 +129,454 @@ class CameraInferenceObjectPosition(object):
         self.height = height
 
 
+def get_rtp_payload(packet):
+    """
+    Get the payload of a RTP packet.
+
+    Parameters
+    ----------
+    packet : bytes
+        RTP packet.
+
+    Returns
+    -------
+    bytes
+        The payload, without CSRC, header extension and padding.
+        None if `packet` is not a RTP packet.
+
+    """
+    if len(packet) < 12 or packet[0] >> 6 != 2:
+        return None
+    offset = 12 + (packet[0] & 0x0f) * 4
+    if packet[0] & 0x10:
+        if len(packet) < offset + 4:
+            return None
+        offset += 4 + struct.unpack('>H', packet[offset + 2:offset + 4])[0] * 4
+    end = len(packet)
+    if packet[0] & 0x20:
+        end -= packet[-1]
+    if offset > end:
+        return None
+    return packet[offset:end]
+
+
+class JsonObjectFramer(object):
+    """
+    This is a class for incremental JSON framing.
+
+    Splits a byte stream into its top level JSON objects, whatever the
+    chunks boundaries, and decodes them. Decoding is only attempted once
+    the buffered braces are balanced, so an object is usually decoded once
+    however many chunks it spans. Data outside of objects is skipped.
+
+    Attributes
+    ----------
+    max_size : int
+        Objects larger than this are dropped.
+
+    """
+
+    def __init__(self, max_size=MAX_METADATA_SIZE):
+        """
+        This is the constructor for the `JsonObjectFramer` class.
+
+        """
+        self.max_size = max_size
+        #: str: Start of the current object, from the previous chunks
+        self._buffer = ''
+        #: int: Opening minus closing braces of the buffer, strings included
+        self._balance = 0
+        self._decoder = json.JSONDecoder()
+        #: Characters may be split between chunks
+        self._utf8 = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.logger = logging.getLogger('iotccsdk')
+
+    def feed(self, data):
+        """
+        Feed the next chunk of the stream.
+
+        Parameters
+        ----------
+        data : bytes
+            Next chunk of the stream.
+
+        Returns
+        -------
+        list of dict
+            The objects completed by this chunk.
+
+        """
+        text = self._utf8.decode(data)
+        self._buffer += text
+        self._balance += text.count('{') - text.count('}')
+        objects = []
+        # Braces in strings may unbalance the count, try on a closing brace
+        if self._balance > 0 and not text.rstrip().endswith('}'):
+            self._check_size()
+            return objects
+
+        buffer = self._buffer
+        pos = buffer.find('{')
+        while pos >= 0:
+            try:
+                obj, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if self._is_incomplete(e, buffer):
+                    break
+                self.logger.debug('Skipping malformed metadata: %s' % e)
+                pos = buffer.find('{', pos + 1)
+                continue
+            if isinstance(obj, dict):
+                objects.append(obj)
+            pos = buffer.find('{', end)
+        self._buffer = buffer[pos:] if pos >= 0 else ''
+        self._balance = self._buffer.count('{') - self._buffer.count('}')
+        self._check_size()
+        return objects
+
+    def reset(self):
+        """
+        Drop the current object.
+
+        """
+        self._buffer = ''
+        self._balance = 0
+        self._utf8.reset()
+
+    def _is_incomplete(self, error, buffer):
+        """
+        Private method telling if the decoding failed for lack of data.
+
+        """
+        if error.msg.startswith('Unterminated string'):
+            return True
+        return error.pos >= len(buffer.rstrip())
+
+    def _check_size(self):
+        if len(self._buffer) > self.max_size:
+            self.logger.error('Dropping metadata larger than %d bytes'
+                              % self.max_size)
+            self.reset()
+
+
+class RtspMetadataSource(object):
+    """
+    This is a class for reading the VA metadata stream of the camera.
+
+    Iterates over the RTP packets of the application track of an RTSP
+    stream. Packets are interleaved in the RTSP TCP connection, as
+    ``rtspsrc protocols=tcp`` does.
+
+    Attributes
+    ----------
+    url : str
+        VA RTSP stream url, credentials in the url use basic authentication.
+    timeout : int
+        Seconds to wait for the RTSP server.
+
+    """
+
+    def __init__(self, url, timeout=RTSP_TIMEOUT):
+        """
+        This is the constructor for the `RtspMetadataSource` class.
+
+        """
+        self.url = url
+        self.timeout = timeout
+        self._sock = None
+        #: bytearray: Received data not read yet
+        self._buffer = bytearray()
+        self._cseq = 0
+        self._session = None
+        self._closed = False
+        self.logger = logging.getLogger('iotccsdk')
+
+    def __iter__(self):
+        """
+        Connect, play the application track and yield its RTP packets.
+
+        Yields
+        ------
+        bytes
+            RTP packet.
+
+        Raises
+        ------
+        ConnectionError
+            If the RTSP server fails or closes the connection.
+
+        """
+        parts = urlsplit(self.url)
+        headers = {}
+        if parts.username:
+            credentials = '%s:%s' % (parts.username, parts.password or '')
+            headers['Authorization'] = 'Basic %s' % base64.b64encode(
+                credentials.encode()).decode()
+        url = parts._replace(netloc=parts.hostname + (
+            ':%d' % parts.port if parts.port else '')).geturl()
+
+        self._sock = socket.create_connection(
+            (parts.hostname, parts.port or RTSP_DEFAULT_PORT), self.timeout)
+        try:
+            response, body = self._request('DESCRIBE', url, dict(
+                headers, Accept='application/sdp'))
+            control_url = self._get_control_url(
+                response.get('content-base', url), body.decode())
+            response, _ = self._request('SETUP', control_url, dict(
+                headers, Transport='RTP/AVP/TCP;unicast;interleaved=0-1'))
+            session = response.get('session', '').split(';')
+            self._session = session[0]
+            keep_alive_interval = RTSP_KEEP_ALIVE_INTERVAL
+            for param in session[1:]:
+                if param.strip().startswith('timeout='):
+                    keep_alive_interval = int(param.split('=')[1]) / 2
+            channel = 0
+            match = re.search(r'interleaved=(\d+)',
+                              response.get('transport', ''))
+            if match:
+                channel = int(match.group(1))
+            headers['Session'] = self._session
+            self._request('PLAY', url, dict(headers, Range='npt=0.000-'))
+
+            last_keep_alive = time.time()
+            while True:
+                wait = last_keep_alive + keep_alive_interval - time.time()
+                if wait <= 0:
+                    # The answer is skipped below
+                    self._send('OPTIONS', url, headers)
+                    last_keep_alive = time.time()
+                    continue
+                if not self._buffer and not self._wait_data(wait):
+                    continue
+                marker = self._read(1)
+                if marker != b'$':
+                    # RTSP response interleaved with the packets
+                    self._read_response(marker)
+                    continue
+                packet_channel, length = struct.unpack('>BH', self._read(3))
+                packet = self._read(length)
+                if packet_channel == channel:
+                    yield packet
+        except (ConnectionError, OSError):
+            if self._closed:
+                return
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Close the connection, the iteration stops.
+
+        """
+        self._closed = True
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+
+    def _get_control_url(self, base_url, sdp):
+        """
+        Private method for getting the url of the application track.
+
+        """
+        control = None
+        in_application = False
+        for line in sdp.splitlines():
+            if line.startswith('m='):
+                in_application = line.startswith('m=application')
+            elif in_application and line.startswith('a=control:'):
+                control = line[len('a=control:'):].strip()
+                break
+        if control is None:
+            raise ConnectionError('No application track in %s' % self.url)
+        if control == '*':
+            return base_url
+        if '://' in control:
+            return control
+        if not base_url.endswith('/'):
+            base_url += '/'
+        return urljoin(base_url, control)
+
+    def _send(self, method, url, headers):
+        self._cseq += 1
+        lines = ['%s %s RTSP/1.0' % (method, url), 'CSeq: %d' % self._cseq]
+        lines += ['%s: %s' % item for item in headers.items()]
+        self._sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode())
+
+    def _request(self, method, url, headers):
+        """
+        Private method for sending a request and reading its response.
+
+        Returns
+        -------
+        (dict, bytes)
+            Headers with lower case names, and body.
+
+        """
+        self._send(method, url, headers)
+        response, body = self._read_response()
+        self.logger.info('RTSP %s: %s' % (method, response['status']))
+        if ' 200 ' not in response['status'] + ' ':
+            raise ConnectionError('RTSP %s %s failed: %s'
+                                  % (method, url, response['status']))
+        return response, body
+
+    def _read_response(self, first_byte=b''):
+        status = (first_byte + self._readline()).decode().strip()
+        if not status:
+            raise ConnectionError('RTSP connection closed')
+        response = {'status': status}
+        while True:
+            line = self._readline().decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response[name.strip().lower()] = value.strip()
+        body = self._read(int(response.get('content-length', 0)))
+        return response, body
+
+    def _wait_data(self, timeout):
+        """
+        Private method waiting at most `timeout` seconds for data, so the
+        keep-alive is sent while the stream is idle.
+
+        Returns
+        -------
+        bool
+            False on timeout.
+
+        """
+        self._sock.settimeout(min(timeout, self.timeout))
+        try:
+            self._fill()
+        except socket.timeout:
+            return False
+        finally:
+            self._sock.settimeout(self.timeout)
+        return True
+
+    def _fill(self):
+        data = self._sock.recv(65536)
+        if not data:
+            raise ConnectionError('RTSP connection closed')
+        self._buffer += data
+
+    def _read(self, length):
+        while len(self._buffer) < length:
+            self._fill()
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        return data
+
+    def _readline(self):
+        while True:
+            end = self._buffer.find(b'\n')
+            if end >= 0:
+                return self._read(end + 1)
+            self._fill()
+
+
+class PcapMetadataSource(object):
+    """
+    This is a class for reading a recorded VA metadata stream.
+
+    Iterates over the UDP payloads of a pcap capture, the RTP packets of
+    the stream.
+
+    Attributes
+    ----------
+    path : str
+        Path of the pcap file.
+
+    """
+
+    _ETHERNET = 1
+    _RAW = (101, 228)
+    _LINUX_SLL = 113
+
+    def __init__(self, path):
+        """
+        This is the constructor for the `PcapMetadataSource` class.
+
+        """
+        self.path = path
+        self._closed = False
+
+    def __iter__(self):
+        """
+        Yields
+        ------
+        bytes
+            RTP packet.
+
+        """
+        with open(self.path, 'rb') as pcap:
+            header = pcap.read(24)
+            if header[:4] in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+                endian = '<'
+            elif header[:4] in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+                endian = '>'
+            else:
+                raise ValueError('%s is not a pcap file' % self.path)
+            link_type = struct.unpack(endian + 'I', header[20:24])[0]
+            while not self._closed:
+                record = pcap.read(16)
+                if len(record) < 16:
+                    return
+                length = struct.unpack(endian + 'IIII', record)[2]
+                payload = self._get_udp_payload(pcap.read(length), link_type)
+                if payload is not None:
+                    yield payload
+
+    def close(self):
+        """
+        Stop the iteration.
+
+        """
+        self._closed = True
+
+    def _get_udp_payload(self, frame, link_type):
+        """
+        Private method for getting the payload of an UDP datagram.
+
+        """
+        if link_type == self._ETHERNET:
+            offset = 12
+            while frame[offset:offset + 2] == b'\x81\x00':  # VLAN
+                offset += 4
+            ether_type = frame[offset:offset + 2]
+            packet = frame[offset + 2:]
+        elif link_type == self._LINUX_SLL:
+            ether_type = frame[14:16]
+            packet = frame[16:]
+        elif link_type in self._RAW:
+            ether_type = None
+            packet = frame
+        else:
+            return None
+
+        if not packet:
+            return None
+        version = packet[0] >> 4
+        if version == 4 and ether_type in (None, b'\x08\x00'):
+            header_length = (packet[0] & 0x0f) * 4
+            total_length = struct.unpack('>H', packet[2:4])[0]
+            if packet[9] != 17:
+                return None
+            datagram = packet[header_length:total_length]
+        elif version == 6 and ether_type in (None, b'\x86\xdd'):
+            if packet[6] != 17:
+                return None
+            datagram = packet[40:]
+        else:
+            return None
+        udp_length = struct.unpack('>H', datagram[4:6])[0]
+        return datagram[8:udp_length]
+
+
 class VideoInferenceIterator(object):
     """
     This is a class for inference generator.
@@ -140,11 +603,9 @@ class VideoInferenceIterator(object):
         """
         self.preview_width = preview_width
         self.preview_height = preview_height
-        #: str: Holds the JSON inference metadata obtained from the camera
-        self._json_str = ""
-        #: subprocess: object where gstreamer pipeline for capture inference
-        #:             stream is run.
-        self._sub_proc = None
+        #: RtspMetadataSource or PcapMetadataSource: source of the inference
+        #:     stream being read.
+        self._source = None
         self.logger = logging.getLogger('iotccsdk')
 
     def start(self, result_src):
@@ -152,11 +613,13 @@ class VideoInferenceIterator(object):
         This is the inference generator method
 
         It gets inferences from the RTSP VA stream from the camera.
+        RTP packets are read in process, and the JSON metadata is framed
+        incrementally.
 
         Parameters
         ----------
         result_src : str
-            VA RTSP stream url.
+            VA RTSP stream url, or path of a pcap recording of the stream.
 
         Yields
         ------
@@ -170,82 +633,61 @@ class VideoInferenceIterator(object):
             Any exception that occurs during inference handling.
 
         """
-        cmd = ['gst-launch-1.0 ',
-               ' -q ',
-               ' rtspsrc ',
-               ' location=%s' % result_src,
-               ' protocols=tcp ',
-               ' ! ',
-               ' application/x-rtp, media=application ',
-               ' ! ',
-               ' fakesink ',
-               ' dump=true']
-        cmd = ''.join(cmd)
         self.logger.info('result_src: %s' % result_src)
-        self.logger.info('gstreamer cmd: %s' % str(cmd))
-        platform = sys.platform
-        platform = platform.lower()
-        self.logger.info('Platform: %s' % platform)
-        if 'win' in platform:
-            data_idx = 78
-        elif 'linux' in platform:
-            data_idx = 72
+        if result_src.endswith('.pcap'):
+            self._source = PcapMetadataSource(result_src)
+        else:
+            self._source = RtspMetadataSource(result_src)
+        framer = JsonObjectFramer()
 
         try:
-            self._sub_proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
-                                              stderr=subprocess.PIPE, bufsize=1,
-                                              universal_newlines=True)
-            for line in self._sub_proc.stdout:
-                if 'ERROR' in line or 'error' in line:
-                    raise Exception(line)
-                l_str = line[data_idx:]
-                l_str = l_str.strip(os.linesep)
-                self.logger.debug(l_str)
-                if ":[" in self._json_str and "] }" in self._json_str + l_str:
+            for packet in self._source:
+                payload = get_rtp_payload(packet)
+                if not payload:
+                    continue
+                for metadata in framer.feed(payload):
+                    result = self._get_inference_result(metadata)
                     # Only yield if objects are present in the inferences
-                    self._json_str = self._json_str + l_str
-                    s_idx = self._json_str.index('{ "')
-                    e_idx = self._json_str.index("] }") + 3
-                    self._json_str = self._json_str[s_idx:e_idx]
-                    self.logger.debug(self._json_str)
-                    result = self._get_inference_result()
-                    self._json_str = ""
-                    yield result
-                elif (":[" not in self._json_str
-                      and '{ "' in self._json_str
-                      and " }" in self._json_str + l_str):
-                    self._json_str = ""
-                else:
-                    self._json_str = self._json_str + l_str
-        except (Exception, subprocess.CalledProcessError) as e:
+                    if result is not None:
+                        yield result
+        except Exception as e:
             self.logger.exception(e)
             raise
+        finally:
+            self._source.close()
 
     def stop(self):
         """
         This method stops the inference generator.
 
         """
-        if self._sub_proc:
-            self._sub_proc.terminate()
+        if self._source:
+            self._source.close()
 
-    def _get_inference_result(self):
+    def _get_inference_result(self, j):
         """
         Private method for creating `CameraInference` object
 
         This method extracts the inference result from the
-        VA json metadata string.
+        VA json metadata.
+
+        Parameters
+        ----------
+        j : dict
+            VA json metadata.
 
         Returns
         -------
         CameraInference
             `CameraInference` object with extracted values on success.
-            `CameraInference` object with None if the json_str does not
-            have any values or there is a malformed string.
+            `CameraInference` object with None if there are malformed
+            values.
+            None if the metadata has no objects.
 
         """
         try:
-            j = json.loads(self._json_str)
+            if "objects" not in j:
+                return None
             objects = []
             for object in j["objects"]:
                 x = (object["position"]["x"] * self.preview_width) / 10000
@@ -45,6 +45,9 @@ LOGOUT_PATH = "logout"
 POST_METHOD = "post"
 GET_METHOD = "get"
 ALL_METHODS = [POST_METHOD, GET_METHOD]
+# Keep-alive connections kept to the webserver, one is used at a time unless
+# the provider is shared between threads.
+IPC_POOL_SIZE = 4
 
 
 class IpcProvider():
@@ -76,6 +79,14 @@ class IpcProvider():
         #:      camera/QMMF IPC webserver .
         self._session_token = None
         self._heartbeat_manager = None
+        #: requests.Session: Long-lived session, its connections are kept
+        #:                   alive and reused by every request.
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=IPC_POOL_SIZE)
+        self._session.mount("http://", adapter)
+        #: int: Requests sent to the webserver.
+        self.request_count = 0
         self.logger = logging.getLogger("iotccsdk")
 
     def _show_error(self, err_msg):
@@ -175,6 +186,48 @@ class IpcProvider():
 
         return self.__send_request(POST_METHOD, path, payload, param)
 
+    def batch(self, calls):
+        """
+        Batched API for QMMF IPC webserver.
+
+        Sends the calls in order over the kept-alive connection, and stops
+        at the first one which fails.
+
+        Parameters
+        ----------
+        calls : list of (str, str, dict)
+            Method, path and payload of each call, in the order they must
+            be applied.
+
+        Returns
+        -------
+        responses: list of dict
+            responses of the calls sent, the last one failed if there are
+            fewer responses than calls.
+
+        Raises
+        ------
+        ConnectionError
+            When response is malformed
+        Exception
+            Any exception that occurs during the request.
+        """
+        responses = []
+        for method, path, payload in calls:
+            response = self.__send_request(method, path, payload, None)
+            responses.append(response)
+            if not response.get("status", response.get("Status")):
+                self._show_error("%s %s failed: %s" % (method, path, response))
+                break
+        return responses
+
+    def close(self):
+        """
+        Close the connections to the QMMF IPC webserver.
+
+        """
+        self._session.close()
+
     def __send_request(self, method, path, payload, params):
         """
         private method to send requests to QMMF IPC webserver.
@@ -211,21 +264,21 @@ class IpcProvider():
         headers = {"Cookie": self._session_token}
         self.logger.info("API: %s data %s" % (url, payload))
         try:
-            with requests.session() as mysession:
-                if method.lower() == POST_METHOD:
-                    response = mysession.post(
-                        url, data=json.dumps(payload), headers=headers, params=params)
-                else:
-                    response = mysession.get(
-                        url, data=json.dumps(payload), headers=headers, params=params)
-                if response.status_code != requests.codes.ok:
-                    self.logger.info("RESPONSE: %s" % response.text)
-
-                result = response.json()
-                if "status" not in result and "Status" not in result:
-                    raise requests.ConnectionError(
-                        "Call with method: %s to: %s returned malformed response: %s" %
-                        (method, url, response))
+            self.request_count += 1
+            if method.lower() == POST_METHOD:
+                response = self._session.post(
+                    url, data=json.dumps(payload), headers=headers, params=params)
+            else:
+                response = self._session.get(
+                    url, data=json.dumps(payload), headers=headers, params=params)
+            if response.status_code != requests.codes.ok:
+                self.logger.info("RESPONSE: %s" % response.text)
+
+            result = response.json()
+            if "status" not in result and "Status" not in result:
+                raise requests.ConnectionError(
+                    "Call with method: %s to: %s returned malformed response: %s" %
+                    (method, url, response))
             return result
         except Exception as e:
             self.logger.exception(e)
@@ -257,37 +310,37 @@ class IpcProvider():
             # This is to clear out previous session before starting a new one
             self.logout()
 
-        with requests.session() as mysession:
-            try:
-                url = self._build_url(LOGIN_PATH)
-                payload = {"username": self.username, "userpwd": self.password}
-                self.logger.info("API: %s data: %s" % (url, payload))
-                response = mysession.post(url, json.dumps(payload))
-                self.logger.info("Login response: %s" % response.text)
-                result = response.json()
-                if "status" in result and result["status"]:
-                    self._session_token = response.headers["Set-Cookie"]
-                    self.logger.info(
-                        "connection established with session token: [%s]" % self._session_token)
-                    self._heartbeat_manager = HeartBeatManager(
-                        self.host, self._session_token)
-                    return True
-                else:
-                    raise requests.ConnectionError(
-                        "Failed to connect. Server returned status=False")
-
-            except requests.exceptions.Timeout:
-                # TODO: user should have a way to figure out if required services are running?
-                # maybe some simple URL
-                self.logger.error(
-                    "Timeout: Please check the device is running and the IPC service is available")
-                raise
-            except requests.exceptions.RequestException as e:
-                self.logger.exception(e.strerror)
-                raise
-            except Exception as e:
-                self.logger.exception(e)
-                raise
+        try:
+            url = self._build_url(LOGIN_PATH)
+            payload = {"username": self.username, "userpwd": self.password}
+            self.logger.info("API: %s data: %s" % (url, payload))
+            self.request_count += 1
+            response = self._session.post(url, json.dumps(payload))
+            self.logger.info("Login response: %s" % response.text)
+            result = response.json()
+            if "status" in result and result["status"]:
+                self._session_token = response.headers["Set-Cookie"]
+                self.logger.info(
+                    "connection established with session token: [%s]" % self._session_token)
+                self._heartbeat_manager = HeartBeatManager(
+                    self.host, self._session_token)
+                return True
+            else:
+                raise requests.ConnectionError(
+                    "Failed to connect. Server returned status=False")
+
+        except requests.exceptions.Timeout:
+            # TODO: user should have a way to figure out if required services are running?
+            # maybe some simple URL
+            self.logger.error(
+                "Timeout: Please check the device is running and the IPC service is available")
+            raise
+        except requests.exceptions.RequestException as e:
+            self.logger.exception(e.strerror)
+            raise
+        except Exception as e:
+            self.logger.exception(e)
+            raise
 
     def logout(self):
         """
@@ -18,8 +18,11 @@ from . properties import Properties
 from . model_utility import ModelUtility
 from . inference import Inference
 from . iot_hub_manager import IotHubManager
+from . snapshot_uploader import SnapshotUploader
+from . telemetry import TelemetryAggregator
 from iotccsdk import CameraClient
 from iothub_client import IoTHubTransportProvider, IoTHubError
+import json
 import time
 from azure.storage.blob import BlockBlobService, PublicAccess
 import os
@@ -32,8 +35,12 @@ camera_client = None
 iot_hub_manager = None
 properties = None
 model_util = None
+snapshot_uploader = None
+telemetry_aggregator = None
 
 STORAGE_ACCOUNT_CONNECTION_STRING = os.environ.get('STORAGE_ACCOUNT_CONNECTION_STRING')
+# The module runs next to a single camera
+CAMERA_ID = os.environ.get('IOTEDGE_DEVICEID', 'camera')
 
 
 def create_camera(ip_address=None, username="admin", password="admin"):
@@ -56,32 +63,51 @@ def create_camera(ip_address=None, username="admin", password="admin"):
         password=password)
 
 
-def print_inference(result=None, hub_manager=None, last_sent_time=time.time(), block_blob_service=None, container_name=None):
+def print_inference(result=None, hub_manager=None, last_sent_time=time.time()):
     global properties
-    if (time.time() - last_sent_time <= properties.model_properties.message_delay_sec
-            or result is None
+    if (result is None
             or result.objects is None
             or len(result.objects) == 0):
         return last_sent_time
 
+    model_props = properties.model_properties
+    detections = []
     for inf_obj in result.objects:
-        print("Found result object")
         inference = Inference(inf_obj)
-        if (properties.model_properties.is_object_of_interest(inference.label)):
-            print(str(camera_client.captureimagetoblob(block_blob_service, container_name)))
-            json_message = inference.to_json()
-            iot_hub_manager.send_message_to_upstream(json_message)
-            print(json_message)
-            last_sent_time = time.time()
+        if (model_props.is_object_of_interest(inference.label)):
+            detections.append((
+                inference.label,
+                inference.confidence,
+                (inference.position_x, inference.position_y,
+                 inference.width, inference.height)))
+    if not detections:
+        return last_sent_time
+
+    # one message per window, whatever the number of detections
+    telemetry_aggregator.window = model_props.message_delay_sec
+    telemetry_aggregator.add(CAMERA_ID, result.timestamp, detections)
+
+    if time.time() - last_sent_time > model_props.message_delay_sec:
+        # one snapshot per window, uploaded in the background
+        snapshot_uploader.request(camera_client, result.timestamp)
+        last_sent_time = time.time()
     return last_sent_time
 
 
+def send_telemetry(message):
+    json_message = json.dumps(message)
+    iot_hub_manager.send_message_to_upstream(json_message)
+    print(json_message)
+
+
 def main(protocol):
     global ipc_provider
     global camera_client
     global iot_hub_manager
     global properties
     global model_util
+    global snapshot_uploader
+    global telemetry_aggregator
 
     block_blob_service = BlockBlobService(connection_string=STORAGE_ACCOUNT_CONNECTION_STRING)
 
@@ -91,6 +117,8 @@ def main(protocol):
 
     block_blob_service.set_container_acl(container_name, public_access=PublicAccess.Container)
 
+    snapshot_uploader = SnapshotUploader(block_blob_service, container_name)
+    telemetry_aggregator = TelemetryAggregator(send_telemetry)
 
     print("Create model_util")
     model_util = ModelUtility()
@@ -119,7 +147,7 @@ def main(protocol):
                             with camera_client.get_inferences() as results:
                                 for result in results:
                                     last_time = print_inference(
-                                        result, iot_hub_manager, last_time, block_blob_service, container_name)
+                                        result, iot_hub_manager, last_time)
                     except EOFError:
                         print("EOFError. Current VAM running state is %s." %
                               camera_client.vam_running)
@@ -142,6 +170,8 @@ def main(protocol):
                 return
             finally:
                 print("Try to clean up before the end")
+                print("Snapshots: %s" % snapshot_uploader.get_metrics())
+                print("Telemetry: %s" % telemetry_aggregator.get_metrics())
                 if camera_client is not None:
                     camera_client.set_overlay_state(SETTING_OFF)
                     camera_client.set_analytics_state(SETTING_OFF)
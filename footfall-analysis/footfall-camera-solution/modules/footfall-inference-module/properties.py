@@ -1,6 +1,5 @@
 import json
 import math
-import time
 from iotccsdk import CameraClient
 from . error_utils import log_unknown_exception, CameraClientError
 from . model_utility import ModelUtility
@@ -132,27 +131,20 @@ class CameraProperties:
 
         print("Configuring camera_client")
 
-        self.__turn_camera_off(camera_client)
-
-        self.__configure_preview(camera_client)
-
-        if self.preview_state:
-            # set overlay config then turn it on/off
-            print("configure_overlay: %s" % self.overlay_config)
-            camera_client.configure_overlay(self.overlay_config)
-            print("configure_overlay_state: %s" % self.__overlay_state)
-            camera_client.set_overlay_state(self.__overlay_state)
-
-        print(str(camera_client.captureimage()))
-
-        # TODO: it seems that analytics can't restart unless preview is bounced
-        # need to handle that case
-        print("set_analytics_state: %s" % self.__analytics_state)
-        if not camera_client.set_analytics_state(self.__analytics_state):
-            print("Failed to set vam_running state to: %s" %
-                  self.analytics_state)
+        # only the settings which changed are sent to the camera
+        if not camera_client.apply_configuration(
+                resolution=self.resolution,
+                encode=self.codec,
+                bitrate=self.bitrate,
+                framerate=self.framerate,
+                display_out=self.__display_out,
+                preview_state=self.__preview_state,
+                overlay_config=self.overlay_config,
+                overlay_state=self.__overlay_state,
+                analytics_state=self.__analytics_state,
+                restart_analytics=is_model_changed):
             raise CameraClientError(
-                "VAM failed to start in configure_camera_client")
+                "Failed to apply the camera configuration in configure_camera_client")
 
         # update properties from the camera
         self.update_camera_properties(camera_client)
@@ -219,56 +211,6 @@ class CameraProperties:
             else:
                 props.append({prop_name: prop_val})
 
-    # turn off preview, overlay and analytics
-    def __turn_camera_off(self, camera_client: CameraClient):
-        camera_client.set_overlay_state(SETTING_OFF)
-        count = 0
-        print("Turning analytics off")
-        while camera_client.vam_running and count < 5:
-            print("Retrying analytics off: %s" % count)
-            camera_client.set_analytics_state(SETTING_OFF)
-            count += 1
-            time.sleep(1)
-
-    def __configure_preview(self, camera_client: CameraClient):
-        if (camera_client.cur_resolution == self.resolution
-                and camera_client.cur_codec == self.codec
-                and camera_client.cur_bitrate == self.bitrate
-                and camera_client.cur_framerate == self.framerate
-                and camera_client.display_out == self.__display_out
-                and camera_client.preview_running == self.preview_state):
-            return
-
-        count = 0
-        print("Turning preview off")
-        if not camera_client.set_preview_state(SETTING_OFF):
-            raise CameraClientError("Failed to stop preview")
-        while camera_client.preview_running and count < 5:
-            print("Waiting for preview to stop: %s" % count)
-            count += 1
-            time.sleep(1)
-
-        print(
-            "Configure preview (%s, %s, %s, %s, %s)" %
-            (self.resolution,
-             self.codec,
-             self.bitrate,
-             self.framerate,
-             self.__display_out))
-
-        camera_client.configure_preview(
-            resolution=self.resolution,
-            encode=self.codec,
-            bitrate=self.bitrate,
-            framerate=self.framerate,
-            display_out=self.__display_out)
-
-        print("set preview state: %s" % self.__preview_state)
-        if not camera_client.set_preview_state(self.__preview_state):
-            raise CameraClientError(
-                ("failed to set the preview state to %s"
-                    % self.__preview_state))
-
     def __has_preview_changed(self, camera_client: CameraClient):
         return (camera_client.cur_resolution != self.resolution
                 or camera_client.cur_codec != self.codec
@@ -0,0 +1,152 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE file in the project root for
+# full license information.
+
+import queue
+import threading
+import time
+
+# Snapshots waiting for the camera, the oldest is dropped when full
+SNAPSHOT_QUEUE_SIZE = 8
+# Snapshots waiting for upload, the capture waits when full
+SNAPSHOT_UPLOAD_QUEUE_SIZE = 8
+SNAPSHOT_UPLOAD_WORKERS = 2
+SNAPSHOT_UPLOAD_RETRIES = 3
+SNAPSHOT_UPLOAD_RETRY_DELAY_IN_SECONDS = 1
+
+
+class SnapshotUploader(object):
+    """
+    Capture camera snapshots and upload them to a blob container in the
+    background.
+
+    One snapshot is taken per inference timestamp, whatever the number of
+    objects of interest in it. A capture thread takes the snapshots in
+    order and upload threads push them to the container, with retries.
+    """
+
+    def __init__(self, block_blob_service, container_name,
+                 queue_size=SNAPSHOT_QUEUE_SIZE,
+                 upload_queue_size=SNAPSHOT_UPLOAD_QUEUE_SIZE,
+                 workers=SNAPSHOT_UPLOAD_WORKERS,
+                 retries=SNAPSHOT_UPLOAD_RETRIES,
+                 retry_delay=SNAPSHOT_UPLOAD_RETRY_DELAY_IN_SECONDS):
+        self.block_blob_service = block_blob_service
+        self.container_name = container_name
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.capture_queue = queue.Queue(queue_size)
+        self.upload_queue = queue.Queue(upload_queue_size)
+        self.mutex = threading.Lock()
+        self.last_timestamp = None
+        self.threads = []
+        self.counters = {
+            "requested": 0,
+            "deduplicated": 0,
+            "dropped": 0,
+            "captured": 0,
+            "uploaded": 0,
+            "retried": 0,
+            "failed": 0,
+        }
+
+    def _count(self, name, value=1):
+        with self.mutex:
+            self.counters[name] += value
+
+    def start(self):
+        with self.mutex:
+            if self.threads:
+                return
+            self.threads.append(threading.Thread(
+                name="snapshot_capture", target=self.__capture_loop))
+            for index in range(self.workers):
+                self.threads.append(threading.Thread(
+                    name="snapshot_upload_%d" % index,
+                    target=self.__upload_loop))
+            for thread in self.threads:
+                thread.daemon = True
+                thread.start()
+
+    def request(self, camera_client, timestamp):
+        """
+        Queue a snapshot of the inference at timestamp, return False if
+        one was already queued for it.
+        """
+        self.start()
+        with self.mutex:
+            self.counters["requested"] += 1
+            if timestamp is not None and timestamp == self.last_timestamp:
+                self.counters["deduplicated"] += 1
+                return False
+            self.last_timestamp = timestamp
+
+        item = (camera_client, timestamp)
+        while True:
+            try:
+                self.capture_queue.put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+            # keep the latest snapshots
+            try:
+                self.capture_queue.get_nowait()
+                self.capture_queue.task_done()
+                self._count("dropped")
+            except queue.Empty:
+                pass
+
+    def __capture_loop(self):
+        while True:
+            camera_client, timestamp = self.capture_queue.get()
+            try:
+                snapshot = camera_client.capture_snapshot()
+                if snapshot is None:
+                    self._count("failed")
+                else:
+                    self._count("captured")
+                    self.upload_queue.put(snapshot)
+            except Exception as ex:
+                print("Snapshot capture failed for %s: %s" % (timestamp, ex))
+                self._count("failed")
+            finally:
+                self.capture_queue.task_done()
+
+    def __upload_loop(self):
+        while True:
+            file_name, data = self.upload_queue.get()
+            try:
+                self.__upload(file_name, data)
+            finally:
+                self.upload_queue.task_done()
+
+    def __upload(self, file_name, data):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count("retried")
+                time.sleep(self.retry_delay * attempt)
+            try:
+                self.block_blob_service.create_blob_from_bytes(
+                    self.container_name, file_name, data)
+                self._count("uploaded")
+                return True
+            except Exception as ex:
+                print("Snapshot upload of %s failed (attempt %d): %s"
+                      % (file_name, attempt + 1, ex))
+        self._count("failed")
+        return False
+
+    def join(self):
+        """
+        Wait for the queued snapshots to be uploaded.
+        """
+        self.capture_queue.join()
+        self.upload_queue.join()
+
+    def get_metrics(self):
+        with self.mutex:
+            metrics = dict(self.counters)
+        metrics["capture_queue"] = self.capture_queue.qsize()
+        metrics["upload_queue"] = self.upload_queue.qsize()
+        return metrics
@@ -0,0 +1,163 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE file in the project root for
+# full license information.
+
+import json
+import threading
+import time
+
+# One message per camera and window
+TELEMETRY_WINDOW_IN_SECONDS = 6
+# IoT Hub messages are limited to 256KB, a window is flushed early when its
+# message would grow past this size
+TELEMETRY_MAX_MESSAGE_SIZE = 64 * 1024
+# Digits kept for scores and box coordinates
+TELEMETRY_PRECISION = 3
+# Expired windows are checked every window, within these bounds so a window
+# of 0 does not spin
+TELEMETRY_MIN_CHECK_INTERVAL_IN_SECONDS = 0.1
+TELEMETRY_MAX_CHECK_INTERVAL_IN_SECONDS = 1
+
+
+class TelemetryAggregator(object):
+    """
+    Aggregate detections per camera into one message per time window.
+
+    A message carries the number of frames and detections, the detections
+    per label and the boxes per label as [score, b0, b1, b2, b3] arrays:
+
+        {"cameraId": "cam", "start": 1, "end": 9, "frames": 3, "count": 4,
+         "labels": {"person": 4}, "boxes": {"person": [[0.9, 1, 2, 3, 4]]}}
+
+    send(message) is called from a background thread at the end of each
+    window, or from add() when the message reaches max_message_size.
+    """
+
+    def __init__(self, send, window=TELEMETRY_WINDOW_IN_SECONDS,
+                 max_message_size=TELEMETRY_MAX_MESSAGE_SIZE,
+                 precision=TELEMETRY_PRECISION):
+        self.send = send
+        self.window = window
+        self.max_message_size = max_message_size
+        self.precision = precision
+        self.mutex = threading.Lock()
+        self.windows = {}
+        self.worker = None
+        self.counters = {
+            "detections": 0,
+            "frames": 0,
+            "messages": 0,
+            "early_flushes": 0,
+            "failed": 0,
+        }
+
+    def start(self):
+        with self.mutex:
+            if self.worker is not None:
+                return
+            self.worker = threading.Thread(
+                name="telemetry_aggregator", target=self.__run)
+            self.worker.daemon = True
+            self.worker.start()
+
+    def __new_window(self, camera_id, timestamp):
+        message = {
+            "cameraId": camera_id,
+            "start": timestamp,
+            "end": timestamp,
+            "frames": 0,
+            "count": 0,
+            "labels": {},
+            "boxes": {},
+        }
+        return {
+            "opened": time.time(),
+            "message": message,
+            "size": len(json.dumps(message)),
+        }
+
+    def __round(self, value):
+        value = round(float(value), self.precision)
+        return int(value) if value.is_integer() else value
+
+    def add(self, camera_id, timestamp, detections):
+        """
+        Add the detections of one frame.
+
+        detections is a list of (label, score, box), box being a sequence
+        of coordinates.
+        """
+        self.start()
+        entries = [(str(label), [self.__round(score)]
+                    + [self.__round(value) for value in box])
+                   for label, score, box in detections]
+        # upper bound of the size of the entries in the serialized message
+        sizes = [len(json.dumps(entry)) + len(label) + 12
+                 for label, entry in entries]
+
+        outgoing = []
+        with self.mutex:
+            self.counters["frames"] += 1
+            self.counters["detections"] += len(entries)
+            current = self.windows.get(camera_id)
+            if current is None:
+                current = self.windows[camera_id] = self.__new_window(
+                    camera_id, timestamp)
+            current["message"]["frames"] += 1
+            for (label, entry), size in zip(entries, sizes):
+                if (current["message"]["count"]
+                        and current["size"] + size > self.max_message_size):
+                    outgoing.append(self.windows.pop(camera_id)["message"])
+                    self.counters["early_flushes"] += 1
+                    current = self.windows[camera_id] = self.__new_window(
+                        camera_id, timestamp)
+                    current["message"]["frames"] = 1
+                message = current["message"]
+                message["end"] = timestamp
+                message["count"] += 1
+                message["labels"][label] = message["labels"].get(label, 0) + 1
+                message["boxes"].setdefault(label, []).append(entry)
+                current["size"] += size
+        for message in outgoing:
+            self.__send(message)
+
+    def flush(self, camera_id=None, expired_only=False):
+        """
+        Send the messages of a camera, or every camera, and start new
+        windows. With expired_only only windows older than window are sent.
+        """
+        now = time.time()
+        outgoing = []
+        with self.mutex:
+            for key in list(self.windows):
+                if camera_id is not None and key != camera_id:
+                    continue
+                if expired_only and now - self.windows[key]["opened"] < self.window:
+                    continue
+                outgoing.append(self.windows.pop(key)["message"])
+        for message in outgoing:
+            self.__send(message)
+
+    def __send(self, message):
+        try:
+            self.send(message)
+            with self.mutex:
+                self.counters["messages"] += 1
+        except Exception as ex:
+            print("Exception sending telemetry for %s: %s"
+                  % (message["cameraId"], ex))
+            with self.mutex:
+                self.counters["failed"] += 1
+
+    def __run(self):
+        while True:
+            time.sleep(min(max(self.window,
+                                   TELEMETRY_MIN_CHECK_INTERVAL_IN_SECONDS),
+                               TELEMETRY_MAX_CHECK_INTERVAL_IN_SECONDS))
+            self.flush(expired_only=True)
+
+    def get_metrics(self):
+        with self.mutex:
+            metrics = dict(self.counters)
+            metrics["windows"] = len(self.windows)
+        return metrics
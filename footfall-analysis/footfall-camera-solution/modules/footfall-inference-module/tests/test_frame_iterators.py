@@ -0,0 +1,236 @@
+"""VA metadata framing and VideoInferenceIterator tests.
+
+    python3 -m pytest tests/test_frame_iterators.py
+"""
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+# Import the module alone, the iotccsdk package needs the camera SDK
+# dependencies.
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'iotccsdk'))
+from frame_iterators import (  # noqa: E402
+    JsonObjectFramer, RtspMetadataSource, VideoInferenceIterator,
+    get_rtp_payload)
+
+PREVIEW_WIDTH = 1920
+PREVIEW_HEIGHT = 1080
+
+
+def make_message(timestamp, n_objects):
+    objects = ', '.join(
+        '{ "id": "%d", "display_name": "person", "confidence": %d, '
+        '"position": { "x": 5000, "y": 2000, "width": 1000, "height": 5000 } }'
+        % (i, 60 + i) for i in range(n_objects))
+    return '{ "timestamp": %d, "objects":[ %s ] }' % (timestamp, objects)
+
+
+def make_rtp_packet(payload, seq=0, csrc=(), extension=None, padding=0):
+    first = 0x80 | len(csrc)
+    header = b''.join(struct.pack('>I', source) for source in csrc)
+    if extension is not None:
+        first |= 0x10
+        header += struct.pack('>HH', 0xbede, len(extension) // 4) + extension
+    if padding:
+        first |= 0x20
+        payload += b'\x00' * (padding - 1) + bytes([padding])
+    return struct.pack('>BBHII', first, 107, seq, 0, 0x1234abcd) + header \
+        + payload
+
+
+def write_pcap(path, packets):
+    """Ethernet / IPv4 / UDP capture of the RTP packets."""
+    with open(path, 'wb') as pcap:
+        pcap.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for packet in packets:
+            udp = struct.pack('>HHHH', 50000, 50002, 8 + len(packet), 0) \
+                + packet
+            ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0,
+                             64, 17, 0, b'\x7f\x00\x00\x01',
+                             b'\x7f\x00\x00\x01') + udp
+            frame = b'\x00' * 12 + b'\x08\x00' + ip
+            pcap.write(struct.pack('<IIII', 0, 0, len(frame), len(frame)))
+            pcap.write(frame)
+
+
+def feed_all(framer, chunks):
+    objects = []
+    for chunk in chunks:
+        objects.extend(framer.feed(chunk))
+    return objects
+
+
+def test_framer_split_across_packets():
+    data = (make_message(1, 3) + make_message(2, 0)).encode()
+    for size in [1, 7, 64, len(data)]:
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        objects = feed_all(JsonObjectFramer(), chunks)
+        assert [obj['timestamp'] for obj in objects] == [1, 2]
+        assert len(objects[0]['objects']) == 3
+
+
+def test_framer_split_utf8_character():
+    data = '{ "display_name": "café" }'.encode()
+    split = data.index(b'\xc3') + 1
+    objects = feed_all(JsonObjectFramer(), [data[:split], data[split:]])
+    assert objects == [{'display_name': 'café'}]
+
+
+def test_framer_braces_in_strings():
+    messages = ['{ "display_name": "{person", "timestamp": 1 }',
+                '{ "display_name": "}}", "timestamp": 2 }',
+                '{ "display_name": "a } b { c", "timestamp": 3 }']
+    data = ''.join(messages).encode()
+    for size in [1, 5, len(data)]:
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        objects = feed_all(JsonObjectFramer(), chunks)
+        assert [obj['timestamp'] for obj in objects] == [1, 2, 3]
+        assert objects[1]['display_name'] == '}}'
+
+
+def test_framer_skips_malformed_data():
+    framer = JsonObjectFramer()
+    chunks = [b'garbage ', b'{ "timestamp": 1, }', b' \x00\xff ',
+              b'{ "timestamp": 2 }', b'] } trailing',
+              b'{ "timestamp": 3 }']
+    objects = feed_all(framer, chunks)
+    assert [obj['timestamp'] for obj in objects] == [2, 3]
+    assert framer.feed(b'{ "timestamp": 4 }') == [{'timestamp': 4}]
+
+
+def test_framer_drops_large_objects():
+    framer = JsonObjectFramer(max_size=64)
+    assert framer.feed(b'{ "objects": [' + b'1, ' * 100) == []
+    assert framer.feed(b'1] }') == []
+    assert framer.feed(b'{ "timestamp": 1 }') == [{'timestamp': 1}]
+
+
+def test_rtp_payload():
+    payload = b'{ "timestamp": 1 }'
+    assert get_rtp_payload(make_rtp_packet(payload)) == payload
+    assert get_rtp_payload(make_rtp_packet(
+        payload, csrc=(1, 2, 3))) == payload
+    assert get_rtp_payload(make_rtp_packet(
+        payload, extension=b'\x10\xff\x00\x00' * 2)) == payload
+    assert get_rtp_payload(make_rtp_packet(payload, padding=4)) == payload
+    assert get_rtp_payload(make_rtp_packet(
+        payload, csrc=(1,), extension=b'\x00' * 4, padding=1)) == payload
+
+
+def test_rtp_payload_invalid():
+    assert get_rtp_payload(b'') is None
+    assert get_rtp_payload(b'\x80' * 11) is None
+    # Version 1
+    assert get_rtp_payload(b'\x40' + b'\x00' * 20) is None
+    # Truncated header extension
+    assert get_rtp_payload(b'\x90' + b'\x00' * 13) is None
+    # Padding larger than the packet
+    assert get_rtp_payload(b'\xa0' + b'\x00' * 10 + b'\xff') is None
+
+
+def test_video_inference_iterator_pcap(tmpdir):
+    messages = [make_message(1, 2), '{ "timestamp": 2 }', make_message(3, 1)]
+    data = ''.join(messages).encode()
+    # Messages spanning packets, with the RTP header options of the camera
+    packets = [make_rtp_packet(data[i:i + 50], seq=i // 50,
+                               csrc=(7,) if i % 100 else (),
+                               padding=3 if i % 150 else 0)
+               for i in range(0, len(data), 50)]
+    packets.insert(2, b'not a RTP packet')
+    path = str(tmpdir.join('va.pcap'))
+    write_pcap(path, packets)
+
+    iterator = VideoInferenceIterator(PREVIEW_WIDTH, PREVIEW_HEIGHT)
+    results = list(iterator.start(path))
+    # The message without objects is not yielded
+    assert [result.timestamp for result in results] == [1, 3]
+    assert [len(result.objects) for result in results] == [2, 1]
+    obj = results[0].objects[1]
+    assert obj.id == '1'
+    assert obj.label == 'person'
+    assert obj.confidence == 61
+    assert obj.position.x == PREVIEW_WIDTH / 2
+    assert obj.position.y == PREVIEW_HEIGHT / 5
+    assert obj.position.width == PREVIEW_WIDTH / 10
+    assert obj.position.height == PREVIEW_HEIGHT / 2
+
+
+class StubRtspServer(object):
+    """
+    RTSP server idle after PLAY, it sends one packet on the first OPTIONS.
+    """
+
+    SDP = 'v=0\r\nm=video 0 RTP/AVP 96\r\na=control:track1\r\n' \
+        'm=application 0 RTP/AVP 107\r\na=control:track2\r\n'
+
+    def __init__(self, session_timeout):
+        self.session_timeout = session_timeout
+        self.methods = []
+        self.times = []
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.url = 'rtsp://127.0.0.1:%d/live' % self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        conn, _ = self.listener.accept()
+        data = b''
+        try:
+            while True:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return
+                data += chunk
+                while b'\r\n\r\n' in data:
+                    request, data = data.split(b'\r\n\r\n', 1)
+                    lines = request.decode().split('\r\n')
+                    self.methods.append(lines[0].split()[0])
+                    self.times.append(time.time())
+                    conn.sendall(self.reply(lines))
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def reply(self, lines):
+        method = lines[0].split()[0]
+        cseq = [line for line in lines if line.startswith('CSeq')][0]
+        headers = ['RTSP/1.0 200 OK', cseq]
+        body = ''
+        if method == 'DESCRIBE':
+            headers.append('Content-Base: %s/' % self.url)
+            body = self.SDP
+        elif method == 'SETUP':
+            headers.append('Session: 1234;timeout=%d'
+                           % self.session_timeout)
+            headers.append('Transport: RTP/AVP/TCP;unicast;interleaved=2-3')
+        headers.append('Content-Length: %d' % len(body))
+        response = ('\r\n'.join(headers) + '\r\n\r\n' + body).encode()
+        if method == 'OPTIONS' and self.methods.count('OPTIONS') == 1:
+            packet = make_rtp_packet(b'{ "timestamp": 1 }')
+            response += b'$' + struct.pack('>BH', 2, len(packet)) + packet
+        return response
+
+
+def test_rtsp_keep_alive_while_idle():
+    server = StubRtspServer(session_timeout=1)
+    source = RtspMetadataSource(server.url, timeout=5)
+    packets = iter(source)
+    start = time.time()
+    packet = next(packets)
+    source.close()
+    server.thread.join(timeout=5)
+    server.listener.close()
+
+    assert get_rtp_payload(packet) == b'{ "timestamp": 1 }'
+    assert server.methods == ['DESCRIBE', 'SETUP', 'PLAY', 'OPTIONS']
+    # Sent after half the session timeout, not after the next packet
+    assert 0.3 < server.times[-1] - start < 2
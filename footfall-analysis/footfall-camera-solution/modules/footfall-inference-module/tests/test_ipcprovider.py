@@ -0,0 +1,230 @@
+"""IpcProvider and CameraClient tests against a local stub QMMF webserver.
+
+    python3 -m pytest tests/test_ipcprovider.py
+"""
+
+import json
+import os
+import socketserver
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from iotccsdk import CameraClient, IpcProvider  # noqa: E402
+
+RESOLUTIONS = ["4K", "1080P", "720P", "480P"]
+CODECS = ["HEVC/H.265", "AVC/H.264"]
+BITRATES = ["512Kbps", "1.5Mbps", "4.0Mbps"]
+FRAMERATES = [24, 30]
+
+
+class StubCamera(object):
+    """State of the stub QMMF webserver."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+        self.video = {
+            "resolutionSelectVal": 1,
+            "encodeModeSelectVal": 1,
+            "bitRateSelectVal": 1,
+            "fpsSelectVal": 1,
+            "displayOut": 0,
+        }
+        self.preview = False
+        self.vam = False
+        self.overlay = False
+        #: POST path => number of calls failing before it succeeds
+        self.failures = {}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.camera.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, response):
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/login":
+            self.send_header("Set-Cookie", "session=stub")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_payload(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length) if length else b""
+        return json.loads(data.decode()) if data else None
+
+    def do_GET(self):
+        camera = self.server.camera
+        self._read_payload()
+        camera.requests.append(("get", self.path))
+        if self.path == "/video":
+            response = dict(camera.video, status=True, resolution=RESOLUTIONS,
+                            encodeMode=CODECS, bitRate=BITRATES, fps=FRAMERATES)
+        elif self.path == "/preview":
+            response = {"status": camera.preview,
+                        "url": "rtsp://127.0.0.1:8900/live"}
+        elif self.path == "/vam":
+            response = {"status": camera.vam,
+                        "url": "rtsp://127.0.0.1:8902/live"}
+        else:
+            response = {"status": False}
+        self._reply(response)
+
+    def do_POST(self):
+        camera = self.server.camera
+        payload = self._read_payload()
+        camera.requests.append(("post", self.path))
+        if camera.failures.get(self.path):
+            camera.failures[self.path] -= 1
+            self._reply({"status": False})
+            return
+        if self.path == "/video":
+            camera.video = payload
+        elif self.path == "/preview":
+            camera.preview = payload["switchStatus"]
+        elif self.path == "/vam":
+            camera.vam = payload["switchStatus"]
+        elif self.path == "/overlay":
+            camera.overlay = payload["switchStatus"]
+        self._reply({"status": True})
+
+
+class StubServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def camera():
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    server.camera = StubCamera()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def provider(camera):
+    provider = IpcProvider("127.0.0.1")
+    provider.host = "127.0.0.1:%d" % camera.server_address[1]
+    yield provider
+    provider.close()
+
+
+def apply(camera_client, **kwargs):
+    configuration = {
+        "resolution": "1080P",
+        "encode": "AVC/H.264",
+        "bitrate": "1.5Mbps",
+        "framerate": 30,
+        "display_out": 1,
+        "preview_state": "on",
+        "overlay_config": "inference",
+        "overlay_state": "on",
+        "analytics_state": "on",
+    }
+    configuration.update(kwargs)
+    return camera_client.apply_configuration(**configuration)
+
+
+def test_keep_alive(camera, provider):
+    for _ in range(10):
+        assert provider.get("/preview")["url"]
+        assert provider.post("/overlay", {"switchStatus": True})["status"]
+    assert len(camera.camera.requests) == 20
+    assert provider.request_count == 20
+    assert camera.camera.connections == 1
+
+
+def test_batch_stops_on_failure(camera, provider):
+    responses = provider.batch([
+        ("post", "/preview", {"switchStatus": True}),
+        ("get", "/unknown", {}),
+        ("post", "/vam", {"switchStatus": True}),
+    ])
+    assert len(responses) == 2
+    assert camera.camera.requests == [("post", "/preview"), ("get", "/unknown")]
+
+
+def test_apply_configuration(camera, provider):
+    camera_client = CameraClient(provider)
+    assert apply(camera_client)
+    assert camera.camera.requests[1:] == [
+        ("post", "/video"),
+        ("post", "/preview"),
+        ("post", "/overlayconfig"),
+        ("post", "/overlay"),
+        ("post", "/vam"),
+        ("get", "/preview"),
+        ("get", "/vam"),
+    ]
+    assert camera.camera.preview and camera.camera.vam and camera.camera.overlay
+    assert camera_client.display_out == 1
+    assert camera_client.preview_running and camera_client.vam_running
+    assert camera_client.vam_url == "rtsp://127.0.0.1:8902/live"
+
+    # Nothing changed, no round trip
+    count = provider.request_count
+    assert apply(camera_client)
+    assert provider.request_count == count
+
+    # New model, only VA is restarted
+    del camera.camera.requests[:]
+    assert apply(camera_client, restart_analytics=True)
+    assert camera.camera.requests == [
+        ("post", "/vam"), ("post", "/vam"), ("get", "/vam")]
+
+    # New bitrate, preview and VA are restarted
+    del camera.camera.requests[:]
+    assert apply(camera_client, bitrate="4.0Mbps")
+    assert camera.camera.requests == [
+        ("post", "/vam"),
+        ("post", "/preview"),
+        ("post", "/video"),
+        ("post", "/preview"),
+        ("post", "/overlayconfig"),
+        ("post", "/overlay"),
+        ("post", "/vam"),
+        ("get", "/preview"),
+        ("get", "/vam"),
+    ]
+    assert camera.camera.video["bitRateSelectVal"] == 2
+    assert camera_client.cur_bitrate == "4.0Mbps"
+    assert camera.camera.connections == 1
+
+
+def test_apply_configuration_retries(camera, provider):
+    camera_client = CameraClient(provider)
+    assert apply(camera_client)
+
+    # The camera is busy stopping VA, the rest of the batch waits for it
+    del camera.camera.requests[:]
+    camera.camera.failures["/vam"] = 2
+    assert apply(camera_client, restart_analytics=True, retry_delay=0)
+    assert camera.camera.requests == [
+        ("post", "/vam"), ("post", "/vam"), ("post", "/vam"), ("post", "/vam"),
+        ("get", "/vam")]
+    assert camera.camera.vam
+
+    # Gives up after the retries
+    del camera.camera.requests[:]
+    camera.camera.failures["/overlay"] = 10
+    assert not apply(camera_client, overlay_state="off", retries=2,
+                     retry_delay=0)
+    assert camera.camera.requests == [
+        ("post", "/overlayconfig"), ("post", "/overlay"),
+        ("post", "/overlay"), ("post", "/overlay")]
@@ -0,0 +1,84 @@
+"""SnapshotUploader tests with stub camera and blob service.
+
+    python3 -m pytest tests/test_snapshot_uploader.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snapshot_uploader import SnapshotUploader  # noqa: E402
+
+
+class StubCameraClient(object):
+    def __init__(self):
+        self.captures = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def capture_snapshot(self):
+        self.release.wait()
+        self.captures += 1
+        return "snapshot_%d.jpg" % self.captures, b"jpeg"
+
+
+class StubBlobService(object):
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.blobs = {}
+
+    def create_blob_from_bytes(self, container_name, blob_name, blob):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("upload failed")
+        self.blobs[(container_name, blob_name)] = blob
+
+
+def test_one_snapshot_per_timestamp():
+    camera_client = StubCameraClient()
+    blob_service = StubBlobService()
+    uploader = SnapshotUploader(blob_service, "container")
+    for timestamp in [1, 1, 1, 2, 2, 3]:
+        uploader.request(camera_client, timestamp)
+    uploader.join()
+    assert sorted(blob_service.blobs) == [
+        ("container", "snapshot_1.jpg"),
+        ("container", "snapshot_2.jpg"),
+        ("container", "snapshot_3.jpg"),
+    ]
+    metrics = uploader.get_metrics()
+    assert metrics["requested"] == 6
+    assert metrics["deduplicated"] == 3
+    assert metrics["uploaded"] == 3
+    assert metrics["capture_queue"] == 0
+
+
+def test_retry():
+    blob_service = StubBlobService(failures=2)
+    uploader = SnapshotUploader(blob_service, "container", retry_delay=0)
+    uploader.request(StubCameraClient(), 1)
+    uploader.join()
+    assert list(blob_service.blobs) == [("container", "snapshot_1.jpg")]
+    metrics = uploader.get_metrics()
+    assert metrics["retried"] == 2
+    assert metrics["failed"] == 0
+
+
+def test_drop_oldest():
+    camera_client = StubCameraClient()
+    camera_client.release.clear()
+    uploader = SnapshotUploader(StubBlobService(), "container", queue_size=2)
+    uploader.request(camera_client, 0)
+    # wait for the capture thread to block on the first snapshot
+    while uploader.capture_queue.qsize():
+        time.sleep(0.01)
+    for timestamp in range(1, 6):
+        uploader.request(camera_client, timestamp)
+    metrics = uploader.get_metrics()
+    assert metrics["dropped"] == 3
+    assert metrics["capture_queue"] == 2
+    camera_client.release.set()
+    uploader.join()
+    assert uploader.get_metrics()["uploaded"] == 3
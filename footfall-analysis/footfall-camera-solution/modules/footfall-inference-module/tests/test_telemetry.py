@@ -0,0 +1,92 @@
+"""TelemetryAggregator tests.
+
+    python3 -m pytest tests/test_telemetry.py
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import telemetry  # noqa: E402
+from telemetry import TelemetryAggregator  # noqa: E402
+
+
+class Sender(object):
+    def __init__(self):
+        self.messages = []
+
+    def __call__(self, message):
+        self.messages.append(json.loads(json.dumps(message)))
+
+
+def make_detections(n, label="person"):
+    return [(label, 0.87654, (i, i + 1, 1200, 3000)) for i in range(n)]
+
+
+def test_one_message_per_window():
+    sender = Sender()
+    aggregator = TelemetryAggregator(sender, window=60)
+    aggregator.add("cam_1", 1, make_detections(2))
+    aggregator.add("cam_1", 2, make_detections(3) + make_detections(1, "dog"))
+    aggregator.add("cam_2", 2, make_detections(1))
+    aggregator.flush(expired_only=True)
+    assert sender.messages == []
+
+    aggregator.flush("cam_1")
+    assert sender.messages == [{
+        "cameraId": "cam_1",
+        "start": 1,
+        "end": 2,
+        "frames": 2,
+        "count": 6,
+        "labels": {"person": 5, "dog": 1},
+        "boxes": {
+            "person": [[0.877, 0, 1, 1200, 3000], [0.877, 1, 2, 1200, 3000],
+                       [0.877, 0, 1, 1200, 3000], [0.877, 1, 2, 1200, 3000],
+                       [0.877, 2, 3, 1200, 3000]],
+            "dog": [[0.877, 0, 1, 1200, 3000]],
+        },
+    }]
+
+    aggregator.window = 0
+    aggregator.flush(expired_only=True)
+    assert [m["cameraId"] for m in sender.messages] == ["cam_1", "cam_2"]
+    assert aggregator.get_metrics()["messages"] == 2
+
+
+def test_size_aware_flush():
+    sender = Sender()
+    aggregator = TelemetryAggregator(sender, window=60, max_message_size=2048)
+    for timestamp in range(100):
+        aggregator.add("cam_1", timestamp, make_detections(5))
+    aggregator.flush()
+    assert len(sender.messages) > 1
+    assert all(len(json.dumps(m)) <= 2048 for m in sender.messages)
+    assert sum(m["count"] for m in sender.messages) == 500
+    metrics = aggregator.get_metrics()
+    assert metrics["early_flushes"] == len(sender.messages) - 1
+    assert metrics["detections"] == 500
+
+
+
+def test_check_interval(monkeypatch):
+    sleeps = []
+
+    class Stop(Exception):
+        pass
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        raise Stop()
+
+    monkeypatch.setattr(telemetry.time, "sleep", fake_sleep)
+    aggregator = TelemetryAggregator(Sender())
+    for window in [0, -1, 0.5, 60]:
+        aggregator.window = window
+        with pytest.raises(Stop):
+            aggregator._TelemetryAggregator__run()
+    # A window of 0 does not spin, a long one is checked every second
+    assert sleeps == [0.1, 0.1, 0.5, 1]